@@ -1,7 +1,6 @@
-import os
+import os, tempfile, click
 from flask import Flask
 from flask_sqlalchemy import SQLAlchemy
-from flask_migrate import Migrate
 from flask_login import LoginManager
 from dotenv import load_dotenv
 from werkzeug.security import generate_password_hash
@@ -9,38 +8,123 @@ from werkzeug.security import generate_password_hash
 # Tải biến môi trường
 load_dotenv()
 
-# Khởi tạo Extension
+# Khởi tạo Extension (Flask-Migrate nạp trong create_app, chỉ khi chạy lệnh CLI)
 db = SQLAlchemy()
-migrate = Migrate()
 login = LoginManager()
 login.login_view = 'main.login'
 login.login_message = 'Vui lòng đăng nhập.'
 
+# --- CẤU HÌNH LƯU TRỮ VĨNH VIỄN (DISK) ---
+# Kiểm tra xem có ổ cứng gắn tại /var/data không (Render thường mount vào đây).
+# Chạy trong create_app, không chạy lúc import; chế độ lưu trữ được in bởi `flask init-db`
+def storage_config():
+    disk = os.environ.get('DATA_DISK', '/var/data')
+    if os.path.exists(disk):
+        # Lưu site.db, ảnh upload, file lưu trữ vào ổ cứng thuê
+        return {'PERSISTENT_DISK': True, 'SQLALCHEMY_DATABASE_URI': f'sqlite:///{disk}/site.db',
+                'UPLOAD_FOLDER': os.path.join(disk, 'uploads'), 'ARCHIVE_FOLDER': os.path.join(disk, 'archive')}
+    # Chạy local hoặc server không có disk (mất dữ liệu khi reset)
+    uri = os.environ.get('DATABASE_URL') or 'sqlite:///site.db'
+    if uri.startswith("postgres://"):
+        uri = uri.replace("postgres://", "postgresql://", 1)
+    root = os.path.abspath(os.path.dirname(__file__))
+    return {'PERSISTENT_DISK': False, 'SQLALCHEMY_DATABASE_URI': uri,
+            'UPLOAD_FOLDER': os.path.join(root, 'static/uploads'),
+            'ARCHIVE_FOLDER': os.environ.get('ARCHIVE_FOLDER') or os.path.join(os.path.dirname(root), 'archive')}
+
 class Config:
     SECRET_KEY = os.environ.get('SECRET_KEY') or 'dev-key-123456'
     
-    # --- CẤU HÌNH LƯU TRỮ VĨNH VIỄN (DISK) ---
-    # Kiểm tra xem có ổ cứng gắn tại /var/data không (Render thường mount vào đây)
-    if os.path.exists('/var/data'):
-        print(">>> PHÁT HIỆN Ổ CỨNG (/var/data). SỬ DỤNG DATABASE VĨNH VIỄN.")
-        # Lưu file site.db vào ổ cứng thuê
-        SQLALCHEMY_DATABASE_URI = 'sqlite:////var/data/site.db'
-        # Lưu ảnh upload vào ổ cứng thuê
-        UPLOAD_FOLDER = '/var/data/uploads'
-    else:
-        print(">>> KHÔNG THẤY Ổ CỨNG. CHẠY CHẾ ĐỘ TẠM THỜI (MẤT DỮ LIỆU KHI RESET).")
-        # Chạy local hoặc server không có disk
-        uri = os.environ.get('DATABASE_URL') or 'sqlite:///site.db'
-        if uri.startswith("postgres://"):
-            uri = uri.replace("postgres://", "postgresql://", 1)
-        SQLALCHEMY_DATABASE_URI = uri
-        UPLOAD_FOLDER = os.path.join(os.path.abspath(os.path.dirname(__file__)), 'static/uploads')
-        
     SQLALCHEMY_TRACK_MODIFICATIONS = False
 
-def create_app():
+    # AUTO_INIT_DB=0: create_app không đụng DB (không create_all, không kiểm tra Admin) -> worker khởi động nhanh.
+    # Khi đó chạy `flask init-db && flask db upgrade` 1 lần trong bước deploy (migration giả định bảng đã có)
+    AUTO_INIT_DB = os.environ.get('AUTO_INIT_DB', '1') == '1'
+
+    # --- CHAT BẤT ĐỒNG BỘ ---
+    # CHAT_ASYNC=1: POST chat trả job_id ngay, pool luồng nền chạy Assistant
+    CHAT_ASYNC = os.environ.get('CHAT_ASYNC', '0') == '1'
+    CHAT_WORKERS = int(os.environ.get('CHAT_WORKERS', 8))
+    # Long-poll trạng thái job tối đa N giây. 0 (mặc định): trình duyệt poll ngắn mỗi giây, không giữ
+    # worker gunicorn sync; gunicorn.conf.py đặt 20 khi worker là gthread/gevent
+    CHAT_POLL_WAIT = float(os.environ.get('CHAT_POLL_WAIT', 0))
+    # CHAT_STREAM=1: trang chat dùng endpoint /stream (SSE) để hiện chữ ngay khi AI trả về
+    CHAT_STREAM = os.environ.get('CHAT_STREAM', '0') == '1'
+
+    # Số tin nhắn tải mỗi lần trên trang chat (cuộn lên để tải thêm)
+    CHAT_PAGE_SIZE = int(os.environ.get('CHAT_PAGE_SIZE', 30))
+
+    # --- OPENAI: client dùng chung, poll có backoff ---
+    OPENAI_TIMEOUT = float(os.environ.get('OPENAI_TIMEOUT', 30))
+    MAX_INFLIGHT_RUNS = int(os.environ.get('MAX_INFLIGHT_RUNS', 32))  # số run đồng thời mỗi process
+    RUN_DEADLINE = float(os.environ.get('RUN_DEADLINE', 90))          # giây, quá hạn thì hủy run
+    POLL_INITIAL = 0.3
+    POLL_FACTOR = 1.6
+    POLL_MAX = 2.0
+
+    # --- SQLITE PRODUCTION (WAL, busy_timeout, pool) ---
+    SQLITE_TUNED = os.environ.get('SQLITE_TUNED', '1') == '1'
+    SQLITE_BUSY_TIMEOUT_MS = int(os.environ.get('SQLITE_BUSY_TIMEOUT_MS', 5000))
+    SQLITE_MMAP_SIZE = int(os.environ.get('SQLITE_MMAP_SIZE', 256 * 1024 * 1024))
+    SQLITE_POOL_SIZE = int(os.environ.get('SQLITE_POOL_SIZE', 5))
+    # SQLITE_WRITE_BEHIND=1: ghi lượt chat qua luồng ghi riêng, gom nhiều lượt / 1 transaction
+    SQLITE_WRITE_BEHIND = os.environ.get('SQLITE_WRITE_BEHIND', '0') == '1'
+    WRITE_BEHIND_DELAY = float(os.environ.get('WRITE_BEHIND_DELAY', 0.02))
+    # TRANSCRIPT_BATCH=1: gom lượt chat của nhiều user vào 1 transaction (mỗi TRANSCRIPT_BATCH_DELAY giây),
+    # request chờ lô commit xong mới trả lời (group commit, không mất lượt khi process chết)
+    TRANSCRIPT_BATCH = os.environ.get('TRANSCRIPT_BATCH', '0') == '1'
+    TRANSCRIPT_BATCH_DELAY = float(os.environ.get('TRANSCRIPT_BATCH_DELAY', 0.005))
+
+    # Gửi file upload qua X-Sendfile khi chạy sau nginx/apache (USE_X_SENDFILE=1)
+    USE_X_SENDFILE = os.environ.get('USE_X_SENDFILE', '0') == '1'
+
+    # Cache user cho user_loader
+    USER_CACHE_SIZE = int(os.environ.get('USER_CACHE_SIZE', 10000))
+    USER_CACHE_TTL = float(os.environ.get('USER_CACHE_TTL', 60))
+
+    # Số process băm mật khẩu khi nhập CSV (mặc định = số CPU)
+    IMPORT_HASH_WORKERS = int(os.environ['IMPORT_HASH_WORKERS']) if os.environ.get('IMPORT_HASH_WORKERS') else None
+
+    # Tổng hợp LOG_DATA: 'insert' (cập nhật ngay khi lưu) hoặc 'compaction' (`flask analytics compact`)
+    ROLLUP_MODE = os.environ.get('ROLLUP_MODE', 'insert')
+
+    # Xóa hàng loạt: số user mỗi nhóm, số dòng mỗi transaction, nghỉ giữa các lô (giây)
+    PURGE_USER_CHUNK = int(os.environ.get('PURGE_USER_CHUNK', 200))
+    PURGE_ROW_BATCH = int(os.environ.get('PURGE_ROW_BATCH', 5000))
+    PURGE_PAUSE = float(os.environ.get('PURGE_PAUSE', 0.01))
+
+    # Lưu trữ: phiên không hoạt động quá N ngày được chuyển ra file nén (`flask archive run`)
+    ARCHIVE_AFTER_DAYS = int(os.environ.get('ARCHIVE_AFTER_DAYS', 180))
+
+    # Đo đạc request/SQL/pha chat (/admin/metrics). SLOW_REQUEST_MS > 0: in log request chậm
+    METRICS_ENABLED = os.environ.get('METRICS_ENABLED', '1') == '1'
+    METRICS_TOKEN = os.environ.get('METRICS_TOKEN')  # cho Prometheus: Authorization: Bearer <token>
+    SLOW_REQUEST_MS = int(os.environ.get('SLOW_REQUEST_MS', 0))
+
+    # Cache câu trả lời GOFAI cho câu hỏi trùng (GOFAI_CACHE=1), TTL tính bằng giây
+    GOFAI_CACHE = os.environ.get('GOFAI_CACHE', '0') == '1'
+    GOFAI_CACHE_SIZE = int(os.environ.get('GOFAI_CACHE_SIZE', 2000))
+    GOFAI_CACHE_TTL = float(os.environ.get('GOFAI_CACHE_TTL', 86400))
+
+    # Kiểm soát lượt chat: 1 lượt/user, token bucket theo user + toàn hệ thống, hàng đợi công bằng.
+    # Mặc định tắt (giữ hành vi cũ); bật bằng ADMISSION_ENABLED=1.
+    # ADMISSION_BACKEND=sqlite: chia sẻ giới hạn giữa các worker gunicorn qua 1 file SQLite riêng
+    ADMISSION_ENABLED = os.environ.get('ADMISSION_ENABLED', '0') == '1'
+    ADMISSION_BACKEND = os.environ.get('ADMISSION_BACKEND', 'memory')
+    ADMISSION_SQLITE_PATH = os.environ.get('ADMISSION_SQLITE_PATH') or os.path.join(tempfile.gettempdir(), 'chatbot_admission.db')
+    USER_RATE_PER_MIN = float(os.environ.get('USER_RATE_PER_MIN', 10))
+    USER_BURST = float(os.environ.get('USER_BURST', 3))
+    GLOBAL_RATE_PER_SEC = float(os.environ.get('GLOBAL_RATE_PER_SEC', 20))
+    GLOBAL_BURST = float(os.environ.get('GLOBAL_BURST', 60))
+    QUEUE_TIMEOUT = float(os.environ.get('QUEUE_TIMEOUT', 20))   # giây chờ chỗ chạy tối đa
+    QUEUE_MAX = int(os.environ.get('QUEUE_MAX', 200))
+
+def create_app(test_config=None):
     app = Flask(__name__)
     app.config.from_object(Config)
+    app.config.update(storage_config())
+    # Ghi đè cấu hình (bench/test): create_app({'SQLALCHEMY_DATABASE_URI': ...})
+    if test_config: app.config.update(test_config)
 
     # Tạo thư mục upload (dù ở local hay trong disk)
     if not os.path.exists(app.config['UPLOAD_FOLDER']):
@@ -49,34 +133,63 @@ def create_app():
         except Exception as e:
             print(f"Lỗi tạo thư mục upload: {e}")
 
+    from app.sqlite_tuning import configure_sqlite, init_sqlite
+    configure_sqlite(app)
     db.init_app(app)
-    migrate.init_app(app, db)
+    init_sqlite(app)
+    # Flask-Migrate kéo theo alembic (~0.15s import): worker web không cần, chỉ nạp cho lệnh `flask ...`
+    if click.get_current_context(silent=True) is not None:
+        from flask_migrate import Migrate
+        Migrate(app, db)
+
+    from app.metrics import init_metrics
+    with app.app_context(): init_metrics(app, db.engine)
     login.init_app(app)
 
-    # Đăng ký User Loader
-    from app.models import User
+    from app.write_queue import init_write_queue
+    init_write_queue(app)
+
+    from app.assistant import init_assistant
+    init_assistant(app)
+    from app.response_cache import init_response_cache
+    init_response_cache(app)
+    from app.admission import init_admission
+    init_admission(app)
+
+    from app.commands import register_commands
+    register_commands(app)
+
+    # Đăng ký User Loader (có cache trong process, xem app/user_cache.py)
+    from app.user_cache import user_cache, init_user_cache
+    init_user_cache(app)
     @login.user_loader
     def load_user(user_id):
-        return User.query.get(int(user_id))
+        return user_cache.load(int(user_id))
     
-    # Tự động tạo bảng và Admin nếu chưa có
-    with app.app_context():
-        db.create_all()
-        
-        # Chỉ tạo Admin nếu chưa tồn tại
-        if not User.query.filter_by(username='admin').first():
-            print(">>> Tạo tài khoản Admin mặc định...")
-            try:
-                admin = User(username='admin', bot_type='gofai', is_admin=True)
-                # Dùng generate_password_hash thay vì set_password nếu model chưa có method
-                admin.password_hash = generate_password_hash('123456')
-                db.session.add(admin)
-                db.session.commit()
-                print(">>> Đã tạo Admin: admin / 123456")
-            except Exception as e:
-                print(f">>> Lỗi tạo Admin: {e}")
+    # Tự động tạo bảng và Admin nếu chưa có (tắt bằng AUTO_INIT_DB=0)
+    if app.config['AUTO_INIT_DB']:
+        with app.app_context(): init_database()
 
     from app.routes import main as main_blueprint
     app.register_blueprint(main_blueprint)
 
     return app
+
+def init_database():
+    # Tạo bảng còn thiếu + Admin mặc định. Gọi trong app context (create_app hoặc `flask init-db`)
+    from app.models import User
+    db.create_all()
+
+    # Chỉ tạo Admin nếu chưa tồn tại
+    if not User.query.filter_by(username='admin').first():
+        print(">>> Tạo tài khoản Admin mặc định...")
+        try:
+            admin = User(username='admin', bot_type='gofai', is_admin=True)
+            # Dùng generate_password_hash thay vì set_password nếu model chưa có method
+            admin.password_hash = generate_password_hash('123456')
+            db.session.add(admin)
+            db.session.commit()
+            print(">>> Đã tạo Admin: admin / 123456")
+        except Exception as e:
+            db.session.rollback()  # vd. worker khác vừa tạo cùng lúc (gunicorn không preload)
+            print(f">>> Lỗi tạo Admin: {e}")
@@ -0,0 +1,95 @@
+from . import db
+from .models import User, Message, VariableLog, ChatSession
+from .history import decode_cursor, make_cursor
+from .archive import archived_sessions, read_session
+from sqlalchemy import func, or_, and_
+
+# --- DỮ LIỆU ADMIN: PHÂN TRANG / SẮP XẾP / TÌM THEO TIỀN TỐ ---
+# Tìm tiền tố dùng khoảng [p, p + '\uffff') để dùng được index (LIKE 'p%' thì không).
+# Lịch sử/log đọc cả tầng nóng (bảng) lẫn phiên đã lưu trữ (file nén).
+
+MAX_PER_PAGE = 200
+USER_SORTS = {'username': User.username, 'bot_type': User.bot_type, 'id': User.id}
+
+def prefix_filter(col, prefix):
+    return and_(col >= prefix, col < prefix + '\uffff')
+
+def page_args(args, default=50):
+    page = max(1, args.get('page', 1, type=int))
+    per_page = max(1, min(args.get('per_page', default, type=int), MAX_PER_PAGE))
+    return page, per_page
+
+def user_page(args):
+    page, per_page = page_args(args)
+    q = User.query.filter_by(is_admin=False)
+    if args.get('q'): q = q.filter(prefix_filter(User.username, args['q'].strip()))
+    if args.get('bot_type') in ('ai', 'gofai'): q = q.filter(User.bot_type == args['bot_type'])
+
+    col = USER_SORTS.get(args.get('sort'), User.id)
+    order = col.desc() if args.get('dir') == 'desc' else col.asc()
+    total = q.order_by(None).count()
+    users = q.order_by(order, User.id.asc()).offset((page - 1) * per_page).limit(per_page).all()
+
+    # Số tin nhắn/log lấy từ bộ đếm đã duy trì trong chat_session, chỉ cho user của trang này
+    ids = [u.id for u in users]
+    counts = {}
+    if ids:
+        counts = {uid: (m or 0, l or 0) for uid, m, l in db.session.query(
+            ChatSession.user_id, func.sum(ChatSession.message_count), func.sum(ChatSession.log_count))
+            .filter(ChatSession.user_id.in_(ids)).group_by(ChatSession.user_id)}
+    items = [{'id': u.id, 'username': u.username, 'bot_type': u.bot_type, 'active': bool(u.current_session_id),
+              'messages': counts.get(u.id, (0, 0))[0], 'logs': counts.get(u.id, (0, 0))[1]} for u in users]
+    return {'items': items, 'total': total, 'page': page, 'per_page': per_page, 'pages': (total + per_page - 1) // per_page}
+
+def merge_archived(rows, user_id, kind, cur, limit, session_prefix=None, name_prefix=None):
+    # Trộn tầng lưu trữ vào kết quả tầng nóng. rows: [(timestamp, id, item)] mới nhất trước.
+    # Chỉ đọc phiên lưu trữ có thể còn dòng mới hơn dòng thứ `limit` hiện có.
+    q = archived_sessions(user_id)
+    if session_prefix: q = q.filter(prefix_filter(ChatSession.id, session_prefix))
+    if cur: q = q.filter(or_(ChatSession.created_at.is_(None), ChatSession.created_at <= cur[0]))
+    for s in q.order_by(ChatSession.last_activity.desc()):
+        if len(rows) >= limit and s.last_activity and s.last_activity < rows[limit - 1][0]: break
+        for r in read_session(s)[kind]:
+            if r['ts'] is None or (cur and (r['ts'], r['id']) >= cur): continue
+            if name_prefix and not r['name'].startswith(name_prefix): continue
+            rows.append((r['ts'], r['id'], dict(r, session_id=s.id)))
+        rows.sort(key=lambda x: (x[0], x[1]), reverse=True)
+        del rows[limit:]
+    return rows
+
+def history_page(user_id, args):
+    # Keyset theo (timestamp, id), mới nhất trước; ?session=<tiền tố>&before=<cursor>
+    _, per_page = page_args(args, default=100)
+    q = Message.query.filter_by(user_id=user_id)
+    if args.get('session'): q = q.filter(prefix_filter(Message.session_id, args['session'].strip()))
+    cur = decode_cursor(args.get('before')) if args.get('before') else None
+    if cur:
+        ts, mid = cur
+        q = q.filter(or_(Message.timestamp < ts, and_(Message.timestamp == ts, Message.id < mid)))
+    rows = [(m.timestamp, m.id, {'sender': m.sender, 'content': m.content, 'session_id': m.session_id})
+            for m in q.order_by(Message.timestamp.desc(), Message.id.desc()).limit(per_page + 1)]
+    rows = merge_archived(rows, user_id, 'm', cur, per_page + 1, (args.get('session') or '').strip())
+    more = len(rows) > per_page
+    rows = rows[:per_page]
+    return {'items': [{'id': mid, 'sender': m['sender'], 'content': m['content'], 'session_id': m['session_id'],
+                       'timestamp': ts.strftime('%H:%M:%S %d/%m') if ts else ''} for ts, mid, m in rows],
+            'next_cursor': make_cursor(*rows[-1][:2]) if more and rows else None}
+
+def log_page(user_id, args):
+    # ?q=<tiền tố tên biến>&session=<tiền tố>&before=<cursor>
+    _, per_page = page_args(args, default=100)
+    q = VariableLog.query.filter_by(user_id=user_id)
+    if args.get('q'): q = q.filter(prefix_filter(VariableLog.variable_name, args['q'].strip()))
+    if args.get('session'): q = q.filter(prefix_filter(VariableLog.session_id, args['session'].strip()))
+    cur = decode_cursor(args.get('before')) if args.get('before') else None
+    if cur:
+        ts, lid = cur
+        q = q.filter(or_(VariableLog.timestamp < ts, and_(VariableLog.timestamp == ts, VariableLog.id < lid)))
+    rows = [(l.timestamp, l.id, {'session_id': l.session_id, 'name': l.variable_name, 'value': l.variable_value})
+            for l in q.order_by(VariableLog.timestamp.desc(), VariableLog.id.desc()).limit(per_page + 1)]
+    rows = merge_archived(rows, user_id, 'l', cur, per_page + 1, (args.get('session') or '').strip(), (args.get('q') or '').strip())
+    more = len(rows) > per_page
+    rows = rows[:per_page]
+    return {'items': [{'id': lid, 'session_id': l['session_id'], 'name': l['name'], 'value': l['value'],
+                       'timestamp': ts.strftime('%Y-%m-%d %H:%M:%S') if ts else ''} for ts, lid, l in rows],
+            'next_cursor': make_cursor(*rows[-1][:2]) if more and rows else None}
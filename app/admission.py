@@ -0,0 +1,218 @@
+from flask import current_app
+from .metrics import span
+import heapq, itertools, os, sqlite3, threading, time
+
+# --- KIỂM SOÁT LƯỢT CHAT (trước khi gọi Assistant) ---
+# 1. Mỗi user chỉ 1 lượt đang chạy (thread OpenAI không nhận run mới khi run cũ chưa xong)
+# 2. Token bucket theo user và toàn hệ thống
+# 3. Hàng đợi công bằng cho chỗ chạy: hết chỗ thì chờ, user được phục vụ nhiều gần đây xếp sau
+#    (start-time fair queuing), quá QUEUE_TIMEOUT thì báo bận
+# CHAT_ASYNC: bỏ qua mục 3 (request trả job_id ngay, pool job nền là hàng đợi), quá CHAT_WORKERS +
+# QUEUE_MAX job đang chờ thì báo bận.
+# Mục 1-2 dùng backend 'memory' (trong process) hoặc 'sqlite' (file dùng chung giữa các worker
+# gunicorn, ADMISSION_SQLITE_PATH). Hàng đợi (3) luôn nằm trong process, cùng giới hạn với run_slot.
+
+class Rejected(Exception):
+    def __init__(self, reason, retry_after=None):
+        super().__init__(reason)
+        self.reason, self.retry_after = reason, retry_after
+
+# --- BACKEND ---
+class MemoryBackend:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.inflight = {}  # key -> (owner, started)
+        self.buckets = {}   # key -> (tokens, updated)
+
+    def acquire_inflight(self, key, owner, ttl):
+        now = time.time()
+        with self.lock:
+            cur = self.inflight.get(key)
+            if cur and now - cur[1] < ttl: return False
+            self.inflight[key] = (owner, now)
+            return True
+
+    def release_inflight(self, key, owner):
+        with self.lock:
+            if self.inflight.get(key, (None,))[0] == owner: del self.inflight[key]
+
+    def take_token(self, key, rate, burst):
+        # -> None nếu lấy được, ngược lại số giây nên chờ
+        now = time.time()
+        with self.lock:
+            tokens, updated = self.buckets.get(key, (burst, now))
+            tokens = min(burst, tokens + (now - updated) * rate)
+            if tokens >= 1:
+                self.buckets[key] = (tokens - 1, now)
+                return None
+            self.buckets[key] = (tokens, now)
+            return (1 - tokens) / rate
+
+    def refund_token(self, key, burst):
+        # Trả lại token của lượt bị từ chối ở bước sau
+        with self.lock:
+            if key in self.buckets:
+                tokens, updated = self.buckets[key]
+                self.buckets[key] = (min(burst, tokens + 1), updated)
+
+class SQLiteBackend:
+    # Mỗi thao tác là 1 câu lệnh nguyên tử (UPSERT ... WHERE) trên file SQLite riêng,
+    # không tranh khóa ghi với DB chính
+    SCHEMA = ("CREATE TABLE IF NOT EXISTS inflight (key TEXT PRIMARY KEY, owner TEXT, started REAL)",
+              "CREATE TABLE IF NOT EXISTS bucket (key TEXT PRIMARY KEY, tokens REAL, updated REAL)")
+
+    def __init__(self, path):
+        self.path = path
+        self.local = threading.local()
+        with self._conn() as conn:
+            for sql in self.SCHEMA: conn.execute(sql)
+
+    def _conn(self):
+        conn = getattr(self.local, 'conn', None)
+        if conn is None or getattr(self.local, 'pid', None) != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self.local.conn, self.local.pid = conn, os.getpid()
+        return conn
+
+    def acquire_inflight(self, key, owner, ttl):
+        now = time.time()
+        cur = self._conn().execute(
+            "INSERT INTO inflight (key, owner, started) VALUES (?, ?, ?) ON CONFLICT(key) DO UPDATE SET "
+            "owner = excluded.owner, started = excluded.started WHERE inflight.started < ?", (key, owner, now, now - ttl))
+        return cur.rowcount == 1
+
+    def release_inflight(self, key, owner):
+        self._conn().execute("DELETE FROM inflight WHERE key = ? AND owner = ?", (key, owner))
+
+    def take_token(self, key, rate, burst):
+        now = time.time()
+        conn = self._conn()
+        cur = conn.execute(
+            "INSERT INTO bucket (key, tokens, updated) VALUES (:k, :burst - 1, :now) ON CONFLICT(key) DO UPDATE SET "
+            "tokens = min(:burst, tokens + (:now - updated) * :rate) - 1, updated = :now "
+            "WHERE min(:burst, tokens + (:now - updated) * :rate) >= 1",
+            {'k': key, 'burst': burst, 'now': now, 'rate': rate})
+        if cur.rowcount == 1: return None
+        row = conn.execute("SELECT min(?, tokens + (? - updated) * ?) FROM bucket WHERE key = ?", (burst, now, rate, key)).fetchone()
+        return (1 - (row[0] if row else 0)) / rate
+
+    def refund_token(self, key, burst):
+        self._conn().execute("UPDATE bucket SET tokens = min(?, tokens + 1) WHERE key = ?", (burst, key))
+
+# --- HÀNG ĐỢI CÔNG BẰNG ---
+class FairQueue:
+    # Start-time fair queuing: mỗi user có "thời gian ảo"; người vừa được phục vụ nhiều thì tag lớn,
+    # chỗ trống được trao cho tag nhỏ nhất. Không ai phải chờ quá timeout.
+    def __init__(self, slots):
+        self.slots, self.busy = slots, 0
+        self.cond = threading.Condition()
+        self.heap, self.seq = [], itertools.count()
+        self.vtime, self.finish = 0.0, {}  # user -> tag kết thúc lần gần nhất
+        self.max_depth = 0
+
+    def depth(self):
+        with self.cond: return len(self.heap)
+
+    def acquire(self, user, timeout, max_depth):
+        with self.cond:
+            if self.busy < self.slots and not self.heap:
+                self._grant(user)
+                return True
+            if len(self.heap) >= max_depth: return False
+            tag = max(self.vtime, self.finish.get(user, 0.0))
+            entry = [tag, next(self.seq), user, False]
+            heapq.heappush(self.heap, entry)
+            self.max_depth = max(self.max_depth, len(self.heap))
+            deadline = time.monotonic() + timeout
+            while not entry[3]:
+                left = deadline - time.monotonic()
+                if left <= 0:
+                    self.heap.remove(entry); heapq.heapify(self.heap)
+                    return False
+                self.cond.wait(left)
+            return True
+
+    def _grant(self, user):
+        self.busy += 1
+        start = max(self.vtime, self.finish.get(user, 0.0))
+        self.finish[user] = start + 1
+        if len(self.finish) > 10000: self.finish = {u: t for u, t in self.finish.items() if t > self.vtime}
+
+    def release(self):
+        with self.cond:
+            self.busy -= 1
+            while self.heap and self.busy < self.slots:
+                entry = heapq.heappop(self.heap)
+                self.vtime = max(self.vtime, entry[0])
+                self._grant(entry[2])
+                entry[3] = True
+            self.cond.notify_all()
+
+# --- ĐIỂM VÀO ---
+class Admission:
+    def __init__(self, app):
+        cfg = app.config
+        self.cfg = cfg
+        self.backend = SQLiteBackend(cfg['ADMISSION_SQLITE_PATH']) if cfg['ADMISSION_BACKEND'] == 'sqlite' else MemoryBackend()
+        self.queue = FairQueue(cfg['MAX_INFLIGHT_RUNS'])
+        self.lock = threading.Lock()
+        self.stats = {'admitted': 0, 'rejected_inflight': 0, 'rejected_user_rate': 0, 'rejected_global_rate': 0,
+                      'rejected_queue_full': 0, 'queue_timeouts': 0, 'queued': 0}
+
+    def _count(self, key):
+        with self.lock: self.stats[key] += 1
+
+    def enter(self, user_id, backlog=None):
+        # -> ticket để gọi leave(); lỗi Rejected nếu không được nhận.
+        # backlog (CHAT_ASYNC): số job nền đang chờ/chạy; pool job nền là hàng đợi, không chờ ở đây
+        cfg = self.cfg
+        key, owner = f"user:{user_id}", f"{os.getpid()}:{threading.get_ident()}:{time.monotonic()}"
+        if not self.backend.acquire_inflight(key, owner, cfg['RUN_DEADLINE'] + 30):
+            self._count('rejected_inflight'); raise Rejected('inflight')
+        taken = []  # token đã lấy: bị từ chối ở bước sau (hệ thống bận) thì trả lại, user không bị trừ lượt
+        try:
+            wait = self.backend.take_token(key, cfg['USER_RATE_PER_MIN'] / 60.0, cfg['USER_BURST'])
+            if wait is not None:
+                self._count('rejected_user_rate'); raise Rejected('user_rate', wait)
+            taken.append((key, cfg['USER_BURST']))
+            wait = self.backend.take_token('global', cfg['GLOBAL_RATE_PER_SEC'], cfg['GLOBAL_BURST'])
+            if wait is not None:
+                self._count('rejected_global_rate'); raise Rejected('global_rate', wait)
+            taken.append(('global', cfg['GLOBAL_BURST']))
+            if backlog is not None:
+                if backlog >= cfg['CHAT_WORKERS'] + cfg['QUEUE_MAX']:
+                    self._count('rejected_queue_full'); raise Rejected('queue')
+                self._count('admitted')
+                return key, owner, False
+            queued = self.queue.depth() > 0 or self.queue.busy >= self.queue.slots
+            with span('admission_wait'):
+                ok = self.queue.acquire(user_id, cfg['QUEUE_TIMEOUT'], cfg['QUEUE_MAX'])
+            if queued: self._count('queued')
+            if not ok:
+                full = self.queue.depth() >= cfg['QUEUE_MAX']
+                self._count('rejected_queue_full' if full else 'queue_timeouts')
+                raise Rejected('queue')
+        except Exception:
+            for k, burst in taken: self.backend.refund_token(k, burst)
+            self.backend.release_inflight(key, owner)
+            raise
+        self._count('admitted')
+        return key, owner, True
+
+    def leave(self, ticket):
+        key, owner, in_queue = ticket
+        if in_queue: self.queue.release()
+        self.backend.release_inflight(key, owner)
+
+    def get_stats(self):
+        with self.lock: s = dict(self.stats)
+        s.update(queue_depth=self.queue.depth(), queue_max_depth=self.queue.max_depth, running=self.queue.busy)
+        return s
+
+def init_admission(app):
+    app.extensions['admission'] = Admission(app) if app.config.get('ADMISSION_ENABLED') else None
+
+def get_admission():
+    return current_app.extensions.get('admission')
@@ -0,0 +1,162 @@
+from flask import current_app
+from . import db
+from .models import User, VariableLog, VariableRollup, AnalyticsState
+from sqlalchemy import func, case, distinct
+import math
+
+# --- TỔNG HỢP ĐIỂM / BIẾN (ROLLUP) ---
+# Mỗi VariableLog được gộp vào 1 dòng VariableRollup theo (user, phiên, biến, ngày):
+# số lần ghi, tổng/min/max phần giá trị là số, giá trị cuối. Trang admin đọc
+# bảng rollup (nhỏ) thay vì quét toàn bộ log thô.
+# ROLLUP_MODE = 'insert': cập nhật ngay khi lưu lượt chat
+#             = 'compaction': chạy định kỳ `flask analytics compact` (theo mốc id)
+# Sau khi tạo bảng hoặc đổi chế độ: chạy `flask analytics rebuild` một lần.
+
+COMPACT_BATCH = 50000
+
+def parse_number(v):
+    try:
+        x = float(str(v).strip().replace(',', '.'))
+    except (TypeError, ValueError):
+        return None
+    return x if math.isfinite(x) else None
+
+def accumulate(acc, user_id, session_id, name, value, ts):
+    key = (user_id, session_id or '', str(name)[:100], ts.date())
+    a = acc.get(key)
+    if a is None:
+        a = acc[key] = {'n': 0, 'n_numeric': 0, 'total': 0.0, 'min_value': None, 'max_value': None,
+                        'last_value': None, 'last_numeric': None, 'last_at': None}
+    a['n'] += 1
+    x = parse_number(value)
+    if x is not None:
+        a['n_numeric'] += 1
+        a['total'] += x
+        a['min_value'] = x if a['min_value'] is None else min(a['min_value'], x)
+        a['max_value'] = x if a['max_value'] is None else max(a['max_value'], x)
+    if a['last_at'] is None or ts >= a['last_at']:
+        a['last_value'], a['last_at'] = str(value), ts
+        if x is not None: a['last_numeric'] = x
+
+def dialect_insert():
+    if db.session.get_bind().dialect.name == 'postgresql':
+        from sqlalchemy.dialects.postgresql import insert
+    else:
+        from sqlalchemy.dialects.sqlite import insert
+    return insert
+
+def upsert_rollups(acc):
+    if not acc: return
+    t = VariableRollup.__table__
+    rows = [dict(zip(('user_id', 'session_id', 'variable_name', 'day'), k), **v) for k, v in acc.items()]
+    stmt = dialect_insert()(t)
+    ex = stmt.excluded
+    newer = (t.c.last_at.is_(None)) | (ex.last_at >= t.c.last_at)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[t.c.user_id, t.c.session_id, t.c.variable_name, t.c.day],
+        set_={
+            'n': t.c.n + ex.n,
+            'n_numeric': t.c.n_numeric + ex.n_numeric,
+            'total': t.c.total + ex.total,
+            'min_value': case((ex.min_value.is_(None), t.c.min_value), (t.c.min_value.is_(None), ex.min_value),
+                              (ex.min_value < t.c.min_value, ex.min_value), else_=t.c.min_value),
+            'max_value': case((ex.max_value.is_(None), t.c.max_value), (t.c.max_value.is_(None), ex.max_value),
+                              (ex.max_value > t.c.max_value, ex.max_value), else_=t.c.max_value),
+            'last_value': case((newer, ex.last_value), else_=t.c.last_value),
+            'last_numeric': case((newer & ex.last_numeric.isnot(None), ex.last_numeric), else_=t.c.last_numeric),
+            'last_at': case((newer, ex.last_at), else_=t.c.last_at),
+        })
+    for i in range(0, len(rows), 500):
+        db.session.execute(stmt, rows[i:i + 500])
+
+def record_variables(user_id, session_id, data, ts):
+    # Gọi khi lưu lượt chat (ROLLUP_MODE='insert'), cùng transaction với VariableLog
+    if current_app.config.get('ROLLUP_MODE') != 'insert' or not data: return
+    acc = {}
+    for k, v in data.items(): accumulate(acc, user_id, session_id, k, v, ts)
+    upsert_rollups(acc)
+
+# --- COMPACTION (theo mốc VariableLog.id) ---
+def compact(batch=COMPACT_BATCH, limit=None):
+    state = db.session.get(AnalyticsState, 'variable_log') or AnalyticsState(key='variable_log', last_id=0)
+    db.session.add(state)
+    done = 0
+    while limit is None or done < limit:
+        rows = db.session.query(VariableLog.id, VariableLog.user_id, VariableLog.session_id, VariableLog.variable_name,
+                                VariableLog.variable_value, VariableLog.timestamp) \
+            .filter(VariableLog.id > state.last_id).order_by(VariableLog.id).limit(batch).all()
+        if not rows: break
+        acc = {}
+        for _id, uid, sid, name, value, ts in rows:
+            if ts is not None and name is not None: accumulate(acc, uid, sid, name, value, ts)
+        upsert_rollups(acc)
+        state.last_id = rows[-1][0]
+        db.session.commit()  # transaction ngắn mỗi lô
+        done += len(rows)
+    db.session.commit()
+    return done
+
+def rebuild():
+    from .archive import iter_archived_logs
+    VariableRollup.query.delete()
+    AnalyticsState.query.filter_by(key='variable_log').delete()
+    # Log của phiên đã lưu trữ không còn trong variable_log: đọc lại từ file lưu trữ
+    acc, n = {}, 0
+    for uid, sid, name, value, ts in iter_archived_logs():
+        if ts is None or name is None: continue
+        accumulate(acc, uid, sid, name, value, ts); n += 1
+        if len(acc) >= COMPACT_BATCH: upsert_rollups(acc); acc = {}
+    upsert_rollups(acc)
+    db.session.commit()
+    return n + compact()
+
+# --- TRUY VẤN TÓM TẮT ---
+def trend(points):
+    # Hệ số góc (điểm/ngày) của trung bình theo ngày, bình phương tối thiểu
+    pts = [(d.toordinal(), y) for d, y in points if y is not None]
+    if len(pts) < 2: return None
+    n = len(pts)
+    mx = sum(p[0] for p in pts) / n; my = sum(p[1] for p in pts) / n
+    var = sum((p[0] - mx) ** 2 for p in pts)
+    return round(sum((p[0] - mx) * (p[1] - my) for p in pts) / var, 4) if var else None
+
+def _summaries(daily, extra=None):
+    # daily: [(variable, day, n, n_numeric, total, min, max)] đã GROUP BY trong SQL
+    out = {}
+    for var, day, n, nn, total, lo, hi in daily:
+        s = out.setdefault(var, {'variable': var, 'count': 0, 'n_numeric': 0, 'total': 0.0, 'min': None, 'max': None, 'series': []})
+        s['count'] += n; s['n_numeric'] += nn or 0; s['total'] += total or 0
+        if lo is not None: s['min'] = lo if s['min'] is None else min(s['min'], lo)
+        if hi is not None: s['max'] = hi if s['max'] is None else max(s['max'], hi)
+        s['series'].append((day, (total / nn) if nn else None))
+    for var, s in out.items():
+        s['mean'] = round(s['total'] / s['n_numeric'], 4) if s['n_numeric'] else None
+        s['trend'] = trend(s['series'])
+        s['series'] = [{'day': d.isoformat(), 'mean': round(m, 4) if m is not None else None} for d, m in sorted(s['series'])]
+        del s['total']
+        if extra: s.update(extra.get(var, {}))
+    return sorted(out.values(), key=lambda s: s['variable'])
+
+def _daily_query(q):
+    R = VariableRollup
+    return q.with_entities(R.variable_name, R.day, func.sum(R.n), func.sum(R.n_numeric), func.sum(R.total),
+                           func.min(R.min_value), func.max(R.max_value)).group_by(R.variable_name, R.day).all()
+
+def student_summary(user_id, variable=None):
+    R = VariableRollup
+    q = R.query.filter(R.user_id == user_id)
+    if variable: q = q.filter(R.variable_name == variable)
+    latest = {}
+    for var, val, num, at in q.with_entities(R.variable_name, R.last_value, R.last_numeric, R.last_at).order_by(R.last_at.asc()):
+        latest[var] = {'latest': val, 'latest_numeric': num, 'latest_at': at.isoformat() if at else None}
+    return _summaries(_daily_query(q), latest)
+
+def class_summary(variable=None, bot_type=None, start=None, end=None):
+    R = VariableRollup
+    q = R.query
+    if bot_type: q = q.join(User, User.id == R.user_id).filter(User.bot_type == bot_type)
+    if variable: q = q.filter(R.variable_name == variable)
+    if start: q = q.filter(R.day >= start)
+    if end: q = q.filter(R.day <= end)
+    students = {v: {'students': n} for v, n in q.with_entities(R.variable_name, func.count(distinct(R.user_id))).group_by(R.variable_name)}
+    return _summaries(_daily_query(q), students)
@@ -0,0 +1,175 @@
+from flask import current_app
+from . import db
+from .models import User, Message, VariableLog, ChatSession
+from .assistant import get_vietnam_time
+from sqlalchemy import select, or_
+from datetime import datetime, timedelta
+from functools import lru_cache
+import gzip, json, os, struct
+
+try:
+    import fcntl  # khóa file khi ghi nối (Linux); Windows bỏ qua
+except ImportError:
+    fcntl = None
+
+# --- LƯU TRỮ PHIÊN CŨ (tầng lạnh) ---
+# Phiên không hoạt động quá ARCHIVE_AFTER_DAYS ngày được chuyển khỏi bảng message/variable_log
+# ra file <ARCHIVE_FOLDER>/<YYYY-MM>.jsonl.gz. Mỗi phiên là 1 gzip member ghi nối vào cuối file
+# (chỉ ghi thêm), vị trí member lưu trong chat_session nên đọc 1 phiên chỉ cần seek.
+# Dòng chat_session (bộ đếm, thống kê) vẫn giữ nguyên; variable_rollup không bị ảnh hưởng.
+# Xóa dữ liệu đã lưu trữ: member bị ghi đè tại chỗ bằng gzip rỗng cùng độ dài (scrub_member),
+# các member khác không dời vị trí và file vẫn đọc được bằng gzip thông thường.
+
+ARCHIVE_BATCH = 200
+
+def archive_path(name):
+    return os.path.join(current_app.config['ARCHIVE_FOLDER'], name)
+
+def _ts(v):
+    return v.isoformat() if v else None
+
+def append_member(name, records):
+    # Ghi 1 gzip member, fsync rồi mới cập nhật chỉ mục trong DB; trả về (offset, length)
+    data = gzip.compress(''.join(json.dumps(r, ensure_ascii=False) + '\n' for r in records).encode('utf-8'))
+    os.makedirs(current_app.config['ARCHIVE_FOLDER'], exist_ok=True)
+    with open(archive_path(name), 'ab') as f:
+        if fcntl: fcntl.flock(f, fcntl.LOCK_EX)
+        f.seek(0, os.SEEK_END)
+        offset = f.tell()
+        f.write(data)
+        f.flush(); os.fsync(f.fileno())
+    return offset, len(data)
+
+@lru_cache(maxsize=256)
+def _read_member(path, offset, length):
+    # Member chỉ bị ghi đè khi xóa (chỉ mục đã chuyển đi/bị xóa) nên cache theo vị trí là an toàn
+    with open(path, 'rb') as f:
+        f.seek(offset)
+        raw = gzip.decompress(f.read(length))
+    out = {'m': [], 'l': []}
+    for line in raw.decode('utf-8').splitlines():
+        r = json.loads(line)
+        r['ts'] = datetime.fromisoformat(r['ts']) if r.get('ts') else None
+        out[r.pop('k')].append(r)
+    return out
+
+def read_session(s):
+    # -> {'m': [tin nhắn], 'l': [log biến]} của 1 ChatSession đã lưu trữ
+    if not s.archive_file: return {'m': [], 'l': []}
+    return _read_member(archive_path(s.archive_file), s.archive_offset, s.archive_length)
+
+def blank_member(length):
+    # gzip member rỗng dài đúng `length` byte (>= 22): độn bằng trường FEXTRA của header
+    xlen = length - 22
+    return b'\x1f\x8b\x08\x04\x00\x00\x00\x00\x00\xff' + struct.pack('<H', xlen) + bytes(xlen) + b'\x03\x00' + bytes(8)
+
+def scrub_member(name, offset, length):
+    # Ghi đè 1 member bằng các gzip member rỗng cùng tổng độ dài (FEXTRA tối đa 65535 byte/member)
+    path = archive_path(name)
+    if length < 22 or not os.path.exists(path): return  # < 22 byte: member không chứa dữ liệu
+    parts, left = [], length
+    while left:
+        n = min(left, 22 + 0xffff)
+        if 0 < left - n < 22: n = left - 22
+        parts.append(blank_member(n)); left -= n
+    with open(path, 'r+b') as f:
+        if fcntl: fcntl.flock(f, fcntl.LOCK_EX)
+        f.seek(offset)
+        f.write(b''.join(parts))
+        f.flush(); os.fsync(f.fileno())
+    _read_member.cache_clear()
+
+def drop_archived_messages(s):
+    # Xóa tin nhắn của 1 phiên đã lưu trữ, giữ log biến: ghi member mới chỉ có log, chuyển chỉ mục, xóa member cũ
+    old, logs = (s.archive_file, s.archive_offset, s.archive_length), read_session(s)['l']
+    records = [{'k': 'l', 'id': r['id'], 'ts': _ts(r['ts']), 'name': r['name'], 'value': r['value']} for r in logs]
+    n = s.message_count or 0
+    s.archive_offset, s.archive_length = append_member(s.archive_file, records)
+    s.message_count = 0
+    db.session.commit()
+    scrub_member(*old)
+    return n
+
+def scrub_user_archives(user_ids):
+    # Trước khi xóa user: xóa dữ liệu lưu trữ của họ khỏi file (dòng chat_session bị xóa ngay sau đó).
+    # Chạy lại được: member đã xóa chỉ bị ghi đè thêm lần nữa
+    rows = db.session.query(ChatSession.archive_file, ChatSession.archive_offset, ChatSession.archive_length) \
+        .filter(ChatSession.user_id.in_(user_ids), ChatSession.archive_file.isnot(None)).all()
+    for r in rows: scrub_member(*r)
+    return len(rows)
+
+def archive_session(s):
+    msgs = Message.query.filter_by(user_id=s.user_id, session_id=s.id).order_by(Message.timestamp, Message.id).all()
+    logs = VariableLog.query.filter_by(user_id=s.user_id, session_id=s.id).order_by(VariableLog.timestamp, VariableLog.id).all()
+    records = [{'k': 'm', 'id': m.id, 'ts': _ts(m.timestamp), 'sender': m.sender, 'content': m.content} for m in msgs] + \
+              [{'k': 'l', 'id': l.id, 'ts': _ts(l.timestamp), 'name': l.variable_name, 'value': l.variable_value} for l in logs]
+    name = f"{(s.last_activity or datetime.utcnow()).strftime('%Y-%m')}.jsonl.gz"
+    s.archive_offset, s.archive_length = append_member(name, records)
+    s.archive_file = name
+    Message.query.filter_by(user_id=s.user_id, session_id=s.id).delete(synchronize_session=False)
+    VariableLog.query.filter_by(user_id=s.user_id, session_id=s.id).delete(synchronize_session=False)
+    return len(records)
+
+def archive_sessions(days=None, batch=ARCHIVE_BATCH, limit=None):
+    # Chạy tăng dần: mỗi lô 1 transaction; chạy lại bao nhiêu lần cũng được
+    days = current_app.config['ARCHIVE_AFTER_DAYS'] if days is None else days
+    if current_app.config.get('ROLLUP_MODE') == 'compaction':
+        from .analytics import compact
+        compact()  # gộp log vào rollup trước khi chúng rời bảng variable_log
+    cutoff = get_vietnam_time() - timedelta(days=days)
+    in_use = select(User.current_session_id).where(User.current_session_id.isnot(None))
+    sessions, rows = 0, 0
+    while limit is None or sessions < limit:
+        q = ChatSession.query.filter(ChatSession.archive_file.is_(None), ChatSession.last_activity < cutoff,
+                                     ChatSession.id.not_in(in_use)).order_by(ChatSession.last_activity)
+        part = q.limit(batch if limit is None else min(batch, limit - sessions)).all()
+        if not part: break
+        for s in part: rows += archive_session(s)
+        db.session.commit()
+        sessions += len(part)
+    return {'sessions': sessions, 'rows': rows}
+
+def archived_sessions(user_id=None):
+    q = ChatSession.query.filter(ChatSession.archive_file.isnot(None))
+    return q.filter(ChatSession.user_id == user_id) if user_id is not None else q
+
+def row_time(row):
+    # Khóa sắp xếp của tuple export: dòng không có thời gian xếp cuối (như ORDER BY ... DESC trong SQLite)
+    return row[0] or datetime.min
+
+def archived_rows(kind, f):
+    # Cho export CSV: cùng định dạng tuple với exports.message_rows / variable_log_rows, mới nhất trước.
+    # Phiên duyệt theo last_activity giảm dần; dòng của các phiên chồng thời gian được giữ lại
+    # tới khi không phiên nào sau còn có thể mới hơn (last_activity là mốc trên của mọi dòng trong phiên).
+    q = db.session.query(ChatSession, User.username).join(User, ChatSession.user_id == User.id) \
+        .filter(ChatSession.archive_file.isnot(None))
+    if 'user' in f: q = q.filter(User.username == f['user'])
+    if 'session' in f: q = q.filter(ChatSession.id == f['session'])
+    if 'start' in f: q = q.filter(ChatSession.last_activity >= f['start'])
+    if 'end' in f: q = q.filter(or_(ChatSession.created_at.is_(None), ChatSession.created_at < f['end']))
+    pending = []
+    for s, username in q.order_by(ChatSession.last_activity.desc()).yield_per(500):
+        if pending and s.last_activity:
+            pending.sort(key=row_time, reverse=True)
+            n = next((i for i, row in enumerate(pending) if row_time(row) < s.last_activity), len(pending))
+            yield from pending[:n]
+            del pending[:n]
+        for r in read_session(s)[kind]:
+            if ('start' in f or 'end' in f) and (r['ts'] is None or ('start' in f and r['ts'] < f['start'])
+                                                  or ('end' in f and r['ts'] >= f['end'])): continue
+            if kind == 'm': pending.append((r['ts'], s.id, username, r['sender'], r['content']))
+            else: pending.append((r['ts'], s.id, username, r['name'], r['value']))
+    pending.sort(key=row_time, reverse=True)
+    yield from pending
+
+def iter_archived_logs():
+    # (user_id, session_id, tên biến, giá trị, thời gian) - dùng khi tính lại rollup
+    for s in archived_sessions().yield_per(500):
+        for r in read_session(s)['l']:
+            yield s.user_id, s.id, r['name'], r['value'], r['ts']
+
+def archive_stats():
+    folder = current_app.config['ARCHIVE_FOLDER']
+    files = sorted(os.listdir(folder)) if os.path.isdir(folder) else []
+    return {'archived_sessions': archived_sessions().count(),
+            'files': {n: os.path.getsize(os.path.join(folder, n)) for n in files if n.endswith('.jsonl.gz')}}
@@ -0,0 +1,237 @@
+from flask import current_app
+from . import db
+from .models import User
+from sqlalchemy import select
+from .metrics import span
+from .response_cache import response_cache, cacheable, cache_key
+import time, json, os, random, threading
+from datetime import datetime, timedelta
+
+BUSY_MESSAGE = "Hệ thống đang bận, em thử lại sau ít giây nhé."
+
+class AssistantBusy(Exception):
+    # Vượt quá số run đang chạy cho phép (MAX_INFLIGHT_RUNS)
+    pass
+
+# --- HÀM HỖ TRỢ ---
+def get_vietnam_time():
+    return datetime.utcnow() + timedelta(hours=7)
+
+def get_assistant_id(bot_type):
+    return os.environ.get('CHATBOT_AI_ID') if bot_type == 'ai' else os.environ.get('CHATBOT_GOFAI_ID')
+
+# --- CLIENT OPENAI DÙNG CHUNG (tạo 1 lần, ở lượt gọi đầu tiên) ---
+# Gói openai import mất ~0.5s: không nạp trong create_app để worker khởi động nhanh
+def init_assistant(app):
+    ext = app.extensions
+    ext['assistant_slots'] = threading.BoundedSemaphore(app.config['MAX_INFLIGHT_RUNS'])
+    ext['openai_client'] = None
+    ext['openai_client_lock'] = threading.Lock()
+
+def make_client(app):
+    api_key = os.environ.get('OPENAI_API_KEY')
+    if not api_key: return None
+    import openai
+    kwargs = {'api_key': api_key, 'timeout': app.config['OPENAI_TIMEOUT']}
+    try:
+        # Giữ kết nối keep-alive, giới hạn số socket theo số run đồng thời
+        import httpx
+        n = app.config['MAX_INFLIGHT_RUNS']
+        kwargs['http_client'] = openai.DefaultHttpxClient(
+            limits=httpx.Limits(max_connections=n, max_keepalive_connections=n, keepalive_expiry=30))
+    except ImportError: pass
+    return openai.OpenAI(**kwargs)
+
+def get_client():
+    # Cho phép gắn client giả (test/bench) qua config OPENAI_CLIENT
+    client = current_app.config.get('OPENAI_CLIENT')
+    if client is not None: return client
+    ext = current_app.extensions
+    if ext['openai_client'] is None:
+        with ext['openai_client_lock']:
+            if ext['openai_client'] is None: ext['openai_client'] = make_client(current_app)
+    return ext['openai_client']
+
+def ensure_thread(client, turn):
+    thread_id = turn.thread_id
+    if not thread_id:
+        # Bản chụp trong cache user có thể cũ (thread tạo ở worker khác): đọc lại DB trước khi tạo mới
+        thread_id = db.session.scalar(select(User.current_thread_id).where(User.id == turn.user_id))
+        db.session.rollback()  # không giữ kết nối DB trong lúc chờ AI
+    if not thread_id:
+        thread_id = client.beta.threads.create().id
+        turn.set_thread(thread_id)  # ghi cùng lượt chat (app/transcript.py)
+    turn.thread_id = thread_id
+    return thread_id
+
+# --- THỐNG KÊ ---
+_stats_lock = threading.Lock()
+_stats = {'runs': 0, 'poll_iterations': 0, 'run_latency_total': 0.0, 'run_latency_max': 0.0, 'busy': 0, 'timeouts': 0, 'inflight': 0}
+
+def record_stat(**inc):
+    with _stats_lock:
+        for k, v in inc.items():
+            if k == 'run_latency_max': _stats[k] = max(_stats[k], v)
+            else: _stats[k] += v
+
+def get_stats():
+    with _stats_lock: s = dict(_stats)
+    s['avg_polls_per_run'] = round(s['poll_iterations'] / s['runs'], 2) if s['runs'] else 0
+    s['avg_run_latency'] = round(s['run_latency_total'] / s['runs'], 3) if s['runs'] else 0
+    return s
+
+class run_slot:
+    # Giữ 1 chỗ trong giới hạn run đồng thời, hết chỗ thì báo bận ngay thay vì xếp hàng socket
+    def __enter__(self):
+        self.sem = current_app.extensions['assistant_slots']
+        if not self.sem.acquire(blocking=False):
+            record_stat(busy=1)
+            raise AssistantBusy()
+        record_stat(inflight=1)
+        return self
+    def __exit__(self, *exc):
+        record_stat(inflight=-1)
+        self.sem.release()
+
+def poll_run(client, thread_id, run):
+    # Exponential backoff + jitter, có hạn chót tổng
+    cfg = current_app.config
+    start = time.monotonic()
+    deadline = start + cfg['RUN_DEADLINE']
+    delay, polls = cfg['POLL_INITIAL'], 0
+    while run.status in ['queued', 'in_progress']:
+        if time.monotonic() + delay > deadline:
+            record_stat(timeouts=1)
+            try: client.beta.threads.runs.cancel(thread_id=thread_id, run_id=run.id)
+            except Exception: pass
+            break
+        time.sleep(delay * random.uniform(0.5, 1.0))
+        polls += 1
+        run = client.beta.threads.runs.retrieve(thread_id=thread_id, run_id=run.id)
+        delay = min(delay * cfg['POLL_FACTOR'], cfg['POLL_MAX'])
+    elapsed = time.monotonic() - start
+    record_stat(runs=1, poll_iterations=polls, run_latency_total=elapsed, run_latency_max=elapsed)
+    return run
+
+# --- GỌI OPENAI ---
+def get_assistant_response(user_message, bot_type, turn):
+    client = get_client()
+    assistant_id = get_assistant_id(bot_type)
+    if client is None or not assistant_id: return "Lỗi: Chưa cấu hình API Key."
+
+    compute = lambda: run_assistant(client, assistant_id, user_message, turn)
+    if cacheable(bot_type, user_message):
+        key = cache_key(bot_type, assistant_id, user_message)
+        with span('response_cache'):
+            return response_cache.get_or_compute(key, bot_type, assistant_id, user_message, compute,
+                                                 current_app.config['RUN_DEADLINE'] + 5)
+    return compute()[0]
+
+def run_assistant(client, assistant_id, user_message, turn):
+    # 1 Assistants run; trả về (text, True nếu là câu trả lời thật -> được phép cache)
+    with run_slot():
+        try:
+            with span('thread'): thread_id = ensure_thread(client, turn)
+
+            with span('message_create'): client.beta.threads.messages.create(thread_id=thread_id, role="user", content=user_message)
+            with span('run_create'): run = client.beta.threads.runs.create(thread_id=thread_id, assistant_id=assistant_id)
+            with span('run_poll'): run = poll_run(client, thread_id, run)
+
+            if run.status == 'completed':
+                with span('messages_list'): msgs = client.beta.threads.messages.list(thread_id=thread_id, limit=1)
+                return msgs.data[0].content[0].text.value, True
+            return "AI không phản hồi.", False
+        except Exception as e:
+            print(f"AI Error: {e}")
+            return "Hệ thống bận.", False
+
+# --- STREAM OPENAI (SSE) ---
+def stream_assistant_response(user_message, bot_type, turn):
+    # -> generator các đoạn text (delta). Cần chạy run mà hết chỗ thì AssistantBusy ngay, trước khi
+    # trả response (giống luồng thường: lượt bận không lưu gì)
+    client = get_client()
+    assistant_id = get_assistant_id(bot_type)
+    if client is None or not assistant_id: return single("Lỗi: Chưa cấu hình API Key.")
+    if not cacheable(bot_type, user_message): return started(stream_run(client, assistant_id, user_message, turn))
+
+    # Câu hỏi GOFAI trùng: cache, hoặc chờ run đang chạy của câu hỏi y hệt (single-flight)
+    key = cache_key(bot_type, assistant_id, user_message)
+    with span('response_cache'):
+        cached = response_cache.get(key)
+        if cached is not None: return single(cached)
+        flight, leader = response_cache.join(key)
+    if not leader: return stream_follower(client, assistant_id, user_message, turn, key, flight)
+    # Hết chỗ run: finally của stream_run vẫn land() -> lượt theo sau tự chạy
+    return started(stream_run(client, assistant_id, user_message, turn, (key, flight, (bot_type, assistant_id, user_message))))
+
+def single(text):
+    yield text
+
+def started(gen):
+    # Chạy tới yield đầu tiên (đã giữ chỗ run): AssistantBusy nổi lên ở đây, và từ đó
+    # finally của generator luôn chạy khi response đóng (kể cả trình duyệt ngắt giữa chừng)
+    next(gen)
+    return gen
+
+def stream_follower(client, assistant_id, user_message, turn, key, flight):
+    # Gửi nguyên câu trả lời của lượt dẫn đầu thành 1 delta; lượt dẫn đầu lỗi thì tự chạy run
+    # (hết chỗ lúc này -> AssistantBusy giữa stream, routes báo bận)
+    with span('response_cache'): result = response_cache.wait(key, flight, current_app.config['RUN_DEADLINE'] + 5)
+    if result is not None: yield result; return
+    yield from started(stream_run(client, assistant_id, user_message, turn))
+
+def stream_run(client, assistant_id, user_message, turn, flight=None):
+    # Assistants streaming API. flight = (key, _Flight, meta) khi là lượt dẫn đầu: land() khi kết thúc,
+    # lưu cache nếu run hoàn tất
+    parts, completed, start = [], False, time.monotonic()
+    try:
+        with run_slot():
+            yield ""
+            try:
+                with span('thread'): thread_id = ensure_thread(client, turn)
+                with span('message_create'): client.beta.threads.messages.create(thread_id=thread_id, role="user", content=user_message)
+
+                for event in client.beta.threads.runs.create(thread_id=thread_id, assistant_id=assistant_id, stream=True):
+                    if event.event == 'thread.message.delta':
+                        for part in event.data.delta.content or []:
+                            if part.type == 'text' and part.text.value:
+                                parts.append(part.text.value)
+                                yield part.text.value
+                    elif event.event == 'thread.run.completed':
+                        completed = True
+                    elif event.event in ('thread.run.failed', 'thread.run.cancelled', 'thread.run.expired'):
+                        break
+                elapsed = time.monotonic() - start
+                record_stat(runs=1, run_latency_total=elapsed, run_latency_max=elapsed)
+                if not parts: yield "AI không phản hồi."
+            except Exception as e:
+                print(f"AI Stream Error: {e}")
+                completed = False
+                yield "Hệ thống bận."
+    finally:
+        if flight:
+            key, f, meta = flight
+            response_cache.land(key, f, ''.join(parts) if parts and completed else None, time.monotonic() - start, meta)
+
+def visible_prefix(text):
+    # Phần text được phép gửi ra trình duyệt: cắt trước khối ```json LOG_DATA,
+    # giữ lại đuôi có thể là đầu của "```json" cho tới khi chắc chắn
+    marker = "```json"
+    idx = text.find(marker)
+    if idx >= 0: return text[:idx]
+    for k in range(len(marker) - 1, 0, -1):
+        if text.endswith(marker[:k]): return text[:-k]
+    return text
+
+# --- TÁCH JSON LOG_DATA ---
+def parse_log_data(full_resp):
+    ui_text, data = full_resp, {}
+    try:
+        if "```json" in full_resp:
+            parts = full_resp.split("```json")
+            ui_text = parts[0].strip()
+
+            json_str = parts[1].split("```")[0].replace("LOG_DATA =", "").strip()
+            if json_str: data = json.loads(json_str)
+    except: pass
+    return ui_text, data
@@ -0,0 +1,566 @@
+from . import db
+from sqlalchemy import create_engine, text
+from datetime import datetime, timedelta
+import io, os, random, statistics, tempfile, threading, time, uuid
+
+# --- BENCHMARK (dùng bởi lệnh `flask bench ...`) ---
+# Chạy trên file SQLite tạm riêng, không đụng tới DB của app.
+
+COMPOSITE_INDEXES = ['ix_message_user_session_ts', 'ix_variable_log_user_session_ts', 'ix_chat_session_user_activity']
+
+HOT_QUERIES = {
+    'chat_page': "SELECT id, sender, content, timestamp FROM message WHERE user_id = :uid AND session_id = :sid "
+                 "ORDER BY timestamp DESC, id DESC LIMIT 30",
+    'session_list_aggregate': "SELECT session_id, MAX(timestamp) FROM message WHERE user_id = :uid "
+                              "GROUP BY session_id ORDER BY MAX(timestamp) DESC",
+    'session_list_table': "SELECT id, last_activity, message_count FROM chat_session WHERE user_id = :uid ORDER BY last_activity DESC",
+    'variable_logs': "SELECT * FROM variable_log WHERE user_id = :uid ORDER BY timestamp DESC",
+    'delete_session_scan': "SELECT COUNT(*) FROM message WHERE user_id = :uid AND session_id = :sid",
+}
+
+def temp_sqlite_engine(path=None):
+    path = path or os.path.join(tempfile.mkdtemp(prefix='pb-bench-'), 'bench.db')
+    return create_engine(f'sqlite:///{path}'), path
+
+def seed(engine, n_messages, n_users=2000, sessions_per_user=5, logs_per_message=0.3, batch=20000):
+    # Sinh dữ liệu giả: user, phiên, tin nhắn, biến log
+    db.metadata.create_all(engine)
+    rnd = random.Random(42)
+    base = datetime(2025, 1, 1)
+    with engine.begin() as conn:
+        conn.execute(text('INSERT INTO "user" (id, username, password_hash, bot_type, is_admin) VALUES (:id, :u, \'x\', :b, 0)'),
+                     [{'id': i, 'u': f'bench{i}', 'b': 'ai' if i % 2 else 'gofai'} for i in range(1, n_users + 1)])
+    sessions = [(uid, str(uuid.UUID(int=rnd.getrandbits(128)))) for uid in range(1, n_users + 1) for _ in range(sessions_per_user)]
+    counts, done = {}, 0
+    while done < n_messages:
+        k = min(batch, n_messages - done)
+        msgs, logs = [], []
+        for j in range(k):
+            uid, sid = sessions[rnd.randrange(len(sessions))]
+            ts = base + timedelta(seconds=done + j)
+            msgs.append({'uid': uid, 'sid': sid, 's': 'user' if j % 2 else 'assistant', 'c': 'lorem ipsum ' * 8, 'ts': ts})
+            if rnd.random() < logs_per_message:
+                logs.append({'uid': uid, 'sid': sid, 'n': f'var{rnd.randrange(10)}', 'v': str(rnd.randrange(11)), 'ts': ts})
+            c = counts.setdefault(sid, [uid, ts, ts, 0])
+            c[2] = ts; c[3] += 1
+        with engine.begin() as conn:
+            conn.execute(text('INSERT INTO message (user_id, session_id, sender, content, timestamp) VALUES (:uid, :sid, :s, :c, :ts)'), msgs)
+            if logs: conn.execute(text('INSERT INTO variable_log (user_id, session_id, variable_name, variable_value, timestamp) VALUES (:uid, :sid, :n, :v, :ts)'), logs)
+        done += k
+    with engine.begin() as conn:
+        conn.execute(text('INSERT INTO chat_session (id, user_id, created_at, last_activity, message_count, log_count) VALUES (:id, :uid, :c, :l, :n, 0)'),
+                     [{'id': sid, 'uid': v[0], 'c': v[1], 'l': v[2], 'n': v[3]} for sid, v in counts.items()])
+    return sessions
+
+def set_composite_indexes(engine, enabled):
+    with engine.begin() as conn:
+        for name in COMPOSITE_INDEXES:
+            conn.execute(text(f'DROP INDEX IF EXISTS {name}'))
+        if enabled:
+            for idx in [i for t in db.metadata.tables.values() for i in t.indexes if i.name in COMPOSITE_INDEXES]:
+                idx.create(conn)
+        conn.execute(text('ANALYZE'))
+
+def time_queries(engine, sessions, repeat=30):
+    rnd = random.Random(7)
+    out = {}
+    with engine.connect() as conn:
+        for name, sql in HOT_QUERIES.items():
+            uid, sid = sessions[0]
+            plan = [r[-1] for r in conn.execute(text('EXPLAIN QUERY PLAN ' + sql), {'uid': uid, 'sid': sid})]
+            samples = []
+            for _ in range(repeat):
+                uid, sid = sessions[rnd.randrange(len(sessions))]
+                t = time.perf_counter()
+                conn.execute(text(sql), {'uid': uid, 'sid': sid}).fetchall()
+                samples.append((time.perf_counter() - t) * 1000)
+            out[name] = {'plan': plan, 'median_ms': round(statistics.median(samples), 3), 'max_ms': round(max(samples), 3)}
+    return out
+
+def bench_queries(n_messages, n_users, path=None):
+    engine, path = temp_sqlite_engine(path)
+    t = time.perf_counter()
+    sessions = seed(engine, n_messages, n_users)
+    result = {'db': path, 'messages': n_messages, 'users': n_users, 'seed_seconds': round(time.perf_counter() - t, 1)}
+    set_composite_indexes(engine, False)
+    result['before'] = time_queries(engine, sessions)
+    set_composite_indexes(engine, True)
+    result['after'] = time_queries(engine, sessions)
+    return result
+
+# --- CLIENT OPENAI GIẢ (độ trễ cấu hình được) ---
+class _NS:
+    def __init__(self, **kw): self.__dict__.update(kw)
+
+class StubAssistantClient:
+    # Giả lập Assistants API: run hoàn tất sau `latency` giây, trả lời kèm khối LOG_DATA
+    REPLY = "Câu trả lời mẫu.\n```json\nLOG_DATA = {\"score\": 7, \"stage\": \"practice\"}\n```"
+
+    def __init__(self, latency=0.5, reply=None):
+        self.latency, self.reply = latency, reply or self.REPLY
+        self._runs, self._lock, self._n = {}, threading.Lock(), 0
+        threads = _NS(create=self._new_thread,
+                      messages=_NS(create=lambda **kw: _NS(id='msg'), list=self._list),
+                      runs=_NS(create=self._create_run, retrieve=self._retrieve, cancel=lambda **kw: None))
+        self.beta = _NS(threads=threads)
+
+    def _id(self, prefix):
+        with self._lock:
+            self._n += 1
+            return f"{prefix}_{os.getpid()}_{self._n}"
+
+    def _new_thread(self, **kw): return _NS(id=self._id('thread'))
+
+    def _create_run(self, thread_id, assistant_id, stream=False, **kw):
+        if stream: return self._stream()
+        rid = self._id('run')
+        self._runs[rid] = time.monotonic() + self.latency
+        return _NS(id=rid, status='queued')
+
+    def _retrieve(self, thread_id, run_id):
+        return _NS(id=run_id, status='completed' if time.monotonic() >= self._runs[run_id] else 'in_progress')
+
+    def _list(self, **kw):
+        return _NS(data=[_NS(content=[_NS(text=_NS(value=self.reply))])])
+
+    def _stream(self):
+        time.sleep(self.latency)
+        for i in range(0, len(self.reply), 8):
+            part = _NS(type='text', text=_NS(value=self.reply[i:i + 8]))
+            yield _NS(event='thread.message.delta', data=_NS(delta=_NS(content=[part])))
+        yield _NS(event='thread.run.completed', data=None)
+
+def percentile(samples, p):
+    if not samples: return 0
+    s = sorted(samples)
+    return s[min(len(s) - 1, int(round(p / 100 * (len(s) - 1))))]
+
+def latency_summary(samples_ms):
+    return {'p50_ms': round(percentile(samples_ms, 50), 1), 'p95_ms': round(percentile(samples_ms, 95), 1),
+            'p99_ms': round(percentile(samples_ms, 99), 1), 'max_ms': round(max(samples_ms), 1) if samples_ms else 0}
+
+# --- BENCH GHI ĐỒNG THỜI TRÊN FILE SQLITE ---
+BENCH_PASSWORD = 'bench123'
+
+def bench_app(uri, latency, **overrides):
+    from . import create_app
+    # Bench đo thông lượng: nới token bucket để học sinh ảo gửi liên tục không bị 429 (hàng đợi vẫn bật)
+    cfg = {'SQLALCHEMY_DATABASE_URI': uri, 'WTF_CSRF_ENABLED': False, 'OPENAI_CLIENT': StubAssistantClient(latency),
+           'USER_BURST': 1e6, 'GLOBAL_BURST': 1e6}
+    cfg.update(overrides)
+    os.environ.setdefault('CHATBOT_AI_ID', 'asst_bench_ai')
+    os.environ.setdefault('CHATBOT_GOFAI_ID', 'asst_bench_gofai')
+    return create_app(cfg)
+
+def seed_students(app, n, prefix='student'):
+    from .models import User
+    from werkzeug.security import generate_password_hash
+    pw = generate_password_hash(BENCH_PASSWORD, method='pbkdf2:sha256:1000')  # băm nhẹ cho bench
+    with app.app_context():
+        have = {u for (u,) in db.session.query(User.username).filter(User.username.like(f'{prefix}%'))}
+        rows = [{'username': f'{prefix}{i}', 'password_hash': pw, 'bot_type': 'gofai' if i % 2 else 'ai', 'is_admin': False}
+                for i in range(n) if f'{prefix}{i}' not in have]
+        if rows: db.session.execute(User.__table__.insert(), rows)
+        db.session.commit()
+    return [(f'{prefix}{i}', 'gofai' if i % 2 else 'ai') for i in range(n)]
+
+def _student_worker(uri, latency, overrides, students, turns, out):
+    app = bench_app(uri, latency, **overrides)
+    lat, errors = [], 0
+
+    def run_student(username, bot):
+        nonlocal errors
+        c = app.test_client()
+        c.post('/login', data={'username': username, 'password': BENCH_PASSWORD})
+        for t in range(turns):
+            t0 = time.perf_counter()
+            r = c.post(f'/chatbot/{bot}', data={'user_input': f'câu hỏi {t}'})
+            lat.append((time.perf_counter() - t0) * 1000)
+            if r.status_code != 200: errors += 1
+
+    threads = [threading.Thread(target=run_student, args=s) for s in students]
+    [t.start() for t in threads]; [t.join() for t in threads]
+    wq = app.extensions.get('write_queue')
+    if wq: wq.flush()
+    out.put({'lat': lat, 'errors': errors})
+
+def bench_sqlite_concurrency(students, turns, workers, latency, profiles=('default', 'tuned', 'tuned+write_behind', 'tuned+batch')):
+    import multiprocessing as mp
+    ctx = mp.get_context('fork')
+    results = {}
+    for profile in profiles:
+        overrides = {'SQLITE_TUNED': profile != 'default', 'SQLITE_WRITE_BEHIND': profile.endswith('write_behind'),
+                     'TRANSCRIPT_BATCH': profile.endswith('batch')}
+        _, path = temp_sqlite_engine()
+        uri = f'sqlite:///{path}'
+        roster = seed_students(bench_app(uri, latency, **overrides), students)
+        out = ctx.Queue()
+        procs = [ctx.Process(target=_student_worker, args=(uri, latency, overrides, roster[w::workers], turns, out)) for w in range(workers)]
+        t0 = time.perf_counter()
+        [p.start() for p in procs]
+        parts = [out.get() for _ in procs]
+        [p.join() for p in procs]
+        wall = time.perf_counter() - t0
+        lat = [x for p in parts for x in p['lat']]
+        results[profile] = {'db': path, 'turns': len(lat), 'errors': sum(p['errors'] for p in parts),
+                            'throughput_turns_per_s': round(len(lat) / wall, 1), **latency_summary(lat)}
+    return {'students': students, 'turns_per_student': turns, 'workers': workers, 'ai_latency_s': latency, 'profiles': results}
+
+# --- BENCH TỔNG HỢP BIẾN (raw VariableLog vs bảng rollup) ---
+def _raw_class_means(bot_type):
+    from .models import User, VariableLog
+    from .analytics import parse_number
+    acc = {}
+    q = db.session.query(VariableLog.variable_name, VariableLog.variable_value).join(User, User.id == VariableLog.user_id) \
+        .filter(User.bot_type == bot_type)
+    for name, value in q.yield_per(5000):
+        x = parse_number(value)
+        if x is None: continue
+        a = acc.setdefault(name, [0, 0.0]); a[0] += 1; a[1] += x
+    return {k: a[1] / a[0] for k, a in acc.items()}
+
+def bench_analytics(rows, users=2000, repeat=5):
+    from .analytics import compact, class_summary, student_summary
+    from .models import VariableLog
+    engine, path = temp_sqlite_engine()
+    seed(engine, rows, users, logs_per_message=1.0)
+    engine.dispose()
+    app = bench_app(f'sqlite:///{path}', 0, ROLLUP_MODE='compaction')
+
+    def timed(fn):
+        samples = []
+        for _ in range(repeat):
+            t = time.perf_counter(); fn(); samples.append((time.perf_counter() - t) * 1000)
+        return {'median_ms': round(statistics.median(samples), 1), 'max_ms': round(max(samples), 1)}
+
+    with app.app_context():
+        t = time.perf_counter()
+        n = compact()
+        result = {'db': path, 'variable_logs': n, 'compact_seconds': round(time.perf_counter() - t, 2)}
+        raw_student = lambda: VariableLog.query.filter_by(user_id=1).order_by(VariableLog.timestamp.desc()).all()
+        result['class_raw'] = timed(lambda: _raw_class_means('ai'))
+        result['class_rollup'] = timed(lambda: class_summary(bot_type='ai'))
+        result['student_raw'] = timed(raw_student)
+        result['student_rollup'] = timed(lambda: student_summary(1))
+    return result
+
+# --- BENCH XÓA HÀNG LOẠT (1 transaction lớn vs theo khối) ---
+def _legacy_delete(ids):
+    # Cách cũ của delete_selected_users: từng user, tất cả trong 1 transaction
+    from .models import User, Message, VariableLog, ChatSession
+    for uid in ids:
+        u = db.session.get(User, uid)
+        Message.query.filter_by(user_id=uid).delete()
+        VariableLog.query.filter_by(user_id=uid).delete()
+        ChatSession.query.filter_by(user_id=uid).delete()
+        if u: db.session.delete(u)
+    db.session.commit()
+
+def _write_probe(path, stop, out):
+    # Giả lập lượt chat ghi chen vào trong lúc xóa
+    eng = create_engine(f'sqlite:///{path}', connect_args={'timeout': 60})
+    while not stop.is_set():
+        t = time.perf_counter()
+        with eng.begin() as conn:
+            conn.execute(text("INSERT INTO message (user_id, session_id, sender, content, timestamp) VALUES (1, 'probe', 'user', 'x', :ts)"),
+                         {'ts': datetime.utcnow()})
+        out.append((time.perf_counter() - t) * 1000)
+        time.sleep(0.01)
+    eng.dispose()
+
+def bench_purge(n_messages, n_users, n_delete):
+    import shutil
+    from .purge import create_purge_job, run_purge_job
+    engine, path = temp_sqlite_engine()
+    seed(engine, n_messages, n_users)
+    engine.dispose()
+    ids = list(range(n_users - n_delete + 1, n_users + 1))
+    result = {'db': path, 'messages': n_messages, 'users': n_users, 'deleted_users': len(ids)}
+    for mode in ('single_transaction', 'chunked'):
+        p = path.replace('bench.db', f'{mode}.db')
+        shutil.copy(path, p)
+        app = bench_app(f'sqlite:///{p}', 0)
+        with app.app_context():
+            db.session.execute(text('SELECT 1'))  # mở kết nối (bật WAL) trước khi chạy probe
+            stop, lat = threading.Event(), []
+            probe = threading.Thread(target=_write_probe, args=(p, stop, lat))
+            probe.start()
+            t = time.perf_counter()
+            if mode == 'chunked': run_purge_job(create_purge_job(ids).id)
+            else: _legacy_delete(ids)
+            elapsed = time.perf_counter() - t
+            stop.set(); probe.join()
+            db.session.remove()
+        result[mode] = {'seconds': round(elapsed, 2), 'probe_writes': len(lat), **{f'probe_{k}': v for k, v in latency_summary(lat).items()}}
+    return result
+
+# --- LOAD TEST: CHAT + ADMIN + EXPORT + NHẬP CSV (`flask bench load`) ---
+try:
+    import resource  # đo RSS đỉnh (Linux/macOS)
+except ImportError:
+    resource = None
+
+class QueryCounter:
+    # Đếm số câu SQL gửi tới DB (mọi luồng)
+    def __init__(self, engine):
+        from sqlalchemy import event
+        self.n, self._lock = 0, threading.Lock()
+        event.listen(engine, 'before_cursor_execute', self._inc)
+
+    def _inc(self, *args):
+        with self._lock: self.n += 1
+
+    def take(self):
+        with self._lock:
+            n, self.n = self.n, 0
+        return n
+
+def peak_rss_mb():
+    if resource is None: return None
+    kb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return round(kb / 1024 / (1024 if os.uname().sysname == 'Darwin' else 1), 1)  # macOS trả về byte
+
+class _TestClient:
+    def __init__(self, app): self.c = app.test_client()
+
+    def get(self, path):
+        r = self.c.get(path)
+        return r.status_code, r.get_data()
+
+    def post(self, path, data=None, files=None):
+        data = dict(data or {})
+        for k, (name, content) in (files or {}).items(): data[k] = (io.BytesIO(content), name)
+        r = self.c.post(path, data=data, content_type='multipart/form-data' if files else None)
+        return r.status_code, r.get_data()
+
+class _HttpClient:
+    # Gửi request thật qua server WSGI cục bộ (giữ cookie đăng nhập)
+    def __init__(self, base):
+        import urllib.request, http.cookiejar
+        self.base = base
+        self.opener = urllib.request.build_opener(urllib.request.HTTPCookieProcessor(http.cookiejar.CookieJar()))
+
+    def _open(self, req):
+        import urllib.error
+        try:
+            with self.opener.open(req, timeout=120) as r: return r.status, r.read()
+        except urllib.error.HTTPError as e: return e.code, e.read()
+
+    def get(self, path):
+        import urllib.request
+        return self._open(urllib.request.Request(self.base + path))
+
+    def post(self, path, data=None, files=None):
+        import urllib.request, urllib.parse
+        if not files:
+            body, ctype = urllib.parse.urlencode(data or {}).encode(), 'application/x-www-form-urlencoded'
+        else:
+            boundary = uuid.uuid4().hex
+            parts = [f'--{boundary}\r\nContent-Disposition: form-data; name="{k}"\r\n\r\n{v}\r\n'.encode() for k, v in (data or {}).items()]
+            parts += [f'--{boundary}\r\nContent-Disposition: form-data; name="{k}"; filename="{name}"\r\nContent-Type: text/csv\r\n\r\n'.encode()
+                      + content + b'\r\n' for k, (name, content) in files.items()]
+            body, ctype = b''.join(parts) + f'--{boundary}--\r\n'.encode(), f'multipart/form-data; boundary={boundary}'
+        return self._open(urllib.request.Request(self.base + path, data=body, headers={'Content-Type': ctype}))
+
+def seed_admin(app, username='bench_admin'):
+    from .models import User
+    from werkzeug.security import generate_password_hash
+    with app.app_context():
+        if not User.query.filter_by(username=username).first():
+            db.session.add(User(username=username, password_hash=generate_password_hash(BENCH_PASSWORD, method='pbkdf2:sha256:1000'),
+                                bot_type='ai', is_admin=True))
+            db.session.commit()
+    return username
+
+def _timed_requests(fn, n):
+    lat, errors = [], 0
+    t0 = time.perf_counter()
+    for i in range(n):
+        t = time.perf_counter()
+        status = fn(i)
+        lat.append((time.perf_counter() - t) * 1000)
+        if status >= 400: errors += 1
+    return lat, errors, time.perf_counter() - t0
+
+def _scenario(lat, errors, wall, queries, requests=None):
+    n = requests or len(lat)
+    return {'requests': n, 'errors': errors, 'throughput_rps': round(n / wall, 1) if wall else 0, **latency_summary(lat),
+            'queries': queries, 'queries_per_request': round(queries / n, 1) if n else 0, 'peak_rss_mb': peak_rss_mb()}
+
+def git_revision():
+    import subprocess
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], cwd=os.path.dirname(__file__),
+                                       stderr=subprocess.DEVNULL, text=True).strip()
+    except Exception:
+        return None
+
+def bench_load(users=2000, messages=100_000, students=50, turns=4, latency=0.2, admin_requests=30, exports=3,
+               import_rows=100, http=False, path=None, **overrides):
+    engine, path = temp_sqlite_engine(path)
+    t = time.perf_counter()
+    seed(engine, messages, users)
+    engine.dispose()
+    app = bench_app(f'sqlite:///{path}', latency, **overrides)
+    roster = seed_students(app, students)
+    admin = seed_admin(app)
+    with app.app_context(): counter = QueryCounter(db.engine)
+    result = {'revision': git_revision(), 'db': path, 'users': users, 'messages': messages, 'students': students,
+              'turns_per_student': turns, 'ai_latency_s': latency, 'transport': 'http' if http else 'test_client',
+              'seed_seconds': round(time.perf_counter() - t, 1), 'scenarios': {}}
+
+    server = None
+    if http:
+        from werkzeug.serving import make_server
+        server = make_server('127.0.0.1', 0, app, threaded=True)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        client = lambda: _HttpClient(f'http://127.0.0.1:{server.server_port}')
+    else:
+        client = lambda: _TestClient(app)
+
+    try:
+        # 1) Chat đồng thời: mỗi học sinh 1 luồng, POST /chatbot/<bot>
+        lat, errors, lock = [], [0], threading.Lock()
+        def run_student(username, bot):
+            c = client()
+            c.post('/login', data={'username': username, 'password': BENCH_PASSWORD})
+            for i in range(turns):
+                t0 = time.perf_counter()
+                status, _ = c.post(f'/chatbot/{bot}', data={'user_input': f'câu hỏi {i}'})
+                with lock:
+                    lat.append((time.perf_counter() - t0) * 1000)
+                    if status >= 400: errors[0] += 1
+        counter.take()
+        threads = [threading.Thread(target=run_student, args=s) for s in roster]
+        t0 = time.perf_counter()
+        [th.start() for th in threads]; [th.join() for th in threads]
+        wall = time.perf_counter() - t0
+        wq = app.extensions.get('write_queue')
+        if wq: wq.flush()
+        result['scenarios']['chat'] = _scenario(lat, errors[0], wall, counter.take())
+
+        a = client()
+        a.post('/login', data={'username': admin, 'password': BENCH_PASSWORD})
+        # 2) Dashboard admin: trang HTML + API danh sách học sinh (lật trang, sắp xếp)
+        counter.take()
+        sorts = ['id', 'username', 'bot_type']
+        lat, errors, wall = _timed_requests(
+            lambda i: (a.get('/admin') if i % 3 == 0 else a.get(f'/admin/api/users?page={i % 20 + 1}&sort={sorts[i % 3]}'))[0], admin_requests)
+        result['scenarios']['admin'] = _scenario(lat, errors, wall, counter.take())
+
+        # 3) Xuất CSV toàn bộ lịch sử (đọc hết body stream)
+        sizes = []
+        def export(i):
+            status, body = a.get('/admin/export_history' + ('?gzip=1' if i % 2 else ''))
+            sizes.append(len(body)); return status
+        counter.take()
+        lat, errors, wall = _timed_requests(export, exports)
+        result['scenarios']['export_history'] = dict(_scenario(lat, errors, wall, counter.take()), max_body_bytes=max(sizes or [0]))
+
+        # 4) Nhập CSV: import_rows user mới / 1 request
+        run_id = uuid.uuid4().hex[:6]
+        csv_body = ('username,password,type\n' + ''.join(f'imp{run_id}_{i},pass{i},{"ai" if i % 2 else "gofai"}\n'
+                                                          for i in range(import_rows))).encode()
+        counter.take()
+        lat, errors, wall = _timed_requests(
+            lambda i: a.post('/admin/upload_csv?format=json', files={'csv_file': ('roster.csv', csv_body)})[0], 1)
+        result['scenarios']['upload_csv'] = dict(_scenario(lat, errors, wall, counter.take()), rows=import_rows)
+    finally:
+        if server: server.shutdown()
+    return result
+
+# --- BENCH NHẬP DANH SÁCH USER (CSV) ---
+def bench_import(rows=10000, existing=1000, workers=None, sample=50):
+    # existing dòng đầu của file trùng user đã có (bị bỏ qua). So sánh:
+    # - tra username: SELECT từng dòng (cách cũ) vs 1 truy vấn IN / 900 tên
+    # - băm mật khẩu: tuần tự (ước lượng từ `sample` lần băm) vs cả request nhập thật (process pool)
+    from .models import User
+    from .user_import import existing_usernames
+    from werkzeug.security import generate_password_hash
+    from sqlalchemy import insert
+    engine, path = temp_sqlite_engine()
+    engine.dispose()
+    app = bench_app(f'sqlite:///{path}', 0, IMPORT_HASH_WORKERS=workers)
+    admin = seed_admin(app)
+    names = [f'imp_{i}' for i in range(rows)]
+    with app.app_context():
+        db.session.execute(insert(User), [{'username': n, 'password_hash': 'x', 'bot_type': 'gofai', 'is_admin': False}
+                                          for n in names[:existing]])
+        db.session.commit()
+        counter = QueryCounter(db.engine)
+    result = {'revision': git_revision(), 'db': path, 'rows': rows, 'existing': existing, 'cpus': os.cpu_count(),
+              'hash_workers': workers or os.cpu_count()}
+
+    with app.app_context():
+        counter.take()
+        t = time.perf_counter()
+        legacy = {n for n in names if User.query.filter_by(username=n).first()}
+        result['lookup_per_row'] = {'ms': round((time.perf_counter() - t) * 1000, 1), 'queries': counter.take()}
+        t = time.perf_counter()
+        found = existing_usernames(names)
+        result['lookup_set_based'] = {'ms': round((time.perf_counter() - t) * 1000, 1), 'queries': counter.take()}
+        assert found == legacy
+        db.session.remove()
+
+    t = time.perf_counter()
+    for i in range(sample): generate_password_hash(f'pass{i}')
+    per_hash = (time.perf_counter() - t) / sample
+    result['hash_sequential_estimate_s'] = round(per_hash * (rows - existing), 1)
+
+    a = _TestClient(app)
+    a.post('/login', data={'username': admin, 'password': BENCH_PASSWORD})
+    csv_body = ('username,password,type\n' + ''.join(f'{n},pass{i},{"ai" if i % 2 else "gofai"}\n'
+                                                      for i, n in enumerate(names))).encode()
+    counter.take()
+    t = time.perf_counter()
+    status, body = a.post('/admin/upload_csv?format=json', files={'csv_file': ('roster.csv', csv_body)})
+    elapsed = time.perf_counter() - t
+    import json
+    report = json.loads(body)['report'] if status == 200 else []
+    result['import_request'] = {'status': status, 'seconds': round(elapsed, 2), 'queries': counter.take(),
+                                'created': sum(1 for r in report if r['status'] == 'created'),
+                                'skipped': sum(1 for r in report if r['status'] == 'skipped'),
+                                'rows_per_s': round(rows / elapsed, 1), 'peak_rss_mb': peak_rss_mb()}
+    return result
+
+# --- BENCH KHỞI ĐỘNG WORKER ---
+# Mỗi lần đo là 1 process Python mới (giống 1 worker gunicorn vừa fork/khởi động lại):
+# import app -> create_app() -> GET /login đầu tiên
+STARTUP_SCRIPT = '''
+import json, sys, time
+t0 = time.perf_counter()
+from app import create_app
+t1 = time.perf_counter()
+app = create_app()
+t2 = time.perf_counter()
+status = app.test_client().get('/login').status_code
+t3 = time.perf_counter()
+heavy = [m for m in ('openai', 'alembic', 'flask_migrate', 'PIL') if m in sys.modules]
+print(json.dumps({'import_ms': (t1 - t0) * 1000, 'create_app_ms': (t2 - t1) * 1000,
+                  'first_response_ms': (t3 - t2) * 1000, 'status': status, 'heavy_modules': heavy}))
+'''
+
+def bench_startup(runs=5):
+    import json, subprocess, sys
+    engine, path = temp_sqlite_engine()
+    db.metadata.create_all(engine)
+    engine.dispose()
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    result = {'revision': git_revision(), 'runs': runs, 'modes': {}}
+    for mode in ('1', '0'):
+        env = dict(os.environ, DATABASE_URL=f'sqlite:///{path}', AUTO_INIT_DB=mode,
+                   DATA_DISK=os.path.join(os.path.dirname(path), 'no-disk'))
+        samples = []
+        for _ in range(runs):
+            t = time.perf_counter()
+            out = subprocess.run([sys.executable, '-c', STARTUP_SCRIPT], cwd=root, env=env,
+                                 capture_output=True, text=True, check=True).stdout
+            r = json.loads(out.strip().splitlines()[-1])
+            r['process_ms'] = (time.perf_counter() - t) * 1000  # gồm cả khởi động trình thông dịch
+            samples.append(r)
+        med = lambda k: round(statistics.median(s[k] for s in samples), 1)
+        result['modes'][f'AUTO_INIT_DB={mode}'] = {
+            'import_ms': med('import_ms'), 'create_app_ms': med('create_app_ms'),
+            'first_response_ms': med('first_response_ms'), 'process_ms': med('process_ms'),
+            'status': samples[-1]['status'], 'heavy_modules_loaded': samples[-1]['heavy_modules']}
+    return result
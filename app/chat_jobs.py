@@ -0,0 +1,71 @@
+from . import db
+from .models import ChatJob
+from .assistant import get_assistant_response, AssistantBusy, BUSY_MESSAGE
+from .transcript import write_turn
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+import threading, uuid, traceback
+
+# --- CHẾ ĐỘ CHAT BẤT ĐỒNG BỘ ---
+# Request chỉ xếp hàng lượt chat rồi trả job_id ngay; pool luồng nền chạy Assistant
+# tới khi xong và lưu Message/VariableLog. Trình duyệt hỏi trạng thái qua /chatbot/job/<id>.
+# Trạng thái job: pending -> done | busy (hết chỗ run) | error. busy/error không lưu gì của lượt chat
+# (giống luồng thường) nên trình duyệt gửi lại được mà không trùng tin nhắn.
+
+_executor = None
+_lock = threading.Lock()
+_events = {}  # job_id -> threading.Event (chỉ có trong worker đã nhận job)
+
+def get_executor(app):
+    global _executor
+    with _lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=app.config.get('CHAT_WORKERS', 8), thread_name_prefix='chat-job')
+    return _executor
+
+def submit_chat_job(app, user_id, turn, message, bot_type, on_done=None):
+    # Dọn job cũ cho bảng luôn nhỏ
+    ChatJob.query.filter(ChatJob.created_at < datetime.utcnow() - timedelta(hours=1)).delete()
+    job = ChatJob(id=str(uuid.uuid4()), user_id=user_id, session_id=turn.sess_id, status='pending')
+    db.session.add(job)
+    db.session.commit()
+
+    with _lock: _events[job.id] = threading.Event()
+    get_executor(app).submit(_run_job, app, job.id, turn, message, bot_type, on_done)
+    return job.id
+
+def _run_job(app, job_id, turn, message, bot_type, on_done=None):
+    with app.app_context():
+        try:
+            try:
+                full_resp = get_assistant_response(message, bot_type, turn)
+                status, ui_text = 'done', turn.add_reply(full_resp)
+                write_turn(turn.take())  # cả lượt (tin User + Bot + biến) cùng transaction với trạng thái job
+            except AssistantBusy: status, ui_text = 'busy', BUSY_MESSAGE
+            job = db.session.get(ChatJob, job_id)
+            job.status, job.response = status, ui_text
+            db.session.commit()
+        except Exception as e:
+            print(f"Chat job error: {e}")
+            traceback.print_exc()
+            db.session.rollback()
+            job = db.session.get(ChatJob, job_id)
+            if job:
+                job.status, job.response = 'error', "Hệ thống bận."
+                db.session.commit()
+        finally:
+            db.session.remove()
+            if on_done: on_done()  # trả chỗ trong hàng đợi lượt chat
+            with _lock: ev = _events.pop(job_id, None)
+            if ev: ev.set()
+
+def backlog():
+    # Số job đang chờ/chạy trong worker này
+    with _lock: return len(_events)
+
+def wait_for_job(job_id, user_id, timeout=0):
+    # Long-poll: nếu job chạy trong worker này thì chờ Event, ngược lại đọc DB
+    with _lock: ev = _events.get(job_id)
+    if ev and timeout > 0: ev.wait(timeout)
+    db.session.expire_all()
+    return ChatJob.query.filter_by(id=job_id, user_id=user_id).first()
@@ -0,0 +1,168 @@
+import click
+
+# --- LỆNH CLI (flask ...) ---
+
+def register_commands(app):
+    @app.cli.command('backfill-sessions')
+    def backfill_sessions_cmd():
+        """Tạo bảng tóm tắt phiên chat từ dữ liệu Message có sẵn."""
+        from .history import backfill_sessions
+        click.echo(f"Đã tạo {backfill_sessions()} phiên.")
+
+    @app.cli.command('init-db')
+    def init_db_cmd():
+        """Tạo bảng còn thiếu + Admin mặc định (dùng khi AUTO_INIT_DB=0, chạy 1 lần lúc deploy)."""
+        from . import init_database
+        click.echo(f">>> Database: {app.config['SQLALCHEMY_DATABASE_URI']} "
+                   f"({'ổ cứng vĩnh viễn' if app.config['PERSISTENT_DISK'] else 'tạm thời, mất dữ liệu khi reset'})")
+        init_database()
+        click.echo("Xong.")
+
+    @app.cli.group('analytics')
+    def analytics():
+        """Bảng tổng hợp biến LOG_DATA (variable_rollup)."""
+
+    @analytics.command('compact')
+    @click.option('--batch', default=50000, show_default=True, help='Số VariableLog mỗi transaction.')
+    def analytics_compact_cmd(batch):
+        """Gộp các VariableLog mới (sau mốc đã xử lý) vào bảng rollup."""
+        from .analytics import compact
+        click.echo(f"Đã gộp {compact(batch)} dòng log.")
+
+    @analytics.command('rebuild')
+    def analytics_rebuild_cmd():
+        """Xóa và tính lại toàn bộ bảng rollup từ VariableLog."""
+        from .analytics import rebuild
+        click.echo(f"Đã tính lại từ {rebuild()} dòng log.")
+
+    @app.cli.group('purge')
+    def purge():
+        """Xóa hàng loạt theo khối."""
+
+    @purge.command('resume')
+    def purge_resume_cmd():
+        """Chạy tiếp các job xóa còn dở (vd. worker bị restart giữa chừng)."""
+        from .purge import resume_purges, purge_status
+        for job in resume_purges():
+            click.echo(purge_status(job))
+
+    @purge.command('users')
+    @click.argument('user_ids', nargs=-1, type=int, required=True)
+    def purge_users_cmd(user_ids):
+        """Xóa các user (cùng tin nhắn, log, phiên) theo id."""
+        from .purge import create_purge_job, run_purge_job, purge_status, purgeable_ids
+        ids = purgeable_ids(user_ids)
+        skipped = sorted(set(user_ids) - set(ids))
+        if skipped: click.echo(f"Bỏ qua (Admin hoặc không tồn tại): {skipped}")
+        if ids: click.echo(purge_status(run_purge_job(create_purge_job(ids).id)))
+
+    @app.cli.group('archive')
+    def archive():
+        """Lưu trữ phiên cũ ra file nén (tầng lạnh)."""
+
+    @archive.command('run')
+    @click.option('--days', default=None, type=int, help='Phiên không hoạt động quá N ngày (mặc định ARCHIVE_AFTER_DAYS).')
+    @click.option('--batch', default=200, show_default=True, help='Số phiên mỗi transaction.')
+    @click.option('--limit', default=None, type=int, help='Tối đa số phiên cho lần chạy này.')
+    def archive_run_cmd(days, batch, limit):
+        """Chuyển các phiên cũ khỏi bảng message/variable_log (chạy lại được, theo từng lô)."""
+        from .archive import archive_sessions
+        r = archive_sessions(days, batch, limit)
+        click.echo(f"Đã lưu trữ {r['sessions']} phiên ({r['rows']} dòng).")
+
+    @archive.command('stats')
+    def archive_stats_cmd():
+        """Số phiên đã lưu trữ và dung lượng các file."""
+        import json
+        from .archive import archive_stats
+        click.echo(json.dumps(archive_stats(), indent=2))
+
+    @app.cli.command('clear-response-cache')
+    def clear_response_cache_cmd():
+        """Xóa cache câu trả lời GOFAI (vd. sau khi sửa hướng dẫn của Assistant)."""
+        from .response_cache import response_cache
+        response_cache.clear()
+        click.echo("Đã xóa cache câu trả lời.")
+
+    @app.cli.group('bench')
+    def bench():
+        """Benchmark hiệu năng (chạy trên DB tạm, in kết quả JSON)."""
+
+    @bench.command('queries')
+    @click.option('--messages', default=1_000_000, show_default=True, help='Số tin nhắn giả.')
+    @click.option('--users', default=2000, show_default=True)
+    @click.option('--db-path', default=None, help='File SQLite (mặc định: thư mục tạm).')
+    def bench_queries_cmd(messages, users, db_path):
+        """So sánh query plan + độ trễ truy vấn nóng trước/sau index ghép."""
+        import json
+        from .bench import bench_queries
+        click.echo(json.dumps(bench_queries(messages, users, db_path), indent=2, ensure_ascii=False))
+
+    @bench.command('sqlite')
+    @click.option('--students', default=40, show_default=True, help='Số học sinh giả lập (mỗi em 1 luồng).')
+    @click.option('--turns', default=5, show_default=True, help='Số lượt chat mỗi học sinh.')
+    @click.option('--workers', default=4, show_default=True, help='Số process (giống số worker gunicorn).')
+    @click.option('--latency', default=0.2, show_default=True, help='Độ trễ giả của Assistant (giây).')
+    def bench_sqlite_cmd(students, turns, workers, latency):
+        """Ghi đồng thời lên file SQLite: mặc định vs WAL/pool vs WAL + ghi trễ vs WAL + gom lượt chat."""
+        import json
+        from .bench import bench_sqlite_concurrency
+        click.echo(json.dumps(bench_sqlite_concurrency(students, turns, workers, latency), indent=2, ensure_ascii=False))
+
+    @bench.command('analytics')
+    @click.option('--rows', default=1_000_000, show_default=True, help='Số VariableLog giả.')
+    @click.option('--users', default=2000, show_default=True)
+    def bench_analytics_cmd(rows, users):
+        """Thống kê lớp/học sinh: quét log thô vs đọc bảng rollup."""
+        import json
+        from .bench import bench_analytics
+        click.echo(json.dumps(bench_analytics(rows, users), indent=2, ensure_ascii=False))
+
+    @bench.command('purge')
+    @click.option('--messages', default=1_000_000, show_default=True, help='Số tin nhắn giả.')
+    @click.option('--users', default=2000, show_default=True)
+    @click.option('--delete', 'n_delete', default=500, show_default=True, help='Số user bị xóa.')
+    def bench_purge_cmd(messages, users, n_delete):
+        """Xóa 1 transaction lớn vs xóa theo khối, đo độ trễ ghi chen vào trong lúc xóa."""
+        import json
+        from .bench import bench_purge
+        click.echo(json.dumps(bench_purge(messages, users, n_delete), indent=2, ensure_ascii=False))
+
+    @bench.command('load')
+    @click.option('--users', default=2000, show_default=True, help='Số user giả (dữ liệu nền).')
+    @click.option('--messages', default=100_000, show_default=True, help='Số tin nhắn giả (dữ liệu nền).')
+    @click.option('--students', default=50, show_default=True, help='Số học sinh chat đồng thời.')
+    @click.option('--turns', default=4, show_default=True, help='Số lượt chat mỗi học sinh.')
+    @click.option('--latency', default=0.2, show_default=True, help='Độ trễ giả của Assistant (giây).')
+    @click.option('--admin-requests', default=30, show_default=True)
+    @click.option('--exports', default=3, show_default=True, help='Số lần tải /admin/export_history.')
+    @click.option('--import-rows', default=100, show_default=True, help='Số dòng CSV cho /admin/upload_csv.')
+    @click.option('--http', is_flag=True, help='Chạy qua server HTTP cục bộ thay vì test client.')
+    @click.option('--output', type=click.Path(dir_okay=False), default=None, help='Ghi JSON ra file (để so sánh giữa các commit).')
+    def bench_load_cmd(users, messages, students, turns, latency, admin_requests, exports, import_rows, http, output):
+        """Load test chat/admin/export/nhập CSV: p50/p95/p99, throughput, số query, RSS đỉnh."""
+        import json
+        from .bench import bench_load
+        out = json.dumps(bench_load(users, messages, students, turns, latency, admin_requests, exports, import_rows, http),
+                         indent=2, ensure_ascii=False)
+        if output:
+            with open(output, 'w', encoding='utf-8') as f: f.write(out)
+        click.echo(out)
+
+    @bench.command('import')
+    @click.option('--rows', default=10000, show_default=True, help='Số dòng trong file CSV.')
+    @click.option('--existing', default=1000, show_default=True, help='Số dòng trùng user đã có (bị bỏ qua).')
+    @click.option('--workers', default=None, type=int, help='Số process băm mật khẩu (mặc định = số CPU).')
+    def bench_import_cmd(rows, existing, workers):
+        """Nhập danh sách user qua /admin/upload_csv: tra username từng dòng vs theo lô, băm tuần tự vs song song."""
+        import json
+        from .bench import bench_import
+        click.echo(json.dumps(bench_import(rows, existing, workers), indent=2, ensure_ascii=False))
+
+    @bench.command('startup')
+    @click.option('--runs', default=5, show_default=True, help='Số process khởi động mỗi chế độ (mỗi process ~ 1 worker).')
+    def bench_startup_cmd(runs):
+        """Thời gian import, create_app và response đầu tiên của worker mới (AUTO_INIT_DB bật/tắt)."""
+        import json
+        from .bench import bench_startup
+        click.echo(json.dumps(bench_startup(runs), indent=2, ensure_ascii=False))
@@ -0,0 +1,75 @@
+from flask import Response, stream_with_context, request
+from . import db
+from .models import User, Message, VariableLog
+from .archive import archived_rows, row_time
+from datetime import datetime, timedelta
+import csv, heapq, io, zlib
+
+# --- XUẤT CSV DẠNG STREAM ---
+# Đọc DB theo lô (yield_per -> server-side cursor), ghi CSV theo từng khối,
+# nên bộ nhớ worker không phụ thuộc kích thước bảng. Phiên đã lưu trữ được trộn theo thời gian (mới nhất trước).
+
+BATCH_SIZE = 1000
+CHUNK_ROWS = 500
+
+def parse_export_filters(args):
+    # ?start=YYYY-MM-DD&end=YYYY-MM-DD&user=<username>&session=<id>&gzip=1
+    f = {}
+    for key in ('start', 'end'):
+        if args.get(key):
+            try: f[key] = datetime.strptime(args[key], '%Y-%m-%d')
+            except ValueError: pass
+    if 'end' in f: f['end'] += timedelta(days=1)  # end tính trọn ngày
+    if args.get('user'): f['user'] = args['user'].strip()
+    if args.get('session'): f['session'] = args['session'].strip()
+    return f
+
+def apply_filters(q, model, f):
+    if 'start' in f: q = q.filter(model.timestamp >= f['start'])
+    if 'end' in f: q = q.filter(model.timestamp < f['end'])
+    if 'user' in f: q = q.filter(User.username == f['user'])
+    if 'session' in f: q = q.filter(model.session_id == f['session'])
+    return q
+
+def message_rows(f):
+    q = db.session.query(Message.timestamp, Message.session_id, User.username, Message.sender, Message.content).join(User, Message.user_id == User.id)
+    return heapq.merge(apply_filters(q, Message, f).order_by(Message.timestamp.desc()).yield_per(BATCH_SIZE), archived_rows('m', f),
+                       key=row_time, reverse=True)
+
+def variable_log_rows(f):
+    q = db.session.query(VariableLog.timestamp, VariableLog.session_id, User.username, VariableLog.variable_name, VariableLog.variable_value).join(User, VariableLog.user_id == User.id)
+    return heapq.merge(apply_filters(q, VariableLog, f).order_by(VariableLog.timestamp.desc()).yield_per(BATCH_SIZE), archived_rows('l', f),
+                       key=row_time, reverse=True)
+
+def iter_csv(header, rows):
+    si = io.StringIO(); cw = csv.writer(si)
+    cw.writerow(header)
+    n = 0
+    for row in rows:
+        t = row[0].strftime('%Y-%m-%d %H:%M:%S') if row[0] else ""
+        cw.writerow([t, *row[1:]])
+        n += 1
+        if n % CHUNK_ROWS == 0:
+            yield si.getvalue().encode('utf-8')
+            si.seek(0); si.truncate(0)
+    if si.tell(): yield si.getvalue().encode('utf-8')
+
+def iter_gzip(chunks):
+    z = zlib.compressobj(6, zlib.DEFLATED, 31)  # wbits=31 -> định dạng gzip
+    for chunk in chunks:
+        out = z.compress(chunk)
+        if out: yield out
+    yield z.flush()
+
+def csv_response(filename, header, rows, use_gzip=False):
+    body = iter_csv(header, rows)
+    headers = {"Content-Disposition": f"attachment;filename={filename}"}
+    if use_gzip:
+        body = iter_gzip(body)
+        headers["Content-Disposition"] = f"attachment;filename={filename}.gz"
+        return Response(stream_with_context(body), mimetype="application/gzip", headers=headers)
+    return Response(stream_with_context(body), mimetype="text/csv", headers=headers)
+
+def export_request(filename, header, row_query):
+    f = parse_export_filters(request.args)
+    return csv_response(filename, header, row_query(f), use_gzip=request.args.get('gzip') == '1')
@@ -0,0 +1,67 @@
+from . import db
+from .models import User, Message, VariableLog, ChatSession
+from sqlalchemy import func, or_, and_
+from datetime import datetime
+
+# --- LỊCH SỬ CHAT: PHÂN TRANG KEYSET + TÓM TẮT PHIÊN ---
+
+def touch_session(user_id, sess_id, added, ts, logs=0, bot_type=None, thread_id=None):
+    # Cộng bộ đếm + cập nhật hoạt động cuối cho phiên (tạo mới nếu chưa có)
+    n = ChatSession.query.filter_by(id=sess_id).update({
+        ChatSession.message_count: ChatSession.message_count + added,
+        ChatSession.log_count: ChatSession.log_count + logs,
+        ChatSession.last_activity: ts,
+    }, synchronize_session=False)
+    if not n:
+        db.session.add(ChatSession(id=sess_id, user_id=user_id, bot_type=bot_type, thread_id=thread_id, created_at=ts,
+                                   last_activity=ts, message_count=added, log_count=logs))
+
+def set_session_thread(sess_id, thread_id):
+    if sess_id: ChatSession.query.filter_by(id=sess_id).update({ChatSession.thread_id: thread_id}, synchronize_session=False)
+
+def list_sessions(user_id, active_id):
+    sessions = ChatSession.query.filter_by(user_id=user_id, archive_file=None).order_by(ChatSession.last_activity.desc()).all()
+    return [{'id': s.id, 'name': s.last_activity.strftime('%d/%m %H:%M'), 'count': s.message_count, 'active': s.id == active_id} for s in sessions]
+
+def make_cursor(ts, row_id):
+    return f"{ts.isoformat()}|{row_id}"
+
+def encode_cursor(m):
+    return make_cursor(m.timestamp, m.id)
+
+def decode_cursor(cursor):
+    try:
+        ts, mid = cursor.rsplit('|', 1)
+        return datetime.fromisoformat(ts), int(mid)
+    except (ValueError, AttributeError):
+        return None
+
+def page_messages(user_id, sess_id, before=None, limit=30):
+    # Lấy `limit` tin nhắn mới nhất trước con trỏ (timestamp, id); trả về theo thứ tự tăng dần
+    q = Message.query.filter_by(user_id=user_id, session_id=sess_id)
+    cur = decode_cursor(before) if before else None
+    if cur:
+        ts, mid = cur
+        q = q.filter(or_(Message.timestamp < ts, and_(Message.timestamp == ts, Message.id < mid)))
+    rows = q.order_by(Message.timestamp.desc(), Message.id.desc()).limit(limit + 1).all()
+    has_more = len(rows) > limit
+    rows = rows[:limit][::-1]
+    return rows, (encode_cursor(rows[0]) if has_more and rows else None)
+
+def backfill_sessions():
+    # Dựng lại bảng phiên từ Message/VariableLog (dữ liệu cũ) - cùng logic với migration
+    existing = {sid for (sid,) in db.session.query(ChatSession.id)}
+    owners = {u.id: u for u in User.query.all()}
+    logs = dict(db.session.query(VariableLog.session_id, func.count(VariableLog.id)).group_by(VariableLog.session_id).all())
+    agg = db.session.query(Message.session_id, Message.user_id, func.min(Message.timestamp), func.max(Message.timestamp), func.count(Message.id)) \
+        .filter(Message.session_id.isnot(None)).group_by(Message.session_id, Message.user_id).all()
+    n = 0
+    for sid, uid, first, last, count in agg:
+        if sid in existing: continue
+        u = owners.get(uid)
+        db.session.add(ChatSession(id=sid, user_id=uid, bot_type=u.bot_type if u else None,
+                                   thread_id=u.current_thread_id if u and u.current_session_id == sid else None,
+                                   created_at=first, last_activity=last, message_count=count, log_count=logs.get(sid, 0)))
+        existing.add(sid); n += 1
+    db.session.commit()
+    return n
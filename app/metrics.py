@@ -0,0 +1,122 @@
+from flask import g, request, has_request_context
+from sqlalchemy import event
+import threading, time
+
+# --- ĐO ĐẠC THEO REQUEST ---
+# - Độ trễ từng endpoint (histogram), số câu SQL + tổng thời gian SQL theo endpoint
+# - Các pha có tên trong lượt chat: with span('run_poll'): ...
+# Xuất dạng text Prometheus ở /admin/metrics. SLOW_REQUEST_MS > 0: in request chậm kèm từng pha.
+
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+BACKGROUND = '_background'  # SQL chạy ngoài request (job nền, luồng ghi)
+
+class Histogram:
+    def __init__(self):
+        self.counts = [0] * (len(BUCKETS) + 1)
+        self.sum, self.n = 0.0, 0
+
+    def observe(self, v):
+        i = 0
+        while i < len(BUCKETS) and v > BUCKETS[i]: i += 1
+        self.counts[i] += 1
+        self.sum += v; self.n += 1
+
+_lock = threading.Lock()
+_requests = {}  # (endpoint, method, status) -> Histogram
+_phases = {}    # tên pha -> Histogram
+_sql = {}       # endpoint -> [số câu, tổng giây]
+
+def _current():
+    return g.get('_metrics') if has_request_context() else None
+
+class span:
+    # Đo 1 pha; ghi vào histogram chung và vào danh sách pha của request hiện tại (nếu có)
+    def __init__(self, name): self.name = name
+    def __enter__(self):
+        self.t0 = time.perf_counter()
+        return self
+    def __exit__(self, *exc):
+        dt = time.perf_counter() - self.t0
+        with _lock: _phases.setdefault(self.name, Histogram()).observe(dt)
+        m = _current()
+        if m is not None: m['phases'].append((self.name, dt))
+
+def _before_cursor(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault('_query_start', []).append(time.perf_counter())
+
+def _after_cursor(conn, cursor, statement, parameters, context, executemany):
+    stack = conn.info.get('_query_start')
+    if not stack: return
+    dt = time.perf_counter() - stack.pop()
+    m = _current()
+    if m is not None:
+        m['sql_n'] += 1; m['sql_t'] += dt
+    endpoint = (request.endpoint or 'unknown') if m is not None else BACKGROUND
+    with _lock:
+        s = _sql.setdefault(endpoint, [0, 0.0])
+        s[0] += 1; s[1] += dt
+
+def _start_request():
+    g._metrics = {'t0': time.perf_counter(), 'sql_n': 0, 'sql_t': 0.0, 'phases': []}
+
+def _finish_request(app):
+    def after(response):
+        m = g.pop('_metrics', None)
+        if m is None: return response
+        dt = time.perf_counter() - m['t0']
+        key = (request.endpoint or 'unknown', request.method, f"{response.status_code // 100}xx")
+        with _lock: _requests.setdefault(key, Histogram()).observe(dt)
+        slow_ms = app.config.get('SLOW_REQUEST_MS') or 0
+        if slow_ms and dt * 1000 >= slow_ms:
+            phases = ' '.join(f"{name}={t * 1000:.0f}ms" for name, t in m['phases'])
+            print(f"[SLOW] {request.method} {request.path} {response.status_code} {dt * 1000:.0f}ms "
+                  f"sql={m['sql_n']}/{m['sql_t'] * 1000:.0f}ms {phases}")
+        return response
+    return after
+
+def init_metrics(app, engine):
+    if not app.config.get('METRICS_ENABLED'): return
+    event.listen(engine, 'before_cursor_execute', _before_cursor)
+    event.listen(engine, 'after_cursor_execute', _after_cursor)
+    app.before_request(_start_request)
+    app.after_request(_finish_request(app))
+
+# --- XUẤT TEXT PROMETHEUS ---
+def _esc(v):
+    return str(v).replace('\\', '\\\\').replace('"', '\\"')
+
+def _labels(**kw):
+    return '{' + ','.join(f'{k}="{_esc(v)}"' for k, v in kw.items()) + '}'
+
+def _histogram_lines(name, h, **labels):
+    out, acc = [], 0
+    for le, c in zip([*BUCKETS, '+Inf'], h.counts):
+        acc += c
+        out.append(f"{name}_bucket{_labels(**labels, le=le)} {acc}")
+    out.append(f"{name}_sum{_labels(**labels)} {h.sum:.6f}")
+    out.append(f"{name}_count{_labels(**labels)} {h.n}")
+    return out
+
+def render_metrics(extra=None):
+    # extra: {tên: giá trị} thêm vào dạng gauge (vd. thống kê Assistant)
+    with _lock:
+        reqs = sorted(_requests.items()); phases = sorted(_phases.items()); sql = sorted(_sql.items())
+        lines = ['# HELP chatbot_request_duration_seconds Độ trễ request theo endpoint.',
+                 '# TYPE chatbot_request_duration_seconds histogram']
+        for (endpoint, method, status), h in reqs:
+            lines += _histogram_lines('chatbot_request_duration_seconds', h, endpoint=endpoint, method=method, status=status)
+        lines += ['# HELP chatbot_phase_duration_seconds Thời gian từng pha trong lượt chat.',
+                  '# TYPE chatbot_phase_duration_seconds histogram']
+        for name, h in phases:
+            lines += _histogram_lines('chatbot_phase_duration_seconds', h, phase=name)
+        lines += ['# HELP chatbot_sql_statements_total Số câu SQL theo endpoint.', '# TYPE chatbot_sql_statements_total counter']
+        lines += [f"chatbot_sql_statements_total{_labels(endpoint=e)} {n}" for e, (n, _) in sql]
+        lines += ['# HELP chatbot_sql_duration_seconds_total Tổng thời gian SQL theo endpoint.', '# TYPE chatbot_sql_duration_seconds_total counter']
+        lines += [f"chatbot_sql_duration_seconds_total{_labels(endpoint=e)} {t:.6f}" for e, (_, t) in sql]
+    for k, v in (extra or {}).items():
+        lines += [f'# TYPE chatbot_{k} gauge', f"chatbot_{k} {v}"]
+    return '\n'.join(lines) + '\n'
+
+def reset_metrics():
+    with _lock:
+        _requests.clear(); _phases.clear(); _sql.clear()
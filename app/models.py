@@ -22,6 +22,8 @@ class User(UserMixin, db.Model):
         return check_password_hash(self.password_hash, password)
 
 class Message(db.Model):
+    # Index ghép cho các truy vấn nóng: filter_by(user_id, session_id) + sắp xếp theo thời gian
+    __table_args__ = (db.Index('ix_message_user_session_ts', 'user_id', 'session_id', 'timestamp'),)
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'))
     session_id = db.Column(db.String(50))
@@ -30,9 +32,84 @@ class Message(db.Model):
     timestamp = db.Column(db.DateTime, index=True, default=datetime.utcnow)
 
 class VariableLog(db.Model):
+    __table_args__ = (db.Index('ix_variable_log_user_session_ts', 'user_id', 'session_id', 'timestamp'),
+                      db.Index('ix_variable_log_user_var', 'user_id', 'variable_name'))
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'))
     session_id = db.Column(db.String(50))
     variable_name = db.Column(db.String(100))
     variable_value = db.Column(db.Text)
     timestamp = db.Column(db.DateTime, default=datetime.utcnow)
+
+class ChatJob(db.Model):
+    # Lượt chat chạy nền (chế độ CHAT_ASYNC) - trạng thái dùng chung giữa các worker
+    id = db.Column(db.String(36), primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), index=True)
+    session_id = db.Column(db.String(50))
+    status = db.Column(db.String(20), default='pending')
+    response = db.Column(db.Text, nullable=True)
+    created_at = db.Column(db.DateTime, index=True, default=datetime.utcnow)
+
+class ChatSession(db.Model):
+    # Phiên chat: chủ sở hữu, loại bot, thread OpenAI, thời gian và bộ đếm (cập nhật khi lưu tin nhắn)
+    __tablename__ = 'chat_session'
+    __table_args__ = (db.Index('ix_chat_session_user_activity', 'user_id', 'last_activity'),)
+    id = db.Column(db.String(50), primary_key=True)  # = Message.session_id
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), index=True)
+    bot_type = db.Column(db.String(20), nullable=True)
+    thread_id = db.Column(db.String(100), nullable=True)
+    created_at = db.Column(db.DateTime, nullable=True)
+    last_activity = db.Column(db.DateTime, index=True)
+    message_count = db.Column(db.Integer, default=0)
+    log_count = db.Column(db.Integer, default=0)
+    # Phiên đã lưu trữ: tin nhắn/log nằm trong file nén <archive_file>, đoạn [offset, offset+length)
+    archive_file = db.Column(db.String(20), nullable=True)
+    archive_offset = db.Column(db.BigInteger, nullable=True)
+    archive_length = db.Column(db.Integer, nullable=True)
+
+class VariableRollup(db.Model):
+    # Tổng hợp VariableLog theo (user, phiên, biến, ngày); giá trị số được cộng dồn để tính nhanh
+    __tablename__ = 'variable_rollup'
+    __table_args__ = (db.Index('ix_variable_rollup_var_day', 'variable_name', 'day'),)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), primary_key=True)
+    session_id = db.Column(db.String(50), primary_key=True)
+    variable_name = db.Column(db.String(100), primary_key=True)
+    day = db.Column(db.Date, primary_key=True)
+    n = db.Column(db.Integer, default=0)            # số lần ghi
+    n_numeric = db.Column(db.Integer, default=0)    # số lần ghi là số
+    total = db.Column(db.Float, default=0.0)
+    min_value = db.Column(db.Float, nullable=True)
+    max_value = db.Column(db.Float, nullable=True)
+    last_value = db.Column(db.Text, nullable=True)
+    last_numeric = db.Column(db.Float, nullable=True)
+    last_at = db.Column(db.DateTime, nullable=True)
+
+class AnalyticsState(db.Model):
+    # Mốc VariableLog.id đã gộp vào rollup (chế độ compaction)
+    __tablename__ = 'analytics_state'
+    key = db.Column(db.String(50), primary_key=True)
+    last_id = db.Column(db.Integer, default=0)
+
+class PurgeJob(db.Model):
+    # Xóa hàng loạt chạy nền: lưu tiến độ để xem từ worker bất kỳ và chạy tiếp nếu bị ngắt
+    __tablename__ = 'purge_job'
+    id = db.Column(db.String(36), primary_key=True)
+    user_ids = db.Column(db.Text)                      # JSON: danh sách id cần xóa
+    status = db.Column(db.String(20), default='pending', index=True)
+    users_total = db.Column(db.Integer, default=0)
+    users_done = db.Column(db.Integer, default=0)
+    rows_deleted = db.Column(db.Integer, default=0)
+    error = db.Column(db.Text, nullable=True)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+class ResponseCache(db.Model):
+    # Câu trả lời GOFAI đã có, theo (bot_type, assistant_id, câu hỏi đã chuẩn hóa) - xem app/response_cache.py
+    __tablename__ = 'response_cache'
+    key = db.Column(db.String(64), primary_key=True)  # sha256
+    bot_type = db.Column(db.String(20))
+    assistant_id = db.Column(db.String(100))
+    prompt = db.Column(db.Text)
+    response = db.Column(db.Text)
+    latency = db.Column(db.Float, default=0.0)         # thời gian run gốc (giây)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, index=True)
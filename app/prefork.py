@@ -0,0 +1,34 @@
+from . import db
+import atexit, gc, os
+
+# --- GUNICORN PRELOAD (xem gunicorn.conf.py, wsgi.py) ---
+# Master nạp app 1 lần: import module, biên dịch sẵn template Jinja, rồi fork các worker
+# (bộ nhớ dùng chung copy-on-write). Những thứ không được dùng chung qua fork — kết nối DB,
+# pool HTTP của client OpenAI, luồng ghi trễ, hàng đợi lượt chat — được tạo lại trong after_fork.
+
+def warm_app(app):
+    # Chạy ở master (preload) hoặc ở từng worker khi tắt preload
+    for name in app.jinja_env.list_templates():
+        if name.endswith('.html'): app.jinja_env.get_template(name)
+    if os.environ.get('OPENAI_API_KEY'):
+        import openai  # chỉ nạp module (~0.5s) cho worker dùng chung; client tạo sau fork
+    with app.app_context():
+        for engine in db.engines.values(): engine.dispose()  # không để worker thừa hưởng kết nối của master
+    # Đưa object hiện có ra khỏi GC: worker không ghi vào các trang nhớ dùng chung khi GC quét
+    gc.freeze()
+
+def after_fork(app):
+    # Chạy trong worker ngay sau fork (hook post_fork)
+    with app.app_context():
+        for engine in db.engines.values(): engine.dispose(close=False)  # bỏ pool cũ, không đóng socket của master
+
+    from .assistant import init_assistant
+    init_assistant(app)  # client OpenAI + pool HTTP tạo lại ở lượt gọi đầu tiên
+
+    from .write_queue import init_write_queue
+    wq = app.extensions.pop('write_queue', None)
+    if wq: atexit.unregister(wq.flush)  # luồng ghi của master không có trong worker
+    init_write_queue(app)
+
+    from .admission import init_admission
+    init_admission(app)
@@ -0,0 +1,124 @@
+from flask import current_app
+from . import db
+from .models import User, Message, VariableLog, ChatSession, ChatJob, VariableRollup, PurgeJob
+from .user_cache import invalidate_user
+from .archive import drop_archived_messages, scrub_user_archives
+from sqlalchemy import select
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+import json, threading, time, traceback, uuid
+
+# --- XÓA HÀNG LOẠT THEO KHỐI ---
+# DELETE ... WHERE user_id IN (...) theo từng nhóm user, mỗi lần tối đa PURGE_ROW_BATCH dòng,
+# commit sau mỗi lô nên khóa ghi SQLite chỉ giữ trong thời gian ngắn, lượt chat vẫn chen vào được.
+# Xóa lặp lại là an toàn, nên job bị ngắt (restart worker) chạy tiếp bằng `flask purge resume`.
+
+# Bảng con xóa trước, User xóa cuối cùng
+CHILD_TABLES = [ChatJob, ChatSession, VariableRollup, VariableLog, Message]
+
+_executor = None
+_lock = threading.Lock()
+
+def get_executor():
+    global _executor
+    with _lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='purge')  # 1 job mỗi lúc
+    return _executor
+
+def delete_in_batches(model, cond, batch, pause=0):
+    # Trả về số dòng đã xóa; mỗi lô 1 transaction
+    t = model.__table__
+    pk = list(t.primary_key.columns)
+    total = 0
+    while True:
+        if len(pk) == 1:
+            stmt = t.delete().where(pk[0].in_(select(pk[0]).where(cond).limit(batch)))
+        else:
+            stmt = t.delete().where(cond)  # bảng khóa ghép (rollup) nhỏ: xóa một lần
+        n = db.session.execute(stmt).rowcount or 0
+        db.session.commit()
+        total += n
+        if n < batch or len(pk) != 1: return total
+        if pause: time.sleep(pause)
+
+def purge_user_chunk(ids, batch, pause=0, admins=False):
+    # ids đã lọc bằng purgeable_ids (job hàng loạt); admins=True: xóa 1 tài khoản bất kỳ (/admin/delete)
+    scrub_user_archives(ids)  # phiên đã lưu trữ: xóa member trong file trước khi mất chỉ mục
+    n = 0
+    for model in CHILD_TABLES:
+        n += delete_in_batches(model, model.user_id.in_(ids), batch, pause)
+    cond = User.id.in_(ids) if admins else User.id.in_(ids) & (User.is_admin == False)
+    n += delete_in_batches(User, cond, batch, pause)
+    # Lượt chat ghi chen vào trước khi xóa User (worker khác còn cache user): quét lại bảng con.
+    # Sau bước này write_turn từ chối ghi cho user không còn tồn tại
+    for model in CHILD_TABLES:
+        n += delete_in_batches(model, model.user_id.in_(ids) & model.user_id.not_in(select(User.id)), batch, pause)
+    invalidate_user(*ids)  # DELETE hàng loạt không qua sự kiện ORM
+    return n
+
+def purge_session(user_id, sess_id):
+    # Xóa 1 phiên chat (tin nhắn + tóm tắt phiên); VariableLog giữ lại cho giáo viên.
+    # Phiên đã lưu trữ: dòng chat_session còn là chỉ mục tới phần log nên được giữ, chỉ bỏ tin nhắn khỏi file
+    s = ChatSession.query.filter_by(user_id=user_id, id=sess_id).first()
+    if s is not None and s.archive_file: return drop_archived_messages(s)
+    cfg = current_app.config
+    n = delete_in_batches(Message, (Message.user_id == user_id) & (Message.session_id == sess_id), cfg['PURGE_ROW_BATCH'], cfg['PURGE_PAUSE'])
+    return n + delete_in_batches(ChatSession, (ChatSession.user_id == user_id) & (ChatSession.id == sess_id), 1)
+
+def purgeable_ids(user_ids):
+    # Chỉ tài khoản học sinh (Admin không bị xóa hàng loạt), 1 truy vấn IN
+    ids = sorted({int(i) for i in user_ids})
+    return sorted(db.session.scalars(select(User.id).where(User.id.in_(ids), User.is_admin == False)))
+
+def create_purge_job(user_ids):
+    ids = sorted({int(i) for i in user_ids})
+    job = PurgeJob(id=str(uuid.uuid4()), user_ids=json.dumps(ids), users_total=len(ids), status='pending')
+    db.session.add(job)
+    db.session.commit()
+    return job
+
+def run_purge_job(job_id):
+    cfg = current_app.config
+    chunk, batch, pause = cfg['PURGE_USER_CHUNK'], cfg['PURGE_ROW_BATCH'], cfg['PURGE_PAUSE']
+    job = db.session.get(PurgeJob, job_id)
+    if job is None or job.status == 'done': return job
+    ids = json.loads(job.user_ids)
+    job.status = 'running'; job.updated_at = datetime.utcnow()
+    db.session.commit()
+    try:
+        while job.users_done < len(ids):
+            part = ids[job.users_done:job.users_done + chunk]
+            deleted = purge_user_chunk(part, batch, pause)
+            job.users_done += len(part); job.rows_deleted += deleted; job.updated_at = datetime.utcnow()
+            db.session.commit()
+        job.status = 'done'
+    except Exception as e:
+        print(f"Purge job error: {e}")
+        traceback.print_exc()
+        db.session.rollback()
+        job = db.session.get(PurgeJob, job_id)
+        job.status, job.error = 'error', str(e)[:500]
+    job.updated_at = datetime.utcnow()
+    db.session.commit()
+    return job
+
+def _run_in_background(app, job_id):
+    with app.app_context():
+        try: run_purge_job(job_id)
+        finally: db.session.remove()
+
+def start_purge(app, user_ids):
+    job = create_purge_job(user_ids)
+    get_executor().submit(_run_in_background, app, job.id)
+    return job
+
+def resume_purges():
+    # Chạy tiếp các job còn dở (pending/running/error); trả về danh sách job
+    jobs = PurgeJob.query.filter(PurgeJob.status != 'done').order_by(PurgeJob.created_at).all()
+    return [run_purge_job(j.id) for j in jobs]
+
+def purge_status(job):
+    return {'id': job.id, 'status': job.status, 'users_total': job.users_total, 'users_done': job.users_done,
+            'rows_deleted': job.rows_deleted, 'error': job.error,
+            'progress': round(job.users_done / job.users_total, 3) if job.users_total else 1.0}
@@ -0,0 +1,181 @@
+from flask import current_app
+from . import db
+from .models import ResponseCache
+from .analytics import dialect_insert
+from sqlalchemy import select
+from collections import OrderedDict
+from datetime import datetime, timedelta
+import hashlib, re, threading, time, unicodedata
+
+# --- CACHE CÂU TRẢ LỜI GOFAI ---
+# Học sinh GOFAI cùng lớp hỏi gần như y hệt nhau (cùng phiếu bài tập). Bật GOFAI_CACHE=1 thì
+# câu hỏi (đã chuẩn hóa) trùng sẽ dùng lại câu trả lời, không chạy Assistants run mới.
+# - Khóa: bot_type + assistant_id + câu hỏi chuẩn hóa (đổi assistant -> cache tự mất hiệu lực)
+# - LRU + TTL trong process, bảng response_cache trong DB để giữ qua lần restart worker
+# - Single-flight: N câu hỏi giống nhau cùng lúc trong 1 worker chỉ gọi 1 run (cả luồng thường lẫn
+#   stream: lượt theo sau chờ lượt dẫn đầu rồi nhận cả câu trả lời 1 lần)
+# Message/VariableLog vẫn được ghi như bình thường (Turn.add_reply dùng câu trả lời đầy đủ).
+# Lưu ý: lượt dùng cache không được thêm vào thread OpenAI của học sinh.
+
+UPLOAD_MARK = "[User uploaded:"
+
+def normalize_prompt(text):
+    text = unicodedata.normalize('NFC', text or '').casefold()
+    return re.sub(r'\s+', ' ', text).strip()
+
+def cacheable(bot_type, user_message):
+    return (bot_type == 'gofai' and current_app.config.get('GOFAI_CACHE')
+            and user_message and UPLOAD_MARK not in user_message)
+
+def cache_key(bot_type, assistant_id, user_message):
+    return hashlib.sha256(f"{bot_type}\x00{assistant_id}\x00{normalize_prompt(user_message)}".encode('utf-8')).hexdigest()
+
+class _Flight:
+    def __init__(self):
+        self.event = threading.Event()
+        self.result, self.latency = None, 0.0
+
+class ResponseCacheStore:
+    def __init__(self, maxsize=2000, ttl=86400):
+        self.maxsize, self.ttl = maxsize, ttl
+        self.data = OrderedDict()  # key -> (stored_at, response, latency)
+        self.flights = {}          # key -> _Flight đang chạy
+        self.lock = threading.Lock()
+        self.stats = {'hits': 0, 'db_hits': 0, 'misses': 0, 'coalesced': 0, 'stores': 0, 'saved_seconds': 0.0}
+        self._stores_since_prune = 0
+
+    def _hit(self, key, latency, db_hit=False):
+        self.stats['hits'] += 1
+        if db_hit: self.stats['db_hits'] += 1
+        self.stats['saved_seconds'] += latency or 0
+
+    def _remember(self, key, stored_at, response, latency):
+        self.data[key] = (stored_at, response, latency)
+        self.data.move_to_end(key)
+        while len(self.data) > self.maxsize: self.data.popitem(last=False)
+
+    def _lookup_memory(self, key):
+        entry = self.data.get(key)
+        if entry and time.time() - entry[0] < self.ttl:
+            self.data.move_to_end(key)
+            return entry
+        if entry: del self.data[key]
+        return None
+
+    def _lookup_db(self, key):
+        # Kết nối ngắn, trả lại pool ngay: các request đang chờ single-flight không giữ kết nối,
+        # và không autoflush tin nhắn User đang chờ của request
+        t = ResponseCache.__table__
+        try:
+            with db.engine.connect() as conn:
+                row = conn.execute(select(t.c.response, t.c.latency, t.c.created_at).where(t.c.key == key)).first()
+        except Exception as e:
+            print(f"Response cache read error: {e}")
+            return None
+        if row is None or row.created_at < datetime.utcnow() - timedelta(seconds=self.ttl): return None
+        stored_at = time.time() - (datetime.utcnow() - row.created_at).total_seconds()
+        return stored_at, row.response, row.latency
+
+    def _persist(self, key, bot_type, assistant_id, user_message, response, latency):
+        # Transaction riêng, ngắn: không dính vào transaction lượt chat (có thể bị rollback/ghi trễ)
+        t = ResponseCache.__table__
+        row = {'key': key, 'bot_type': bot_type, 'assistant_id': assistant_id, 'prompt': normalize_prompt(user_message),
+               'response': response, 'latency': latency, 'created_at': datetime.utcnow()}
+        try:
+            stmt = dialect_insert()(t).values(**row)
+            stmt = stmt.on_conflict_do_update(index_elements=[t.c.key], set_={k: stmt.excluded[k] for k in row if k != 'key'})
+            with db.engine.begin() as conn:
+                conn.execute(stmt)
+                self._stores_since_prune += 1
+                if self._stores_since_prune >= 100:
+                    self._stores_since_prune = 0
+                    conn.execute(t.delete().where(t.c.created_at < datetime.utcnow() - timedelta(seconds=self.ttl)))
+        except Exception as e:
+            print(f"Response cache write error: {e}")
+
+    def get(self, key):
+        # Chỉ tra cache (bộ nhớ -> DB), không gọi run. Trả về câu trả lời hoặc None
+        with self.lock:
+            entry = self._lookup_memory(key)
+            if entry:
+                self._hit(key, entry[2])
+                return entry[1]
+        entry = self._lookup_db(key)
+        with self.lock:
+            if entry:
+                self._remember(key, *entry)
+                self._hit(key, entry[2], db_hit=True)
+                return entry[1]
+            self.stats['misses'] += 1
+        return None
+
+    def put(self, key, bot_type, assistant_id, user_message, response, latency):
+        with self.lock:
+            self._remember(key, time.time(), response, latency)
+            self.stats['stores'] += 1
+        self._persist(key, bot_type, assistant_id, user_message, response, latency)
+
+    def join(self, key):
+        # Vào single-flight của key -> (flight, True nếu là lượt dẫn đầu: phải gọi land() khi xong)
+        with self.lock:
+            flight = self.flights.get(key)
+            if flight is None:
+                flight = self.flights[key] = _Flight()
+                return flight, True
+            self.stats['coalesced'] += 1
+            return flight, False
+
+    def wait(self, key, flight, timeout):
+        # Lượt theo sau: chờ lượt dẫn đầu -> câu trả lời, hoặc None nếu lượt dẫn đầu lỗi/quá hạn
+        if flight.event.wait(timeout) and flight.result is not None:
+            with self.lock:
+                self.stats['misses'] -= 1  # được phục vụ từ run của lượt dẫn đầu
+                self._hit(key, flight.latency)
+            return flight.result
+        return None
+
+    def land(self, key, flight, response=None, latency=0.0, meta=None):
+        # Lượt dẫn đầu xong: lưu cache (response=None: lỗi, không lưu), đánh thức lượt theo sau.
+        # meta = (bot_type, assistant_id, user_message)
+        try:
+            if response is not None:
+                flight.latency = latency
+                self.put(key, *meta, response, latency)
+                flight.result = response
+        finally:
+            with self.lock: self.flights.pop(key, None)
+            flight.event.set()
+
+    def get_or_compute(self, key, bot_type, assistant_id, user_message, compute, wait_timeout):
+        # compute() -> (câu trả lời, có lưu cache được không)
+        cached = self.get(key)
+        if cached is not None: return cached
+        flight, leader = self.join(key)
+        if not leader:
+            result = self.wait(key, flight, wait_timeout)
+            return result if result is not None else compute()[0]  # lượt dẫn đầu lỗi/quá hạn: tự chạy
+        response, ok, start = None, False, time.monotonic()
+        try:
+            response, ok = compute()
+            return response
+        finally:
+            self.land(key, flight, response if ok else None, time.monotonic() - start, (bot_type, assistant_id, user_message))
+
+    def clear(self):
+        with self.lock: self.data.clear()
+        ResponseCache.query.delete()
+        db.session.commit()
+
+    def get_stats(self):
+        with self.lock:
+            s = dict(self.stats, size=len(self.data), inflight=len(self.flights))
+        total = s['hits'] + s['misses']
+        s['hit_rate'] = round(s['hits'] / total, 3) if total else 0
+        s['saved_seconds'] = round(s['saved_seconds'], 2)
+        return s
+
+response_cache = ResponseCacheStore()
+
+def init_response_cache(app):
+    response_cache.maxsize = app.config['GOFAI_CACHE_SIZE']
+    response_cache.ttl = app.config['GOFAI_CACHE_TTL']
@@ -1,20 +1,30 @@
-from flask import Blueprint, render_template, redirect, url_for, flash, request, jsonify, session, Response, current_app
+from flask import Blueprint, render_template, redirect, url_for, flash, request, jsonify, Response, current_app, stream_with_context, send_file, send_from_directory, abort
 from flask_login import login_user, logout_user, login_required, current_user
 from functools import wraps
 from werkzeug.utils import secure_filename
-from sqlalchemy import func, desc
 from . import db
-from .models import User, Message, VariableLog
+from .models import User, ChatSession, PurgeJob
+from .assistant import get_client, get_assistant_response, stream_assistant_response, visible_prefix, get_stats, AssistantBusy, BUSY_MESSAGE
+from .chat_jobs import submit_chat_job, wait_for_job, backlog
+from .exports import export_request, message_rows, variable_log_rows
+from .user_import import decode_csv, import_users
+from .history import list_sessions, page_messages
+from .transcript import Turn, UserGone, save_turn
+from .user_cache import user_cache, invalidate_user
+from .response_cache import response_cache
+from .uploads import store_upload, stored_path, upload_html
+from .admin_data import user_page, history_page, log_page
+from .analytics import student_summary, class_summary
+from .purge import purge_session, purge_user_chunk, purgeable_ids, start_purge, purge_status
+from .metrics import span, render_metrics
+from .admission import get_admission, Rejected
 from .forms import LoginForm, UserForm, UploadCSVForm, ChangePasswordForm, ResetPasswordForm
-import openai, csv, io, uuid, time, json, os, traceback
-from datetime import datetime, timedelta
+import uuid, json, os, hmac
+from datetime import datetime
 
 main = Blueprint('main', __name__)
 
 # --- HÀM HỖ TRỢ ---
-def get_vietnam_time():
-    return datetime.utcnow() + timedelta(hours=7)
-
 def allowed_file(filename):
     return '.' in filename and filename.rsplit('.', 1)[1].lower() in {'png', 'jpg', 'jpeg', 'gif', 'pdf', 'docx', 'doc', 'txt'}
 
@@ -27,107 +37,146 @@ def admin_required(f):
         return f(*args, **kwargs)
     return decorated_function
 
-# --- GỌI OPENAI ---
-def get_assistant_response(user_message, bot_type):
-    try:
-        api_key = os.environ.get('OPENAI_API_KEY')
-        assistant_id = os.environ.get('CHATBOT_AI_ID') if bot_type == 'ai' else os.environ.get('CHATBOT_GOFAI_ID')
-        
-        if not api_key or not assistant_id: return "Lỗi: Chưa cấu hình API Key."
-        
-        openai.api_key = api_key
-        client = openai
-        
-        thread_id = current_user.current_thread_id
-        if not thread_id:
-            thread = client.beta.threads.create()
-            thread_id = thread.id
-            current_user.current_thread_id = thread_id
-            db.session.commit()
-        
-        client.beta.threads.messages.create(thread_id=thread_id, role="user", content=user_message)
-        run = client.beta.threads.runs.create(thread_id=thread_id, assistant_id=assistant_id)
-        
-        while run.status in ['queued', 'in_progress']:
-            time.sleep(0.5)
-            run = client.beta.threads.runs.retrieve(thread_id=thread_id, run_id=run.id)
-            
-        if run.status == 'completed':
-            msgs = client.beta.threads.messages.list(thread_id=thread_id)
-            return msgs.data[0].content[0].text.value
-        return "AI không phản hồi."
-    except Exception as e:
-        print(f"AI Error: {e}")
-        return "Hệ thống bận."
-
 # --- XỬ LÝ CHAT (ĐÃ FIX LỖI DATABASE) ---
-def handle_chat_logic(bot_type_check):
+def save_user_turn(bot_type_check):
+    # Kiểm tra quyền, lưu file, tạo lượt chat (chưa ghi DB). Trả về (lỗi, Turn, nội dung gửi AI)
     if not current_user.is_admin and current_user.bot_type != bot_type_check:
-        return jsonify({'response': "Sai loại bot."}), 403
+        return (jsonify({'response': "Sai loại bot."}), 403), None, None
 
     user_text = request.form.get('user_input', '').strip()
     file = request.files.get('file')
     
+    # Phiên mới: id được ghi vào User cùng transaction với lượt chat
     sess_id = current_user.current_session_id
-    if not sess_id:
-        sess_id = str(uuid.uuid4())
-        current_user.current_session_id = sess_id
-        db.session.commit()
+    new_session = not sess_id
+    if new_session: sess_id = str(uuid.uuid4())
 
     file_html = ""
     file_msg = ""
     if file and allowed_file(file.filename):
         filename = secure_filename(file.filename)
-        save_path = os.path.join(current_app.config['UPLOAD_FOLDER'], filename)
-        file.save(save_path)
+        with span('upload'): stored = store_upload(file, current_app.config['UPLOAD_FOLDER'])
         file_msg = f"\n[User uploaded: {filename}]"
-        if filename.lower().endswith(('.png', '.jpg', '.jpeg', '.gif')):
-            file_html = f'<br><img src="/static/uploads/{filename}" style="max-width:200px; border-radius:10px;">'
-        else:
-            file_html = f'<br><a href="/static/uploads/{filename}" target="_blank">File: {filename}</a>'
-
-    if not user_text and not file: return jsonify({'response': ""}), 400
-
-    # 1. Lưu tin nhắn User (Sửa author -> user_id)
-    user_msg = Message(
-        sender='user', 
-        content=user_text + file_html, 
-        user_id=current_user.id, # <--- SỬA LỖI TẠI ĐÂY
-        session_id=sess_id, 
-        timestamp=get_vietnam_time()
-    )
-    db.session.add(user_msg)
-
-    # 2. Gọi AI
-    full_resp = get_assistant_response(user_text + file_msg, bot_type_check)
-
-    # 3. Tách JSON
-    ui_text = full_resp 
-    try:
-        if "```json" in full_resp:
-            parts = full_resp.split("```json")
-            ui_text = parts[0].strip()
-            
-            json_str = parts[1].split("```")[0].replace("LOG_DATA =", "").strip()
-            if json_str:
-                data = json.loads(json_str)
-                for k, v in data.items():
-                    db.session.add(VariableLog(user_id=current_user.id, session_id=sess_id, variable_name=str(k), variable_value=str(v), timestamp=get_vietnam_time()))
-    except: pass
+        file_html = upload_html(stored, filename)
+
+    if not user_text and not file: return (jsonify({'response': ""}), 400), None, None
+
+    # 1. Tin nhắn User (ghi cùng câu trả lời, xem app/transcript.py)
+    turn = Turn(current_user.id, sess_id, bot_type_check, current_user.current_thread_id, new_session=new_session)
+    turn.add_user_message(user_text + file_html)
+
+    return None, turn, user_text + file_msg
+
+def release_connection():
+    # Trả kết nối DB về pool trong lúc chờ AI (vài giây): tránh cạn pool khi nhiều học sinh chờ cùng lúc
+    db.session.rollback()
+
+ADMISSION_MESSAGES = {
+    'inflight': "Em đợi câu trả lời trước xong đã nhé.",
+    'user_rate': "Em gửi hơi nhanh, chờ vài giây rồi hỏi tiếp nhé.",
+}
+
+def admission_response(e):
+    # Lượt chat bị từ chối: 429 (do chính user) hoặc 503 (hệ thống bận), kèm Retry-After nếu biết
+    msg = ADMISSION_MESSAGES.get(e.reason, BUSY_MESSAGE)
+    resp = jsonify({'response': msg, 'busy': True, 'reason': e.reason})
+    resp.status_code = 429 if e.reason in ('inflight', 'user_rate') else 503
+    if e.retry_after: resp.headers['Retry-After'] = str(max(1, int(e.retry_after + 0.999)))
+    return resp
+
+def admit(turn):
+    # Vào hàng: 1 lượt/user, giới hạn tốc độ, hàng đợi công bằng (không giữ kết nối DB khi chờ).
+    # CHAT_ASYNC: không chờ trong request, job nền tự xếp hàng. -> hàm trả chỗ; lỗi Rejected
+    release_connection()
+    adm = get_admission()
+    if adm is None: return lambda: None
+    ticket = adm.enter(turn.user_id, backlog=backlog() if current_app.config.get('CHAT_ASYNC') else None)
+    return lambda: adm.leave(ticket)
 
-    # 4. Lưu Bot (Sửa author -> user_id)
-    bot_msg = Message(
-        sender='assistant', 
-        content=ui_text, 
-        user_id=current_user.id, # <--- SỬA LỖI TẠI ĐÂY
-        session_id=sess_id, 
-        timestamp=get_vietnam_time()
-    )
-    db.session.add(bot_msg)
-    db.session.commit()
+def handle_chat_logic(bot_type_check):
+    err, turn, ai_message = save_user_turn(bot_type_check)
+    if err: return err
+    try: leave = admit(turn)
+    except Rejected as e: return admission_response(e)
+
+    # 2. Chế độ bất đồng bộ: trả job_id ngay; job ghi cả lượt khi có câu trả lời (và trả chỗ khi chạy xong)
+    if current_app.config.get('CHAT_ASYNC'):
+        try:
+            job_id = submit_chat_job(current_app._get_current_object(), turn.user_id, turn, ai_message, bot_type_check, on_done=leave)
+        except Exception:
+            leave()
+            raise
+        return jsonify({'job_id': job_id, 'status': 'pending', 'status_url': url_for('main.chat_job_status', job_id=job_id)}), 202
+
+    try: return run_chat_turn(turn, bot_type_check, ai_message)
+    finally: leave()
 
+def run_chat_turn(turn, bot_type_check, ai_message):
+    # 3. Gọi AI (hết chỗ run đồng thời -> báo bận, không lưu lượt chat)
+    try:
+        with span('assistant'): full_resp = get_assistant_response(ai_message, bot_type_check, turn)
+    except AssistantBusy:
+        return jsonify({'response': BUSY_MESSAGE, 'busy': True}), 503
+
+    # 4. Tách JSON + lưu cả lượt (tin User + Bot + biến + phiên) trong 1 transaction
+    ui_text = turn.add_reply(full_resp)
+    with span('save_reply'): save_turn(turn)
     return jsonify({'response': ui_text})
 
+@main.errorhandler(UserGone)
+def user_gone(e):
+    # Tài khoản bị Admin xóa giữa chừng: bỏ bản chụp cache, đăng xuất
+    db.session.rollback()
+    invalidate_user(*e.args)
+    logout_user()
+    return jsonify({'response': "Tài khoản không còn tồn tại.", 'redirect': url_for('main.login')}), 401
+
+def sse(event, payload):
+    return f"event: {event}\ndata: {json.dumps(payload, ensure_ascii=False)}\n\n"
+
+def handle_chat_stream(bot_type_check):
+    # Giống handle_chat_logic nhưng đẩy từng delta về trình duyệt qua Server-Sent Events
+    err, turn, ai_message = save_user_turn(bot_type_check)
+    if err: return err
+    try: leave = admit(turn)
+    except Rejected as e: return admission_response(e)
+    # Giữ chỗ run trước khi ghi gì: hết chỗ -> 503 như luồng thường, không lưu lượt chat
+    try: deltas = stream_assistant_response(ai_message, bot_type_check, turn)
+    except AssistantBusy:
+        leave()
+        return jsonify({'response': BUSY_MESSAGE, 'busy': True}), 503
+    # Ghi ngay tin nhắn User: trình duyệt có thể ngắt giữa lúc stream
+    try: save_turn(turn)
+    except Exception:
+        deltas.close(); leave()
+        raise
+
+    def generate():
+        full_resp, sent = "", 0
+        try:
+            for delta in deltas:
+                full_resp += delta
+                visible = visible_prefix(full_resp)
+                if len(visible) > sent:
+                    yield sse('delta', {'text': visible[sent:]})
+                    sent = len(visible)
+        except AssistantBusy:
+            # Chờ câu hỏi trùng thất bại rồi hết chỗ run: báo bận, không lưu câu trả lời
+            yield sse('done', {'response': BUSY_MESSAGE, 'busy': True})
+            return
+        # Stream xong: tách LOG_DATA và lưu như luồng thường
+        ui_text = turn.add_reply(full_resp)
+        save_turn(turn)
+        yield sse('done', {'response': ui_text})
+
+    resp = Response(stream_with_context(generate()), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+    def on_close():
+        # Chạy cả khi trình duyệt ngắt giữa chừng: trả chỗ run + chỗ trong hàng đợi lượt chat
+        deltas.close(); leave()
+    resp.call_on_close(on_close)
+    return resp
+
 # --- ROUTE ---
 @main.route('/')
 def index(): return redirect(url_for('main.login'))
@@ -164,12 +213,13 @@ def render_chat_page(bot_type, bot_name):
     sess_id = current_user.current_session_id
     if not sess_id: sess_id = str(uuid.uuid4()); current_user.current_session_id = sess_id; db.session.commit()
     
-    hist = Message.query.filter_by(user_id=current_user.id, session_id=sess_id).order_by(Message.timestamp.asc()).all()
-    sessions = db.session.query(Message.session_id, func.max(Message.timestamp)).filter_by(user_id=current_user.id).group_by(Message.session_id).order_by(desc(func.max(Message.timestamp))).all()
-    session_list = [{'id': s[0], 'name': s[1].strftime('%d/%m %H:%M'), 'active': s[0]==sess_id} for s in sessions]
+    # Chỉ tải N tin nhắn mới nhất; tin cũ hơn lấy qua /chatbot/history khi cuộn lên
+    hist, cursor = page_messages(current_user.id, sess_id, limit=current_app.config['CHAT_PAGE_SIZE'])
+    session_list = list_sessions(current_user.id, sess_id)
 
     # Truyền endpoint cho JS
-    return render_template('chatbot_layout.html', chat_history=hist, bot_name=bot_name, endpoint=f"/chatbot/{bot_type}", session_list=session_list)
+    stream_endpoint = f"/chatbot/{bot_type}/stream" if current_app.config.get('CHAT_STREAM') else ""
+    return render_template('chatbot_layout.html', chat_history=hist, bot_name=bot_name, endpoint=f"/chatbot/{bot_type}", stream_endpoint=stream_endpoint, session_list=session_list, history_cursor=cursor or "", poll_wait=int(current_app.config['CHAT_POLL_WAIT']))
 
 @main.route('/chatbot/ai', methods=['GET', 'POST'])
 @login_required
@@ -179,11 +229,56 @@ def chatbot_ai(): return render_chat_page('ai', "AI Coach")
 @login_required
 def chatbot_gofai(): return render_chat_page('gofai', "Basic Bot")
 
+@main.route('/chatbot/ai/stream', methods=['POST'])
+@login_required
+def chatbot_ai_stream(): return handle_chat_stream('ai')
+
+@main.route('/chatbot/gofai/stream', methods=['POST'])
+@login_required
+def chatbot_gofai_stream(): return handle_chat_stream('gofai')
+
+@main.route('/chatbot/history')
+@login_required
+def chat_history_page():
+    # ?before=<cursor>&limit=N&session=<id> (mặc định phiên hiện tại)
+    sess_id = request.args.get('session') or current_user.current_session_id
+    limit = max(1, min(request.args.get('limit', current_app.config['CHAT_PAGE_SIZE'], type=int), 200))
+    msgs, cursor = page_messages(current_user.id, sess_id, before=request.args.get('before'), limit=limit)
+    return jsonify({'messages': [{'id': m.id, 'sender': m.sender, 'content': m.content, 'timestamp': m.timestamp.isoformat()} for m in msgs], 'next_cursor': cursor})
+
+@main.route('/chatbot/job/<job_id>')
+@login_required
+def chat_job_status(job_id):
+    # ?wait=N: long-poll tối đa N giây (giới hạn CHAT_POLL_WAIT, 0 = trả lời ngay)
+    wait = min(request.args.get('wait', 0, type=float), current_app.config['CHAT_POLL_WAIT'], 25.0)
+    job = wait_for_job(job_id, current_user.id, timeout=wait)
+    if not job: return jsonify({'status': 'unknown'}), 404
+    if job.status == 'pending': return jsonify({'status': 'pending'}), 202
+    if job.status in ('busy', 'error'): return jsonify({'status': job.status, 'response': job.response, 'busy': True})
+    return jsonify({'status': job.status, 'response': job.response})
+
+@main.route('/uploads/<name>')
+@login_required
+def uploaded_file(name):
+    # Tên file = hash nội dung -> không bao giờ đổi, cho cache lâu. ETag/Range do send_file xử lý
+    folder = current_app.config['UPLOAD_FOLDER']
+    thumb = request.args.get('thumb') == '1'
+    path = stored_path(folder, name, thumb=thumb)
+    if thumb and path and not os.path.exists(path): path, thumb = stored_path(folder, name), False  # chưa có ảnh nhỏ -> bản gốc
+    if not path or not os.path.exists(path): abort(404)
+    return send_file(path, conditional=True, etag=name + ('.thumb' if thumb else ''), max_age=31536000)
+
+@main.route('/static/uploads/<path:filename>')
+@login_required
+def legacy_upload(filename):
+    # Link cũ dạng /static/uploads/<tên gốc> (vẫn dùng được khi UPLOAD_FOLDER nằm ở /var/data)
+    return send_from_directory(current_app.config['UPLOAD_FOLDER'], filename, conditional=True)
+
 @main.route('/new_chat')
 @login_required
 def new_chat():
     current_user.current_session_id = str(uuid.uuid4())
-    try: openai.api_key = os.environ.get('OPENAI_API_KEY'); current_user.current_thread_id = openai.beta.threads.create().id
+    try: current_user.current_thread_id = get_client().beta.threads.create().id
     except: pass
     db.session.commit()
     return redirect(url_for('main.chatbot_redirect'))
@@ -191,15 +286,18 @@ def new_chat():
 @main.route('/switch_session/<session_id>')
 @login_required
 def switch_session(session_id):
-    current_user.current_session_id = session_id; db.session.commit()
+    current_user.current_session_id = session_id
+    # Khôi phục thread OpenAI của phiên (nếu đã lưu) để AI nhớ đúng ngữ cảnh
+    cs = ChatSession.query.filter_by(id=session_id, user_id=current_user.id).first()
+    if cs and cs.thread_id: current_user.current_thread_id = cs.thread_id
+    db.session.commit()
     return redirect(url_for('main.chatbot_redirect'))
 
 @main.route('/delete_session/<session_id>')
 @login_required
 def delete_session(session_id):
-    Message.query.filter_by(user_id=current_user.id, session_id=session_id).delete()
+    purge_session(current_user.id, session_id)
     if current_user.current_session_id == session_id: return redirect(url_for('main.new_chat'))
-    db.session.commit()
     return redirect(url_for('main.chatbot_redirect'))
 
 @main.route('/disclaimer')
@@ -213,8 +311,49 @@ def admin_dashboard():
     user_form = UserForm()
     upload_form = UploadCSVForm()
     reset_form = ResetPasswordForm()
-    users = User.query.filter_by(is_admin=False).all()
-    return render_template('admin_dashboard.html', users=users, user_form=user_form, upload_form=upload_form, reset_form=reset_form)
+    # Danh sách học sinh tải theo trang qua /admin/api/users
+    return render_template('admin_dashboard.html', user_form=user_form, upload_form=upload_form, reset_form=reset_form)
+
+@main.route('/admin/api/users')
+@login_required
+@admin_required
+def admin_users_data():
+    # ?page=&per_page=&sort=username|bot_type|id&dir=asc|desc&q=<tiền tố>&bot_type=
+    # Link thao tác dựng bằng url_for (đúng cả khi app chạy dưới tiền tố URL)
+    data = user_page(request.args)
+    for u in data['items']:
+        u['urls'] = {'history': url_for('main.view_chat_history', user_id=u['id']),
+                     'logs': url_for('main.view_variable_logs', user_id=u['id']),
+                     'reset_password': url_for('main.reset_student_password', user_id=u['id']),
+                     'delete': url_for('main.delete_user', user_id=u['id'])}
+    return jsonify(data)
+
+@main.route('/admin/ai_stats')
+@login_required
+@admin_required
+def ai_stats():
+    # Số lần poll runs.retrieve, độ trễ run, số lượt bị từ chối vì bận, hàng đợi lượt chat
+    adm = get_admission()
+    return jsonify(dict(get_stats(), admission=adm.get_stats() if adm else None))
+
+@main.route('/admin/cache_stats')
+@login_required
+@admin_required
+def cache_stats():
+    return jsonify({'user_cache': user_cache.get_stats(), 'gofai_response_cache': response_cache.get_stats()})
+
+@main.route('/admin/metrics')
+def admin_metrics():
+    # Text Prometheus. Admin đã đăng nhập, hoặc header Authorization: Bearer <METRICS_TOKEN>
+    token = current_app.config.get('METRICS_TOKEN')
+    by_token = token and hmac.compare_digest(request.headers.get('Authorization', ''), f'Bearer {token}')
+    if not by_token and not (current_user.is_authenticated and current_user.is_admin): abort(403)
+    extra = {f'assistant_{k}': v for k, v in get_stats().items()}
+    extra.update({f'user_cache_{k}': v for k, v in user_cache.get_stats().items() if isinstance(v, (int, float))})
+    extra.update({f'response_cache_{k}': v for k, v in response_cache.get_stats().items()})
+    adm = get_admission()
+    if adm: extra.update({f'admission_{k}': v for k, v in adm.get_stats().items()})
+    return Response(render_metrics(extra), mimetype='text/plain; version=0.0.4; charset=utf-8')
 
 @main.route('/admin/create_user', methods=['POST'])
 @login_required
@@ -236,71 +375,61 @@ def create_single_user():
 @admin_required
 def batch_create_users():
     form = UploadCSVForm()
+    report = None
     if form.validate_on_submit() and form.csv_file.data:
         try:
             file = form.csv_file.data
             file.seek(0)
-            file_content = file.read()
-            text_content = None
-            for enc in ['utf-8-sig', 'utf-8', 'cp1252', 'latin-1']:
-                try: text_content = file_content.decode(enc); break
-                except: continue
-            
+            text_content = decode_csv(file.read())
             if not text_content: raise ValueError("Lỗi file.")
-            
-            stream = io.StringIO(text_content)
-            delimiter = ';' if ';' in text_content.splitlines()[0] else ','
-            csv_reader = csv.reader(stream, delimiter=delimiter)
-            try: next(csv_reader, None)
-            except: pass
-
-            count = 0
-            for row in csv_reader:
-                if not row or len(row) < 3: continue
-                
-                # Logic 3 hoặc 5 cột
-                if len(row) >= 5: r_user, r_pass, r_type = row[2].strip(), row[3].strip(), row[4].strip().lower()
-                else: r_user, r_pass, r_type = row[0].strip(), row[1].strip(), row[2].strip().lower()
-                
-                if not r_user: continue
-                if not r_pass: r_pass = "123456"
-                
-                if 'gofai' in r_type or 'basic' in r_type: bot = 'gofai'
-                elif 'ai' in r_type or 'coach' in r_type: bot = 'ai'
-                else: bot = 'gofai'
-
-                if not User.query.filter_by(username=r_user).first():
-                    u = User(username=r_user, bot_type=bot)
-                    u.set_password(r_pass)
-                    db.session.add(u)
-                    count += 1
-            db.session.commit()
-            flash(f'Thêm {count} user.', 'success')
+
+            report = import_users(text_content, current_app.config.get('IMPORT_HASH_WORKERS'))
+            count = sum(1 for r in report if r['status'] == 'created')
+            skipped = sum(1 for r in report if r['status'] == 'skipped')
+            invalid = sum(1 for r in report if r['status'] == 'invalid')
+            flash(f'Thêm {count} user. Bỏ qua {skipped}, lỗi {invalid}.', 'success')
         except Exception as e:
             db.session.rollback(); flash(f'Lỗi: {e}', 'danger')
+    # ?format=json: trả báo cáo chi tiết từng dòng
+    if request.args.get('format') == 'json':
+        return jsonify({'report': report or []})
     return redirect(url_for('main.admin_dashboard'))
 
 @main.route('/admin/delete_selected', methods=['POST'])
 @login_required
 @admin_required
 def delete_selected_users():
-    ids = request.form.getlist('user_ids')
-    for uid in ids:
-        u = User.query.get(int(uid))
-        if u and not u.is_admin:
-            Message.query.filter_by(user_id=u.id).delete()
-            VariableLog.query.filter_by(user_id=u.id).delete()
-            db.session.delete(u)
-    db.session.commit()
-    flash('Đã xóa.', 'success')
-    return redirect(url_for('main.admin_dashboard'))
+    # Xóa chạy nền theo khối; tiến độ xem qua /admin/api/purge/<job_id>
+    # Bỏ Admin trước khi tạo job: bảng con chỉ bị xóa với tài khoản thực sự bị xóa
+    ids = purgeable_ids(i for i in request.form.getlist('user_ids') if i.isdigit())
+    if not ids:
+        flash('Chưa chọn tài khoản học sinh nào (không xóa hàng loạt tài khoản Admin).', 'warning')
+        return redirect(url_for('main.admin_dashboard'))
+    job = start_purge(current_app._get_current_object(), ids)
+    if request.args.get('format') == 'json': return jsonify(purge_status(job)), 202
+    flash(f'Đang xóa {len(ids)} tài khoản trong nền...', 'info')
+    return redirect(url_for('main.admin_dashboard', purge=job.id))
+
+@main.route('/admin/api/purge/<job_id>')
+@login_required
+@admin_required
+def purge_progress(job_id):
+    job = db.session.get(PurgeJob, job_id)
+    if job is None: abort(404)
+    return jsonify(purge_status(job))
 
 @main.route('/admin/delete/<int:user_id>')
 @login_required
 @admin_required
 def delete_user(user_id):
+    # Xóa cả tin nhắn/log/phiên của user (trước đây để lại dòng mồ côi)
     u = User.query.get_or_404(user_id)
-    if u.id != current_user.id: db.session.delete(u); db.session.commit()
+    # Xóa từng tài khoản được phép xóa cả Admin khác (như trước), chỉ không tự xóa mình
+    if u.id == current_user.id: flash('Không thể tự xóa tài khoản đang đăng nhập.', 'warning')
+    else:
+        cfg, name = current_app.config, u.username
+        purge_user_chunk([u.id], cfg['PURGE_ROW_BATCH'], cfg['PURGE_PAUSE'], admins=True)
+        flash(f'Đã xóa {name}.', 'success')
     return redirect(url_for('main.admin_dashboard'))
 
 @main.route('/admin/reset_password/<int:user_id>', methods=['POST'])
@@ -316,55 +445,60 @@ def reset_student_password(user_id):
 @admin_required
 def view_chat_history(user_id):
     u = User.query.get_or_404(user_id)
-    msgs = Message.query.filter_by(user_id=user_id).order_by(Message.timestamp.asc()).all()
-    return render_template('chat_history.html', student=u, messages=msgs)
+    return render_template('chat_history.html', student=u)
+
+@main.route('/admin/api/history/<int:user_id>')
+@login_required
+@admin_required
+def admin_history_data(user_id):
+    return jsonify(history_page(user_id, request.args))
 
 @main.route('/admin/logs/<int:user_id>')
 @login_required
 @admin_required
 def view_variable_logs(user_id):
     u = User.query.get_or_404(user_id)
-    logs = VariableLog.query.filter_by(user_id=user_id).order_by(VariableLog.timestamp.desc()).all()
-    return render_template('variable_logs.html', student=u, logs=logs)
+    return render_template('variable_logs.html', student=u)
+
+@main.route('/admin/api/logs/<int:user_id>')
+@login_required
+@admin_required
+def admin_logs_data(user_id):
+    return jsonify(log_page(user_id, request.args))
+
+# --- THỐNG KÊ BIẾN (đọc từ bảng variable_rollup) ---
+def parse_day(value):
+    try: return datetime.strptime(value, '%Y-%m-%d').date() if value else None
+    except ValueError: return None
+
+@main.route('/admin/api/analytics/student/<int:user_id>')
+@login_required
+@admin_required
+def admin_student_analytics(user_id):
+    return jsonify({'user_id': user_id, 'variables': student_summary(user_id, request.args.get('variable'))})
+
+@main.route('/admin/api/analytics/class')
+@login_required
+@admin_required
+def admin_class_analytics():
+    # ?bot_type=ai|gofai&variable=&start=YYYY-MM-DD&end=YYYY-MM-DD
+    bot_type = request.args.get('bot_type') if request.args.get('bot_type') in ('ai', 'gofai') else None
+    return jsonify({'variables': class_summary(request.args.get('variable'), bot_type,
+                                               parse_day(request.args.get('start')), parse_day(request.args.get('end')))})
 
 @main.route('/admin/export_history')
 @login_required
 @admin_required
 def export_chat_history():
-    si = io.StringIO(); cw = csv.writer(si)
-    cw.writerow(['Time (GMT+7)','Session','User','Type','Content'])
-    msgs = db.session.query(Message, User).join(User).order_by(Message.timestamp.desc()).all()
-    for m, u in msgs:
-        t = m.timestamp.strftime('%Y-%m-%d %H:%M:%S') if m.timestamp else ""
-        cw.writerow([t, m.session_id, u.username, m.sender, m.content])
-    return Response(si.getvalue(), mimetype="text/csv", headers={"Content-Disposition": "attachment;filename=data.csv"})
+    # Lọc tùy chọn: ?start=&end=&user=&session=&gzip=1
+    return export_request("data.csv", ['Time (GMT+7)','Session','User','Type','Content'], message_rows)
 # --- ROUTE MỚI: XUẤT FILE LOG (ĐIỂM SỐ/BIẾN) ---
 @main.route('/admin/export_logs')
 @login_required
 @admin_required
 def export_variable_logs():
-    # Tạo CSV trong bộ nhớ
-    si = io.StringIO()
-    cw = csv.writer(si)
-    
     # Header CSV: Thời gian, Session, Username, Tên Biến, Giá trị (Điểm)
-    cw.writerow(['Time (GMT+7)', 'Session', 'Username', 'Variable Name', 'Value'])
-    
-    # Lấy dữ liệu từ bảng VariableLog kết hợp với User
-    logs = db.session.query(VariableLog, User).join(User).order_by(VariableLog.timestamp.desc()).all()
-    
-    for l, u in logs:
-        # Format thời gian
-        t_str = l.timestamp.strftime('%Y-%m-%d %H:%M:%S') if l.timestamp else ""
-        # Ghi dòng: Thời gian, ID Session, Tên User, Tên Biến, Giá trị
-        cw.writerow([t_str, l.session_id, u.username, l.variable_name, l.variable_value])
-        
-    # Trả về file CSV
-    return Response(
-        si.getvalue(), 
-        mimetype="text/csv", 
-        headers={"Content-Disposition": "attachment;filename=logs_export.csv"}
-    )
+    return export_request("logs_export.csv", ['Time (GMT+7)', 'Session', 'Username', 'Variable Name', 'Value'], variable_log_rows)
 
 @main.route('/change_password', methods=['GET', 'POST'])
 @login_required
@@ -0,0 +1,46 @@
+from sqlalchemy import event
+from sqlalchemy.engine import make_url
+from . import db
+
+# --- SQLITE CHẾ ĐỘ PRODUCTION ---
+# WAL cho phép đọc song song khi đang ghi, busy_timeout để chờ khóa thay vì
+# báo "database is locked" ngay, pool kết nối dùng chung cho nhiều luồng.
+
+def is_sqlite(app):
+    return app.config['SQLALCHEMY_DATABASE_URI'].startswith('sqlite')
+
+def is_tunable(app):
+    # Chỉ DB file: SQLite trong bộ nhớ (sqlite://, :memory:) dùng StaticPool 1 kết nối, không có WAL/mmap
+    if not (is_sqlite(app) and app.config.get('SQLITE_TUNED')): return False
+    url = make_url(app.config['SQLALCHEMY_DATABASE_URI'])
+    return url.database not in (None, '', ':memory:') and url.query.get('mode') != 'memory'
+
+def configure_sqlite(app):
+    # Gọi TRƯỚC db.init_app: engine options được đọc khi tạo engine
+    if not is_tunable(app): return
+    opts = app.config.setdefault('SQLALCHEMY_ENGINE_OPTIONS', {})
+    opts.setdefault('pool_size', app.config['SQLITE_POOL_SIZE'])
+    opts.setdefault('max_overflow', app.config['SQLITE_POOL_SIZE'] * 2)
+    opts.setdefault('pool_recycle', 3600)
+    connect_args = opts.setdefault('connect_args', {})
+    connect_args.setdefault('timeout', app.config['SQLITE_BUSY_TIMEOUT_MS'] / 1000)
+    connect_args.setdefault('check_same_thread', False)
+
+def init_sqlite(app):
+    # Gọi SAU db.init_app: gắn PRAGMA cho mỗi kết nối mới
+    if not is_tunable(app): return
+    pragmas = [
+        "PRAGMA journal_mode=WAL",
+        "PRAGMA synchronous=NORMAL",
+        f"PRAGMA busy_timeout={int(app.config['SQLITE_BUSY_TIMEOUT_MS'])}",
+        f"PRAGMA mmap_size={int(app.config['SQLITE_MMAP_SIZE'])}",
+        "PRAGMA temp_store=MEMORY",
+    ]
+
+    def set_pragmas(dbapi_conn, _record):
+        cur = dbapi_conn.cursor()
+        for p in pragmas: cur.execute(p)
+        cur.close()
+
+    with app.app_context():
+        event.listen(db.engine, 'connect', set_pragmas)
@@ -0,0 +1,88 @@
+from flask import current_app
+from . import db
+from .models import User, Message, VariableLog
+from .history import touch_session, set_session_thread
+from .analytics import record_variables
+from .assistant import get_vietnam_time, parse_log_data
+from .user_cache import invalidate_user
+from .write_queue import get_write_queue
+from .metrics import span
+from sqlalchemy import insert, update, select
+
+# --- GHI LƯỢT CHAT ---
+# Gom mọi thứ của 1 lượt (tin User, tin Bot, biến LOG_DATA, bộ đếm phiên, session/thread id mới
+# của user) vào 1 Turn; chỉ ghi SAU khi có câu trả lời AI, trong 1 transaction ngắn, insert hàng loạt.
+# Không có gì nằm chờ trong db.session suốt lúc gọi AI.
+# TRANSCRIPT_BATCH=1: lượt của nhiều user đi qua luồng ghi (write_queue), gom chung 1 transaction
+# mỗi vài ms; request chờ lô của mình commit xong rồi mới trả lời (group commit).
+
+WRITE_TIMEOUT = 10  # giây chờ luồng ghi (TRANSCRIPT_BATCH)
+
+class UserGone(Exception):
+    # User đã bị xóa nhưng worker này còn bản chụp trong cache user (tới USER_CACHE_TTL)
+    pass
+
+class Turn:
+    def __init__(self, user_id, sess_id, bot_type, thread_id=None, new_session=False):
+        self.user_id, self.sess_id, self.bot_type, self.thread_id = user_id, sess_id, bot_type, thread_id
+        self.messages, self.data, self.user_updates = [], {}, {}
+        self.new_thread, self.ts = False, None
+        if new_session: self.user_updates['current_session_id'] = sess_id
+
+    def add_user_message(self, content, ts=None):
+        self.ts = ts or get_vietnam_time()
+        self.messages.append({'sender': 'user', 'content': content, 'user_id': self.user_id,
+                              'session_id': self.sess_id, 'timestamp': self.ts})
+
+    def set_thread(self, thread_id):
+        # Thread OpenAI vừa tạo: ghi vào User + ChatSession cùng lượt chat
+        self.thread_id, self.new_thread = thread_id, True
+        self.user_updates['current_thread_id'] = thread_id
+
+    def add_reply(self, full_resp):
+        # Tách LOG_DATA, thêm tin Bot; trả về text hiển thị
+        ui_text, self.data = parse_log_data(full_resp)
+        self.ts = get_vietnam_time()
+        self.messages.append({'sender': 'assistant', 'content': ui_text, 'user_id': self.user_id,
+                              'session_id': self.sess_id, 'timestamp': self.ts})
+        return ui_text
+
+    def take(self):
+        # Lấy phần chưa ghi (async/stream ghi tin User trước, câu trả lời sau)
+        part = {'user_id': self.user_id, 'sess_id': self.sess_id, 'bot_type': self.bot_type, 'thread_id': self.thread_id,
+                'new_thread': self.new_thread, 'messages': self.messages, 'data': self.data,
+                'user_updates': self.user_updates, 'ts': self.ts}
+        self.messages, self.data, self.user_updates, self.new_thread = [], {}, {}, False
+        return part
+
+def write_turn(part):
+    # Đưa 1 phần lượt chat vào transaction hiện tại (chưa commit)
+    uid, sid, ts, data = part['user_id'], part['sess_id'], part['ts'], part['data']
+    # Kiểm tra trong cùng transaction: không ghi tin nhắn/log mồ côi cho user vừa bị xóa ở worker khác
+    if db.session.scalar(select(User.id).where(User.id == uid)) is None: raise UserGone(uid)
+    if part['messages']: db.session.execute(insert(Message), part['messages'])
+    if data:
+        db.session.execute(insert(VariableLog), [{'user_id': uid, 'session_id': sid, 'variable_name': str(k),
+                                                  'variable_value': str(v), 'timestamp': ts} for k, v in data.items()])
+        record_variables(uid, sid, data, ts)
+    touch_session(uid, sid, len(part['messages']), ts, logs=len(data), bot_type=part['bot_type'], thread_id=part['thread_id'])
+    if part['new_thread']: set_session_thread(sid, part['thread_id'])
+    if part['user_updates']:
+        db.session.execute(update(User).where(User.id == uid).values(**part['user_updates']))
+        db.session.info.setdefault('changed_users', set()).add(uid)  # xóa cache user sau commit (user_cache.py)
+
+def save_turn(turn):
+    part = turn.take()
+    wq = get_write_queue(current_app)
+    if wq is None:
+        write_turn(part)
+        with span('commit'): db.session.commit()
+        return
+    fut = wq.submit(write_turn, part)
+    # Ghi trễ kiểu "bắn rồi quên" (SQLITE_WRITE_BEHIND) chỉ khi lượt không đổi session/thread của user:
+    # request kế tiếp phải đọc được id mới
+    if current_app.config.get('TRANSCRIPT_BATCH') or part['user_updates']:
+        db.session.rollback()  # không giữ kết nối trong lúc chờ: luồng ghi cũng cần 1 kết nối từ pool
+        # Chờ lô chứa lượt này commit; ghi lỗi/quá hạn -> exception (500) như khi ghi trực tiếp
+        with span('commit'): fut.result(timeout=WRITE_TIMEOUT)
+        if part['user_updates']: invalidate_user(part['user_id'])
@@ -0,0 +1,77 @@
+from concurrent.futures import ThreadPoolExecutor
+import hashlib, importlib.util, os, re, tempfile, threading
+
+# Pillow tùy chọn, chỉ cần để tạo ảnh thu nhỏ: nạp ở ảnh đầu tiên (import mất ~36ms lúc worker khởi động)
+HAS_PIL = importlib.util.find_spec('PIL') is not None
+
+# --- LƯU FILE UPLOAD THEO NỘI DUNG (content-addressed) ---
+# File được ghi theo từng khối ra đĩa, đặt tên theo SHA-256 nên 2 học sinh cùng
+# up "bai_tap.jpg" không đè nhau, và file trùng nội dung chỉ lưu 1 lần.
+# Ảnh thu nhỏ được tạo ở luồng nền, không chặn request.
+
+CHUNK_SIZE = 64 * 1024
+IMAGE_EXTS = {'png', 'jpg', 'jpeg', 'gif'}
+THUMB_SIZE = (400, 400)
+NAME_RE = re.compile(r'^([0-9a-f]{64})\.([a-z0-9]{1,5})$')
+
+_thumb_pool = None
+_pool_lock = threading.Lock()
+
+def _get_thumb_pool():
+    global _thumb_pool
+    with _pool_lock:
+        if _thumb_pool is None:
+            _thumb_pool = ThreadPoolExecutor(max_workers=2, thread_name_prefix='thumb')
+    return _thumb_pool
+
+def stored_path(folder, name, thumb=False):
+    # <folder>/<2 ký tự đầu hash>/<hash>.<ext>  (ảnh nhỏ: <hash>.thumb.jpg)
+    m = NAME_RE.match(name)
+    if not m: return None
+    digest, ext = m.groups()
+    fname = f"{digest}.thumb.jpg" if thumb else name
+    return os.path.join(folder, digest[:2], fname)
+
+def store_upload(file, folder):
+    # Ghi stream upload ra file tạm theo khối, vừa ghi vừa băm; trả về tên lưu trữ
+    ext = file.filename.rsplit('.', 1)[1].lower()
+    h = hashlib.sha256()
+    fd, tmp = tempfile.mkstemp(dir=folder, prefix='.upload-')
+    try:
+        with os.fdopen(fd, 'wb') as out:
+            while True:
+                chunk = file.stream.read(CHUNK_SIZE)
+                if not chunk: break
+                h.update(chunk)
+                out.write(chunk)
+        name = f"{h.hexdigest()}.{ext}"
+        dest = stored_path(folder, name)
+        os.makedirs(os.path.dirname(dest), exist_ok=True)
+        if os.path.exists(dest): os.remove(tmp)  # trùng nội dung: giữ bản cũ
+        else: os.replace(tmp, dest)
+    except Exception:
+        if os.path.exists(tmp): os.remove(tmp)
+        raise
+
+    if ext in IMAGE_EXTS and HAS_PIL:
+        _get_thumb_pool().submit(make_thumbnail, dest, stored_path(folder, name, thumb=True))
+    return name
+
+def make_thumbnail(src, dest):
+    if os.path.exists(dest): return
+    try:
+        from PIL import Image
+        with Image.open(src) as im:
+            im.thumbnail(THUMB_SIZE)
+            tmp = dest + '.tmp'
+            im.convert('RGB').save(tmp, 'JPEG', quality=80)
+            os.replace(tmp, dest)
+    except Exception as e:
+        print(f"Lỗi tạo ảnh thu nhỏ: {e}")
+
+def upload_html(name, original_name):
+    # HTML chèn vào tin nhắn User (ảnh hiện bản thu nhỏ, bấm để xem bản gốc)
+    url = f"/uploads/{name}"
+    if name.rsplit('.', 1)[1] in IMAGE_EXTS:
+        return f'<br><a href="{url}" target="_blank"><img src="{url}?thumb=1" style="max-width:200px; border-radius:10px;"></a>'
+    return f'<br><a href="{url}" target="_blank">File: {original_name}</a>'
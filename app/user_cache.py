@@ -0,0 +1,102 @@
+from flask import session, has_request_context
+from flask_login import UserMixin
+from sqlalchemy import event
+from sqlalchemy.orm import object_session
+from collections import OrderedDict
+from . import db
+from .models import User
+import threading, time
+
+# --- CACHE USER CHO user_loader ---
+# Giữ bản chụp danh tính user (LRU + TTL) trong process để mỗi request không
+# phải SELECT bảng user. Ghi vào current_user sẽ nạp bản ghi ORM thật.
+# Mọi UPDATE/DELETE User qua ORM sẽ xóa cache sau khi commit; user tự đổi
+# phiên/thread thì cookie '_uv' báo cho các worker khác bỏ bản chụp cũ.
+
+FIELDS = ('id', 'username', 'is_admin', 'bot_type', 'current_session_id', 'current_thread_id')
+
+class CachedUser(UserMixin):
+    def __init__(self, snap):
+        object.__setattr__(self, '_snap', snap)
+        object.__setattr__(self, '_obj', None)
+
+    def _load(self):
+        if self._obj is None:
+            object.__setattr__(self, '_obj', db.session.get(User, self._snap['id']))
+        return self._obj
+
+    def __getattr__(self, name):
+        if self._obj is None and name in self._snap: return self._snap[name]
+        return getattr(self._load(), name)
+
+    def __setattr__(self, name, value):
+        setattr(self._load(), name, value)
+
+class UserCache:
+    def __init__(self, maxsize=10000, ttl=60):
+        self.maxsize, self.ttl = maxsize, ttl
+        self.data = OrderedDict()  # id -> (loaded_at, snap)
+        self.lock = threading.Lock()
+        self.stats = {'hits': 0, 'misses': 0, 'invalidations': 0}
+
+    def load(self, user_id):
+        now = time.time()
+        stamp = session.get('_uv', 0) if has_request_context() else 0
+        with self.lock:
+            entry = self.data.get(user_id)
+            if entry and now - entry[0] < self.ttl and entry[0] >= stamp:
+                self.data.move_to_end(user_id)
+                self.stats['hits'] += 1
+                return CachedUser(entry[1])
+            self.stats['misses'] += 1
+
+        u = db.session.get(User, user_id)
+        if u is None: return None
+        snap = {f: getattr(u, f) for f in FIELDS}
+        with self.lock:
+            self.data[user_id] = (now, snap)
+            self.data.move_to_end(user_id)
+            while len(self.data) > self.maxsize: self.data.popitem(last=False)
+        return u  # request này dùng luôn bản ORM vừa nạp
+
+    def invalidate(self, *user_ids):
+        with self.lock:
+            for uid in user_ids:
+                if self.data.pop(uid, None): self.stats['invalidations'] += 1
+
+    def clear(self):
+        with self.lock: self.data.clear()
+
+    def get_stats(self):
+        with self.lock:
+            s = dict(self.stats, size=len(self.data))
+        total = s['hits'] + s['misses']
+        s['hit_rate'] = round(s['hits'] / total, 3) if total else 0
+        return s
+
+user_cache = UserCache()
+
+def invalidate_user(*user_ids):
+    user_cache.invalidate(*user_ids)
+    # User tự sửa chính mình: đánh dấu cookie để worker khác cũng bỏ bản chụp cũ
+    if has_request_context() and session.get('_user_id') in {str(u) for u in user_ids}:
+        session['_uv'] = time.time()
+
+# Thu thập id User bị sửa/xóa trong flush, xóa cache khi transaction commit xong
+@event.listens_for(User, 'after_update')
+@event.listens_for(User, 'after_delete')
+def _mark_user_changed(mapper, connection, target):
+    object_session(target).info.setdefault('changed_users', set()).add(target.id)
+
+@event.listens_for(db.session, 'after_commit')
+def _flush_user_invalidations(sess):
+    ids = sess.info.pop('changed_users', None)
+    if ids: invalidate_user(*ids)
+
+@event.listens_for(db.session, 'after_rollback')
+def _drop_user_invalidations(sess):
+    sess.info.pop('changed_users', None)
+
+def init_user_cache(app):
+    user_cache.maxsize = app.config['USER_CACHE_SIZE']
+    user_cache.ttl = app.config['USER_CACHE_TTL']
@@ -0,0 +1,96 @@
+from . import db
+from .models import User
+from sqlalchemy import insert
+from werkzeug.security import generate_password_hash
+from concurrent.futures import ProcessPoolExecutor
+import csv, io, multiprocessing, os
+
+# --- NHẬP USER HÀNG LOẠT TỪ CSV ---
+# Đọc hết file -> 1 truy vấn IN lấy username đã có -> băm mật khẩu song song
+# trên process pool -> insert() theo lô. Trả về báo cáo theo từng dòng.
+
+DEFAULT_PASSWORD = "123456"
+IN_CHUNK = 900          # SQLite giới hạn ~999 tham số / câu lệnh
+INSERT_BATCH = 500
+PARALLEL_MIN_ROWS = 50  # file nhỏ thì băm tuần tự, khỏi tốn công tạo pool
+
+def decode_csv(file_content):
+    for enc in ['utf-8-sig', 'utf-8', 'cp1252', 'latin-1']:
+        try: return file_content.decode(enc)
+        except: continue
+    return None
+
+def normalize_bot_type(r_type):
+    if 'gofai' in r_type or 'basic' in r_type: return 'gofai'
+    elif 'ai' in r_type or 'coach' in r_type: return 'ai'
+    return 'gofai'
+
+def parse_roster(text_content):
+    # Trả về (rows hợp lệ, báo cáo dòng lỗi). Dòng tính theo file (header = dòng 1)
+    lines = text_content.splitlines()
+    if not lines: return [], []
+    delimiter = ';' if ';' in lines[0] else ','
+    csv_reader = csv.reader(io.StringIO(text_content), delimiter=delimiter)
+    next(csv_reader, None)
+
+    rows, invalid = [], []
+    for line_no, row in enumerate(csv_reader, start=2):
+        if not row or not any(c.strip() for c in row): continue
+        if len(row) < 3:
+            invalid.append({'line': line_no, 'username': row[0].strip(), 'status': 'invalid', 'reason': 'Thiếu cột'})
+            continue
+
+        # Logic 3 hoặc 5 cột
+        if len(row) >= 5: r_user, r_pass, r_type = row[2].strip(), row[3].strip(), row[4].strip().lower()
+        else: r_user, r_pass, r_type = row[0].strip(), row[1].strip(), row[2].strip().lower()
+
+        if not r_user:
+            invalid.append({'line': line_no, 'username': '', 'status': 'invalid', 'reason': 'Thiếu username'})
+        elif len(r_user) > 64:
+            invalid.append({'line': line_no, 'username': r_user[:64], 'status': 'invalid', 'reason': 'Username quá dài'})
+        else:
+            rows.append({'line': line_no, 'username': r_user, 'password': r_pass or DEFAULT_PASSWORD, 'bot_type': normalize_bot_type(r_type)})
+    return rows, invalid
+
+def existing_usernames(names):
+    found = set()
+    names = list(names)
+    for i in range(0, len(names), IN_CHUNK):
+        chunk = names[i:i + IN_CHUNK]
+        found.update(n for (n,) in db.session.query(User.username).filter(User.username.in_(chunk)))
+    return found
+
+def hash_passwords(passwords, workers=None):
+    if len(passwords) < PARALLEL_MIN_ROWS or workers == 1:
+        return [generate_password_hash(p) for p in passwords]
+    workers = workers or os.cpu_count() or 1
+    # Không fork worker web (nhiều luồng, đang giữ kết nối SQLite + luồng nền): process băm mới
+    # được tách ra từ forkserver sạch (Windows/macOS cũ: spawn)
+    method = 'forkserver' if 'forkserver' in multiprocessing.get_all_start_methods() else 'spawn'
+    with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context(method)) as ex:
+        return list(ex.map(generate_password_hash, passwords, chunksize=max(1, len(passwords) // (workers * 4))))
+
+def import_users(text_content, workers=None):
+    rows, report = parse_roster(text_content)
+
+    # Trùng trong chính file hoặc đã có trong DB -> bỏ qua
+    existing = existing_usernames({r['username'] for r in rows})
+    seen, to_create = set(), []
+    for r in rows:
+        if r['username'] in existing:
+            report.append({'line': r['line'], 'username': r['username'], 'status': 'skipped', 'reason': 'Đã tồn tại'})
+        elif r['username'] in seen:
+            report.append({'line': r['line'], 'username': r['username'], 'status': 'skipped', 'reason': 'Trùng trong file'})
+        else:
+            seen.add(r['username'])
+            to_create.append(r)
+
+    hashes = hash_passwords([r['password'] for r in to_create], workers)
+    values = [{'username': r['username'], 'password_hash': h, 'bot_type': r['bot_type'], 'is_admin': False} for r, h in zip(to_create, hashes)]
+    for i in range(0, len(values), INSERT_BATCH):
+        db.session.execute(insert(User), values[i:i + INSERT_BATCH])
+    db.session.commit()
+
+    report.extend({'line': r['line'], 'username': r['username'], 'status': 'created', 'reason': ''} for r in to_create)
+    report.sort(key=lambda x: x['line'])
+    return report
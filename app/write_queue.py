@@ -0,0 +1,76 @@
+from . import db
+from concurrent.futures import Future
+import atexit, queue, threading, time, traceback
+
+# --- GHI TRỄ (WRITE-BEHIND) ---
+# Gom các thao tác ghi của nhiều lượt chat vào 1 transaction trên 1 luồng ghi
+# riêng: request không phải chờ commit, SQLite chỉ có 1 người ghi trong process.
+
+class WriteBehindQueue:
+    def __init__(self, app, max_batch=200, max_delay=0.02):
+        self.app, self.max_batch, self.max_delay = app, max_batch, max_delay
+        self.q = queue.Queue()
+        self.stats = {'jobs': 0, 'batches': 0, 'errors': 0}
+        self.thread = threading.Thread(target=self._loop, name='write-behind', daemon=True)
+        self.thread.start()
+        atexit.register(self.flush)
+
+    def submit(self, fn, *args):
+        # fn(*args) chạy trong app context của luồng ghi, dùng db.session như bình thường.
+        # -> Future: xong khi lô chứa job đã commit, lỗi (exception của fn) nếu ghi lại riêng vẫn hỏng
+        fut = Future()
+        self.q.put((fn, args, fut))
+        return fut
+
+    def flush(self, timeout=10):
+        # Chờ hàng đợi ghi hết (dùng khi tắt process hoặc trong test/bench)
+        done = threading.Event()
+        self.q.put((None, done, None))
+        return done.wait(timeout)
+
+    def _loop(self):
+        while True:
+            batch = [self.q.get()]
+            deadline = time.monotonic() + self.max_delay
+            while len(batch) < self.max_batch:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0: break
+                try: batch.append(self.q.get(timeout=remaining))
+                except queue.Empty: break
+            self._write(batch)
+
+    def _write(self, batch):
+        markers = [args for fn, args, fut in batch if fn is None]
+        jobs = [job for job in batch if job[0] is not None]
+        with self.app.app_context():
+            if jobs:
+                try:
+                    for fn, args, fut in jobs: fn(*args)
+                    db.session.commit()
+                    for fn, args, fut in jobs: fut.set_result(None)
+                except Exception:
+                    # Lỗi 1 job không được làm mất các job khác: ghi lại từng cái
+                    db.session.rollback()
+                    for fn, args, fut in jobs:
+                        try:
+                            fn(*args); db.session.commit()
+                            fut.set_result(None)
+                        except Exception as e:
+                            db.session.rollback()
+                            self.stats['errors'] += 1
+                            traceback.print_exc()
+                            fut.set_exception(e)
+                self.stats['jobs'] += len(jobs)
+                self.stats['batches'] += 1
+            db.session.remove()
+        for done in markers: done.set()
+
+def get_write_queue(app):
+    return app.extensions.get('write_queue')
+
+def init_write_queue(app):
+    # Dùng cho ghi trễ (SQLITE_WRITE_BEHIND) và gom lượt chat (TRANSCRIPT_BATCH, xem app/transcript.py)
+    if app.config.get('SQLITE_WRITE_BEHIND'):
+        app.extensions['write_queue'] = WriteBehindQueue(app, max_delay=app.config['WRITE_BEHIND_DELAY'])
+    elif app.config.get('TRANSCRIPT_BATCH'):
+        app.extensions['write_queue'] = WriteBehindQueue(app, max_delay=app.config['TRANSCRIPT_BATCH_DELAY'])
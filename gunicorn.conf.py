@@ -0,0 +1,38 @@
+import os
+
+# --- GUNICORN (production) ---
+# Start command: gunicorn -c gunicorn.conf.py
+# - preload_app: master nạp app + biên dịch template 1 lần, worker fork ra dùng chung bộ nhớ
+# - gthread (mặc định): mỗi worker nhiều luồng, lượt chat đang chờ Assistant không chiếm cả 1 process
+# - gevent (GUNICORN_WORKER_CLASS=gevent, cần `pip install gevent`; Postgres cần thêm psycogreen):
+#   mỗi worker phục vụ hàng trăm kết nối bằng greenlet
+
+wsgi_app = 'wsgi:app'
+bind = f"0.0.0.0:{os.environ.get('PORT', '8000')}"
+workers = int(os.environ.get('WEB_CONCURRENCY', 2))
+worker_class = os.environ.get('GUNICORN_WORKER_CLASS', 'gthread')
+threads = int(os.environ.get('GUNICORN_THREADS', 16))                        # gthread
+worker_connections = int(os.environ.get('GUNICORN_WORKER_CONNECTIONS', 200))  # gevent
+preload_app = os.environ.get('GUNICORN_PRELOAD', '1') == '1'
+timeout = int(os.environ.get('GUNICORN_TIMEOUT', 120))  # lớn hơn RUN_DEADLINE của Assistant
+graceful_timeout = 30
+keepalive = 5
+max_requests = int(os.environ.get('GUNICORN_MAX_REQUESTS', 0))
+max_requests_jitter = max_requests // 10
+accesslog = os.environ.get('GUNICORN_ACCESS_LOG') or None
+errorlog = '-'
+
+# Worker nhiều luồng/greenlet: long-poll trạng thái job chat (CHAT_ASYNC) không chiếm cả worker.
+# Worker sync giữ mặc định CHAT_POLL_WAIT=0 (trình duyệt poll ngắn)
+if worker_class == 'gevent' or (worker_class == 'gthread' and threads > 1):
+    os.environ.setdefault('CHAT_POLL_WAIT', '20')
+
+if worker_class == 'gevent':
+    # Patch trước khi master nạp app: lock/socket tạo lúc import phải là bản của gevent
+    from gevent import monkey
+    monkey.patch_all()
+
+def post_fork(server, worker):
+    if not preload_app: return  # không preload: mỗi worker tự nạp app, không có gì thừa hưởng
+    from app.prefork import after_fork
+    after_fork(server.app.wsgi())
@@ -0,0 +1,85 @@
+"""chat_session table, composite indexes, backfill from existing rows
+
+Revision ID: a1c3e5f7b9d1
+Revises: 
+Create Date: 2026-10-17 09:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'a1c3e5f7b9d1'
+down_revision = None
+branch_labels = None
+depends_on = None
+
+# Các bảng cũ được tạo bằng db.create_all(), nên migration này kiểm tra
+# những gì đã có trước khi tạo (chạy được trên DB mới lẫn DB đang chạy).
+
+SESSION_COLUMNS = [
+    sa.Column('bot_type', sa.String(length=20), nullable=True),
+    sa.Column('thread_id', sa.String(length=100), nullable=True),
+    sa.Column('created_at', sa.DateTime(), nullable=True),
+    sa.Column('last_activity', sa.DateTime(), nullable=True),
+    sa.Column('message_count', sa.Integer(), nullable=True),
+    sa.Column('log_count', sa.Integer(), nullable=True),
+]
+
+INDEXES = [
+    ('ix_message_user_session_ts', 'message', ['user_id', 'session_id', 'timestamp']),
+    ('ix_variable_log_user_session_ts', 'variable_log', ['user_id', 'session_id', 'timestamp']),
+    ('ix_chat_session_user_id', 'chat_session', ['user_id']),
+    ('ix_chat_session_last_activity', 'chat_session', ['last_activity']),
+    ('ix_chat_session_user_activity', 'chat_session', ['user_id', 'last_activity']),
+]
+
+
+def upgrade():
+    bind = op.get_bind()
+    insp = sa.inspect(bind)
+
+    if not insp.has_table('chat_session'):
+        op.create_table('chat_session',
+            sa.Column('id', sa.String(length=50), nullable=False),
+            sa.Column('user_id', sa.Integer(), sa.ForeignKey('user.id'), nullable=True),
+            *[c.copy() for c in SESSION_COLUMNS],
+            sa.PrimaryKeyConstraint('id'),
+        )
+    else:
+        have = {c['name'] for c in insp.get_columns('chat_session')}
+        for col in SESSION_COLUMNS:
+            if col.name not in have: op.add_column('chat_session', col.copy())
+
+    for name, table, cols in INDEXES:
+        if name not in {i['name'] for i in insp.get_indexes(table)}:
+            op.create_index(name, table, cols)
+
+    # Backfill: mỗi session_id trong Message chưa có trong chat_session
+    op.execute("""
+        INSERT INTO chat_session (id, user_id, created_at, last_activity, message_count, log_count)
+        SELECT m.session_id, MIN(m.user_id), MIN(m.timestamp), MAX(m.timestamp), COUNT(m.id), 0
+        FROM message m
+        WHERE m.session_id IS NOT NULL
+          AND m.session_id NOT IN (SELECT id FROM chat_session)
+        GROUP BY m.session_id
+    """)
+    op.execute("""
+        UPDATE chat_session SET
+            bot_type = COALESCE(bot_type, (SELECT u.bot_type FROM "user" u WHERE u.id = chat_session.user_id)),
+            thread_id = COALESCE(thread_id, (SELECT u.current_thread_id FROM "user" u
+                                             WHERE u.id = chat_session.user_id AND u.current_session_id = chat_session.id)),
+            created_at = COALESCE(created_at, last_activity),
+            message_count = COALESCE(message_count, 0),
+            log_count = (SELECT COUNT(*) FROM variable_log v WHERE v.session_id = chat_session.id)
+    """)
+
+
+def downgrade():
+    insp = sa.inspect(op.get_bind())
+    for name, table, cols in INDEXES:
+        if table != 'chat_session' and name in {i['name'] for i in insp.get_indexes(table)}:
+            op.drop_index(name, table_name=table)
+    if insp.has_table('chat_session'):
+        op.drop_table('chat_session')
@@ -0,0 +1,26 @@
+"""variable_log (user_id, variable_name) index for admin log search
+
+Revision ID: b2d4f6a8c0e2
+Revises: a1c3e5f7b9d1
+Create Date: 2026-10-17 11:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'b2d4f6a8c0e2'
+down_revision = 'a1c3e5f7b9d1'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    insp = sa.inspect(op.get_bind())
+    if 'ix_variable_log_user_var' not in {i['name'] for i in insp.get_indexes('variable_log')}:
+        op.create_index('ix_variable_log_user_var', 'variable_log', ['user_id', 'variable_name'])
+
+
+def downgrade():
+    op.drop_index('ix_variable_log_user_var', table_name='variable_log')
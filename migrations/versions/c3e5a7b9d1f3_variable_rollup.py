@@ -0,0 +1,55 @@
+"""variable_rollup + analytics_state tables for LOG_DATA analytics
+
+Run `flask analytics rebuild` afterwards to fill the rollups from existing logs.
+
+Revision ID: c3e5a7b9d1f3
+Revises: b2d4f6a8c0e2
+Create Date: 2026-10-17 12:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c3e5a7b9d1f3'
+down_revision = 'b2d4f6a8c0e2'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    insp = sa.inspect(op.get_bind())
+    tables = set(insp.get_table_names())
+    if 'variable_rollup' not in tables:
+        op.create_table(
+            'variable_rollup',
+            sa.Column('user_id', sa.Integer(), sa.ForeignKey('user.id'), nullable=False),
+            sa.Column('session_id', sa.String(length=50), nullable=False),
+            sa.Column('variable_name', sa.String(length=100), nullable=False),
+            sa.Column('day', sa.Date(), nullable=False),
+            sa.Column('n', sa.Integer(), nullable=True),
+            sa.Column('n_numeric', sa.Integer(), nullable=True),
+            sa.Column('total', sa.Float(), nullable=True),
+            sa.Column('min_value', sa.Float(), nullable=True),
+            sa.Column('max_value', sa.Float(), nullable=True),
+            sa.Column('last_value', sa.Text(), nullable=True),
+            sa.Column('last_numeric', sa.Float(), nullable=True),
+            sa.Column('last_at', sa.DateTime(), nullable=True),
+            sa.PrimaryKeyConstraint('user_id', 'session_id', 'variable_name', 'day'),
+        )
+    if 'ix_variable_rollup_var_day' not in {i['name'] for i in sa.inspect(op.get_bind()).get_indexes('variable_rollup')}:
+        op.create_index('ix_variable_rollup_var_day', 'variable_rollup', ['variable_name', 'day'])
+    if 'analytics_state' not in tables:
+        op.create_table(
+            'analytics_state',
+            sa.Column('key', sa.String(length=50), nullable=False),
+            sa.Column('last_id', sa.Integer(), nullable=True),
+            sa.PrimaryKeyConstraint('key'),
+        )
+
+
+def downgrade():
+    op.drop_table('analytics_state')
+    op.drop_index('ix_variable_rollup_var_day', table_name='variable_rollup')
+    op.drop_table('variable_rollup')
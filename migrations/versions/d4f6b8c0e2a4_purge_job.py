@@ -0,0 +1,39 @@
+"""purge_job table for chunked background deletes
+
+Revision ID: d4f6b8c0e2a4
+Revises: c3e5a7b9d1f3
+Create Date: 2026-10-17 13:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'd4f6b8c0e2a4'
+down_revision = 'c3e5a7b9d1f3'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    if 'purge_job' not in sa.inspect(op.get_bind()).get_table_names():
+        op.create_table(
+            'purge_job',
+            sa.Column('id', sa.String(length=36), nullable=False),
+            sa.Column('user_ids', sa.Text(), nullable=True),
+            sa.Column('status', sa.String(length=20), nullable=True),
+            sa.Column('users_total', sa.Integer(), nullable=True),
+            sa.Column('users_done', sa.Integer(), nullable=True),
+            sa.Column('rows_deleted', sa.Integer(), nullable=True),
+            sa.Column('error', sa.Text(), nullable=True),
+            sa.Column('created_at', sa.DateTime(), nullable=True),
+            sa.Column('updated_at', sa.DateTime(), nullable=True),
+            sa.PrimaryKeyConstraint('id'),
+        )
+        op.create_index('ix_purge_job_status', 'purge_job', ['status'])
+
+
+def downgrade():
+    op.drop_index('ix_purge_job_status', table_name='purge_job')
+    op.drop_table('purge_job')
@@ -0,0 +1,36 @@
+"""chat_session archive location columns
+
+Revision ID: e5a7c9e1f3b5
+Revises: d4f6b8c0e2a4
+Create Date: 2026-10-17 14:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e5a7c9e1f3b5'
+down_revision = 'd4f6b8c0e2a4'
+branch_labels = None
+depends_on = None
+
+COLUMNS = [
+    ('archive_file', sa.String(length=20)),
+    ('archive_offset', sa.BigInteger()),
+    ('archive_length', sa.Integer()),
+]
+
+
+def upgrade():
+    have = {c['name'] for c in sa.inspect(op.get_bind()).get_columns('chat_session')}
+    with op.batch_alter_table('chat_session') as batch_op:
+        for name, type_ in COLUMNS:
+            if name not in have:
+                batch_op.add_column(sa.Column(name, type_, nullable=True))
+
+
+def downgrade():
+    with op.batch_alter_table('chat_session') as batch_op:
+        for name, _ in reversed(COLUMNS):
+            batch_op.drop_column(name)
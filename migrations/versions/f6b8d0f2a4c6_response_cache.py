@@ -0,0 +1,37 @@
+"""response_cache table for repeated GOFAI prompts
+
+Revision ID: f6b8d0f2a4c6
+Revises: e5a7c9e1f3b5
+Create Date: 2026-10-17 15:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'f6b8d0f2a4c6'
+down_revision = 'e5a7c9e1f3b5'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    if 'response_cache' not in sa.inspect(op.get_bind()).get_table_names():
+        op.create_table(
+            'response_cache',
+            sa.Column('key', sa.String(length=64), nullable=False),
+            sa.Column('bot_type', sa.String(length=20), nullable=True),
+            sa.Column('assistant_id', sa.String(length=100), nullable=True),
+            sa.Column('prompt', sa.Text(), nullable=True),
+            sa.Column('response', sa.Text(), nullable=True),
+            sa.Column('latency', sa.Float(), nullable=True),
+            sa.Column('created_at', sa.DateTime(), nullable=True),
+            sa.PrimaryKeyConstraint('key'),
+        )
+        op.create_index('ix_response_cache_created_at', 'response_cache', ['created_at'])
+
+
+def downgrade():
+    op.drop_index('ix_response_cache_created_at', table_name='response_cache')
+    op.drop_table('response_cache')
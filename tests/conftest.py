@@ -0,0 +1,61 @@
+import os, pytest
+from app import create_app, db
+from app.models import User, Message, VariableLog, ChatSession
+from app.bench import StubAssistantClient
+from app.user_cache import user_cache
+from app.response_cache import response_cache
+
+# Test chạy trên file SQLite tạm + client Assistants giả (StubAssistantClient), không gọi OpenAI
+
+os.environ.setdefault('CHATBOT_AI_ID', 'asst_test_ai')
+os.environ.setdefault('CHATBOT_GOFAI_ID', 'asst_test_gofai')
+
+PASSWORD = 'pw1234'
+
+@pytest.fixture
+def make_app(tmp_path):
+    apps = []
+
+    def make(**cfg):
+        config = {'SQLALCHEMY_DATABASE_URI': f"sqlite:///{tmp_path / 'test.db'}", 'TESTING': True,
+                  'WTF_CSRF_ENABLED': False, 'UPLOAD_FOLDER': str(tmp_path / 'uploads'),
+                  'ARCHIVE_FOLDER': str(tmp_path / 'archive'), 'OPENAI_CLIENT': StubAssistantClient(0),
+                  'POLL_INITIAL': 0.01, 'USER_BURST': 1000, 'GLOBAL_BURST': 1000}
+        config.update(cfg)
+        app = create_app(config)
+        with app.app_context():
+            if not User.query.filter_by(username='student').first():
+                u = User(username='student', bot_type='gofai'); u.set_password(PASSWORD)
+                db.session.add(u); db.session.commit()
+        apps.append(app)
+        return app
+
+    # Cache dùng chung cả process: id user lặp lại giữa các DB test
+    user_cache.clear(); response_cache.data.clear()
+    yield make
+    for app in apps:
+        wq = app.extensions.get('write_queue')
+        if wq: wq.flush()
+        with app.app_context(): db.engine.dispose()
+
+@pytest.fixture
+def app(make_app):
+    return make_app()
+
+def login(client, username='student', password=PASSWORD):
+    return client.post('/login', data={'username': username, 'password': password})
+
+def add_session(user_id, sid, messages=(), logs=()):
+    # Phiên chat có sẵn dữ liệu: messages [(thời gian, sender, nội dung)], logs [(thời gian, tên biến, giá trị)]
+    ts = [r[0] for r in (*messages, *logs)]
+    db.session.add(ChatSession(id=sid, user_id=user_id, bot_type='gofai', created_at=min(ts), last_activity=max(ts),
+                               message_count=len(messages), log_count=len(logs)))
+    db.session.add_all([Message(user_id=user_id, session_id=sid, sender=s, content=c, timestamp=t) for t, s, c in messages])
+    db.session.add_all([VariableLog(user_id=user_id, session_id=sid, variable_name=n, variable_value=v, timestamp=t)
+                        for t, n, v in logs])
+
+@pytest.fixture
+def client(app):
+    c = app.test_client()
+    login(c)
+    return c
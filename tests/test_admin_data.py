@@ -0,0 +1,68 @@
+from datetime import datetime
+from app import db
+from app.models import User
+from app.archive import archive_sessions
+from .conftest import login, add_session
+
+def d(day, hour): return datetime(2026, 1, day, hour)
+
+def admin_client(app):
+    c = app.test_client(); login(c, 'admin', '123456')
+    return c
+
+def seed(app):
+    # Phiên lưu trữ old-a, old-b + phiên nóng hiện tại, thời gian xen kẽ nhau
+    with app.app_context():
+        u = User.query.filter_by(username='student').one()
+        add_session(u.id, 'old-a', [(d(10, 10), 'user', 'a1'), (d(12, 10), 'assistant', 'a2')],
+                    [(d(10, 10), 'stage', 'intro'), (d(12, 10), 'score', '5')])
+        add_session(u.id, 'old-b', [(d(11, 9), 'user', 'b1')])
+        add_session(u.id, 'hot', [(d(11, 12), 'user', 'h1'), (d(13, 8), 'assistant', 'h2')], [(d(11, 12), 'score', '9')])
+        u.current_session_id = 'hot'
+        db.session.commit()
+        assert archive_sessions(days=30)['sessions'] == 2
+        return u.id
+
+def pages(c, url, **args):
+    # Đi hết các trang theo next_cursor
+    out = []
+    while True:
+        data = c.get(url, query_string=args).get_json()
+        out.append(data['items'])
+        if not data['next_cursor']: return out
+        args['before'] = data['next_cursor']
+
+def test_user_page_search_sort_and_counts(app):
+    with app.app_context():
+        uid = User.query.filter_by(username='student').one().id
+        for name, bot in (('an', 'gofai'), ('anh', 'ai'), ('binh', 'ai')):
+            db.session.add(User(username=name, bot_type=bot, password_hash='x'))
+        add_session(uid, 's1', [(d(1, 1), 'user', 'x'), (d(1, 2), 'assistant', 'y')], [(d(1, 2), 'score', '1')])
+        add_session(uid, 's2', [(d(2, 1), 'user', 'z')])
+        db.session.commit()
+    c = admin_client(app)
+    data = c.get('/admin/api/users?sort=username&dir=desc&per_page=2').get_json()
+    assert [u['username'] for u in data['items']] == ['student', 'binh']  # admin không nằm trong danh sách
+    assert (data['total'], data['pages']) == (4, 2)
+    student = data['items'][0]
+    assert (student['messages'], student['logs']) == (3, 1)
+    assert student['urls'] == {'history': f"/admin/history/{uid}", 'logs': f"/admin/logs/{uid}",
+                               'reset_password': f"/admin/reset_password/{uid}", 'delete': f"/admin/delete/{uid}"}
+    assert [u['username'] for u in c.get('/admin/api/users?q=an&sort=username').get_json()['items']] == ['an', 'anh']
+    assert [u['username'] for u in c.get('/admin/api/users?bot_type=ai&page=2&per_page=1&sort=username').get_json()['items']] == ['binh']
+
+def test_history_page_merges_archive_across_cursors(app):
+    uid = seed(app)
+    c = admin_client(app)
+    got = pages(c, f'/admin/api/history/{uid}', per_page=2)
+    assert [[m['content'] for m in p] for p in got] == [['h2', 'a2'], ['h1', 'b1'], ['a1']]
+    assert got[0][1] == {'id': got[0][1]['id'], 'sender': 'assistant', 'content': 'a2', 'session_id': 'old-a', 'timestamp': '10:00:00 12/01'}
+    assert [[m['content'] for m in p] for p in pages(c, f'/admin/api/history/{uid}', session='old')] == [['a2', 'b1', 'a1']]
+
+def test_log_page_filters_by_name_prefix(app):
+    uid = seed(app)
+    c = admin_client(app)
+    got = pages(c, f'/admin/api/logs/{uid}', per_page=1, q='sc')
+    assert [[(l['session_id'], l['value']) for l in p] for p in got] == [[('old-a', '5')], [('hot', '9')]]
+    assert [l['name'] for l in pages(c, f'/admin/api/logs/{uid}')[0]] == ['score', 'score', 'stage']
+    assert pages(c, f'/admin/api/logs/{uid}', session='old-a')[0][-1]['timestamp'] == '2026-01-10 10:00:00'
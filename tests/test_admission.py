@@ -0,0 +1,130 @@
+import threading, time, pytest
+from app import db
+from app.models import User
+from app.bench import StubAssistantClient
+from app import chat_jobs
+from app.admission import FairQueue, SQLiteBackend, Rejected
+from .conftest import login
+
+def add_student(app, username):
+    with app.app_context():
+        u = User(username=username, bot_type='gofai'); u.set_password('pw1234')
+        db.session.add(u); db.session.commit()
+    c = app.test_client(); login(c, username)
+    return c
+
+def wait_idle(timeout=5):
+    deadline = time.monotonic() + timeout
+    while chat_jobs.backlog() and time.monotonic() < deadline: time.sleep(0.02)
+
+def test_async_enqueue_does_not_wait_for_a_run_slot(make_app):
+    # Mọi chỗ chạy đã bận: request bất đồng bộ vẫn trả job_id ngay, job nền tự xếp hàng
+    app = make_app(ADMISSION_ENABLED=True, CHAT_ASYNC=True, MAX_INFLIGHT_RUNS=1, OPENAI_CLIENT=StubAssistantClient(0.5))
+    a, b = add_student(app, 'a'), add_student(app, 'b')
+    try:
+        assert a.post('/chatbot/gofai', data={'user_input': 'một'}).status_code == 202
+        t0 = time.monotonic()
+        assert b.post('/chatbot/gofai', data={'user_input': 'hai'}).status_code == 202
+        assert time.monotonic() - t0 < 0.3
+    finally: wait_idle()
+
+def test_async_backlog_limit(make_app):
+    app = make_app(ADMISSION_ENABLED=True, CHAT_ASYNC=True, CHAT_WORKERS=1, QUEUE_MAX=0, OPENAI_CLIENT=StubAssistantClient(0.5))
+    a, b = add_student(app, 'a'), add_student(app, 'b')
+    try:
+        assert a.post('/chatbot/gofai', data={'user_input': 'một'}).status_code == 202
+        r = b.post('/chatbot/gofai', data={'user_input': 'hai'})
+        assert r.status_code == 503 and r.get_json()['reason'] == 'queue'
+    finally: wait_idle()
+    # Job xong thì trả chỗ (cả khóa "1 lượt/user")
+    assert a.post('/chatbot/gofai', data={'user_input': 'ba'}).status_code == 202
+    wait_idle()
+
+def test_one_turn_per_user(make_app):
+    app = make_app(ADMISSION_ENABLED=True, CHAT_ASYNC=True, OPENAI_CLIENT=StubAssistantClient(0.5))
+    a = add_student(app, 'a')
+    try:
+        assert a.post('/chatbot/gofai', data={'user_input': 'một'}).status_code == 202
+        r = a.post('/chatbot/gofai', data={'user_input': 'hai'})
+        assert r.status_code == 429 and r.get_json()['reason'] == 'inflight'
+    finally: wait_idle()
+
+def test_disabled_by_default(app):
+    assert app.extensions['admission'] is None
+
+def test_user_rate_limit_sets_retry_after(make_app):
+    app = make_app(ADMISSION_ENABLED=True, USER_BURST=1, USER_RATE_PER_MIN=6)
+    a = add_student(app, 'a')
+    assert a.post('/chatbot/gofai', data={'user_input': 'một'}).status_code == 200
+    r = a.post('/chatbot/gofai', data={'user_input': 'hai'})
+    assert r.status_code == 429 and r.get_json()['reason'] == 'user_rate'
+    assert 9 <= int(r.headers['Retry-After']) <= 10  # 1 token / 10 giây
+
+@pytest.fixture(params=['memory', 'sqlite'])
+def admission(request, make_app, tmp_path):
+    def make(**cfg):
+        app = make_app(ADMISSION_ENABLED=True, ADMISSION_BACKEND=request.param,
+                       ADMISSION_SQLITE_PATH=str(tmp_path / 'admission.db'), **cfg)
+        return app.extensions['admission']
+    return make
+
+def test_global_rejection_refunds_user_token(admission):
+    adm = admission(USER_BURST=1, GLOBAL_BURST=1, GLOBAL_RATE_PER_SEC=0.01)
+    adm.leave(adm.enter(1))
+    with pytest.raises(Rejected) as e: adm.enter(2)
+    assert e.value.reason == 'global_rate' and 99 <= e.value.retry_after <= 100
+    # Token của user 2 đã được trả: lần sau vẫn bị chặn vì hệ thống, không phải vì user gửi quá nhanh
+    with pytest.raises(Rejected) as e: adm.enter(2)
+    assert e.value.reason == 'global_rate'
+    assert adm.get_stats()['rejected_user_rate'] == 0
+
+def test_queue_timeout_refunds_tokens_and_inflight(admission):
+    adm = admission(MAX_INFLIGHT_RUNS=1, QUEUE_TIMEOUT=0.05, USER_BURST=1, GLOBAL_BURST=2, GLOBAL_RATE_PER_SEC=0.01)
+    ticket = adm.enter(1)
+    for _ in range(2):
+        with pytest.raises(Rejected) as e: adm.enter(2)
+        assert e.value.reason == 'queue'  # không thành 'inflight' / 'user_rate' / 'global_rate' ở lần 2
+    assert adm.get_stats()['queue_timeouts'] == 2 and adm.queue.depth() == 0
+    adm.leave(ticket)
+    adm.leave(adm.enter(2))
+
+def test_one_turn_per_user_is_shared_by_sqlite_workers(tmp_path):
+    # 2 backend trên cùng file = 2 worker gunicorn
+    w1, w2 = SQLiteBackend(str(tmp_path / 'a.db')), SQLiteBackend(str(tmp_path / 'a.db'))
+    assert w1.acquire_inflight('user:1', 'w1', 60)
+    assert not w2.acquire_inflight('user:1', 'w2', 60)
+    w2.release_inflight('user:1', 'w2')  # không phải chủ: không có tác dụng
+    assert not w2.acquire_inflight('user:1', 'w2', 60)
+    assert w2.acquire_inflight('user:1', 'w2', 0)  # quá hạn (worker chết giữa chừng): bị giành lại
+    assert w1.take_token('user:1', 1 / 60, 2) is None and w2.take_token('user:1', 1 / 60, 2) is None
+    assert 59 <= w1.take_token('user:1', 1 / 60, 2) <= 60
+    w2.refund_token('user:1', 2)
+    assert w1.take_token('user:1', 1 / 60, 2) is None
+
+def test_fair_queue_serves_light_users_first():
+    q = FairQueue(1)
+    assert q.acquire('a', 1, 10)  # a đang chạy; a xếp hàng thêm 1 lượt, sau đó b, c
+    order, threads = [], []
+    def wait(user):
+        assert q.acquire(user, 5, 10)
+        order.append(user)
+    for user in ('a', 'b', 'c'):
+        threads.append(threading.Thread(target=wait, args=(user,))); threads[-1].start()
+        while q.depth() < len(threads): time.sleep(0.001)
+    for _ in threads:
+        n = len(order)
+        q.release()
+        while len(order) == n: time.sleep(0.001)
+    q.release()
+    for t in threads: t.join()
+    assert order == ['b', 'c', 'a'] and q.busy == 0
+
+def test_fair_queue_timeout_and_max_depth():
+    q = FairQueue(1)
+    assert q.acquire('a', 1, 10)
+    t0 = time.monotonic()
+    assert not q.acquire('b', 0.05, 10)
+    assert 0.04 <= time.monotonic() - t0 < 1 and q.depth() == 0
+    assert not q.acquire('c', 5, 0)  # hàng đợi đầy: từ chối ngay
+    q.release()
+    assert q.acquire('b', 0, 10) and q.max_depth == 1
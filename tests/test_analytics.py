@@ -0,0 +1,72 @@
+import pytest
+from datetime import datetime, date
+from app import db
+from app.models import User, VariableRollup
+from app.transcript import write_turn
+from app.analytics import compact, rebuild, student_summary, class_summary
+from .conftest import login
+
+# (user, phiên, thời gian, {biến: giá trị}) - ghi lệch thứ tự thời gian để kiểm tra "giá trị cuối"
+LOGS = [('student', 's1', datetime(2026, 1, 1, 10), {'score': '4', 'stage': 'intro'}),
+        ('student', 's2', datetime(2026, 1, 3, 8), {'score': '10'}),
+        ('student', 's1', datetime(2026, 1, 1, 12), {'score': '6'}),
+        ('student', 's2', datetime(2026, 1, 2, 9), {'score': '8,5', 'stage': 'practice'}),
+        ('student', 's2', datetime(2026, 1, 2, 10), {'score': 'n/a'}),
+        ('other', 's3', datetime(2026, 1, 1, 9), {'score': '2'})]
+
+def write_logs(app):
+    with app.app_context():
+        ids = {'student': User.query.filter_by(username='student').one().id}
+        other = User(username='other', bot_type='ai', password_hash='x'); db.session.add(other); db.session.flush()
+        ids['other'] = other.id
+        for name, sid, ts, data in LOGS:
+            write_turn({'user_id': ids[name], 'sess_id': sid, 'bot_type': 'gofai', 'thread_id': None, 'new_thread': False,
+                        'messages': [], 'data': data, 'user_updates': {}, 'ts': ts})
+            db.session.commit()
+        if app.config['ROLLUP_MODE'] == 'compaction':
+            assert VariableRollup.query.count() == 0
+            assert compact(batch=2) == 8
+        return ids
+
+def by_var(summary): return {s['variable']: s for s in summary}
+
+@pytest.mark.parametrize('mode', ['insert', 'compaction'])
+def test_rollup_matches_hand_computed_logs(make_app, mode):
+    app = make_app(ROLLUP_MODE=mode)
+    ids = write_logs(app)
+    with app.app_context():
+        r = db.session.get(VariableRollup, (ids['student'], 's2', 'score', date(2026, 1, 2)))
+        assert (r.n, r.n_numeric, r.total, r.min_value, r.max_value) == (2, 1, 8.5, 8.5, 8.5)
+        assert (r.last_value, r.last_numeric) == ('n/a', 8.5)
+
+        s = by_var(student_summary(ids['student']))
+        score = s['score']
+        assert (score['count'], score['n_numeric'], score['mean'], score['min'], score['max']) == (5, 4, 7.125, 4, 10)
+        assert score['series'] == [{'day': '2026-01-01', 'mean': 5.0}, {'day': '2026-01-02', 'mean': 8.5},
+                                   {'day': '2026-01-03', 'mean': 10.0}]
+        assert score['trend'] == 2.5  # hồi quy (5, 8.5, 10) theo ngày 0, 1, 2
+        assert (score['latest'], score['latest_numeric'], score['latest_at']) == ('10', 10.0, '2026-01-03T08:00:00')
+        stage = s['stage']
+        assert (stage['count'], stage['mean'], stage['trend'], stage['latest']) == (2, None, None, 'practice')
+
+        score = by_var(class_summary())['score']
+        assert (score['count'], score['students'], score['min'], score['max']) == (6, 2, 2, 10)
+        assert score['series'][0] == {'day': '2026-01-01', 'mean': 4.0} and score['trend'] == 3.0
+        score = by_var(class_summary('score', start=date(2026, 1, 2)))['score']
+        assert (score['count'], score['students'], score['mean']) == (3, 1, 9.25)
+        assert [s['variable'] for s in class_summary(bot_type='ai')] == ['score']
+
+        # Tính lại từ đầu cho cùng kết quả; compaction chạy lại không gộp trùng
+        before = student_summary(ids['student'])
+        if mode == 'compaction': assert compact() == 0
+        assert rebuild() == 8
+        assert student_summary(ids['student']) == before
+
+def test_analytics_routes(make_app):
+    app = make_app(ROLLUP_MODE='insert')
+    ids = write_logs(app)
+    c = app.test_client(); login(c, 'admin', '123456')
+    data = c.get(f"/admin/api/analytics/student/{ids['student']}?variable=stage").get_json()
+    assert [v['variable'] for v in data['variables']] == ['stage']
+    data = c.get('/admin/api/analytics/class?bot_type=gofai&end=2026-01-01').get_json()
+    assert {v['variable']: v['count'] for v in data['variables']} == {'score': 2, 'stage': 1}
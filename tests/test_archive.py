@@ -0,0 +1,114 @@
+import gzip, os
+from datetime import datetime
+from app import db, archive
+from app.models import User, Message, VariableLog, ChatSession, VariableRollup
+from app.archive import archive_sessions, archived_rows, iter_archived_logs, archive_stats, read_session, scrub_member
+from app.admin_data import merge_archived
+from app.analytics import rebuild, student_summary
+from app.purge import purge_session, purge_user_chunk
+from .conftest import add_session
+
+def d(day, hour): return datetime(2026, 1, day, hour)
+
+def seed(app, **extra):
+    # student: 2 phiên cũ (lưu trữ được), 1 phiên hiện tại; other: 1 phiên cũ cùng file tháng 01
+    with app.app_context():
+        u = User.query.filter_by(username='student').one()
+        other = User(username='other', bot_type='gofai', password_hash='x'); db.session.add(other); db.session.flush()
+        add_session(u.id, 'old-a', [(d(10, 10), 'user', 'bí mật A'), (d(12, 10), 'assistant', 'a2')], [(d(12, 10), 'score', '5')])
+        add_session(u.id, 'old-b', [(d(11, 9), 'user', 'b1')], [(d(11, 9), 'score', '3')])
+        add_session(u.id, 'hot', [(d(11, 12), 'user', 'h1')])
+        add_session(other.id, 'old-o', [(d(11, 8), 'user', 'bí mật O')], [(d(11, 8), 'score', '1')])
+        u.current_session_id = 'hot'
+        db.session.commit()
+        return u.id, other.id
+
+def file_text(app, name='2026-01.jsonl.gz'):
+    # Đọc cả file như công cụ gzip thông thường (nhiều member nối nhau)
+    with open(os.path.join(app.config['ARCHIVE_FOLDER'], name), 'rb') as f:
+        return gzip.decompress(f.read()).decode('utf-8')
+
+def test_archive_sessions_moves_old_sessions(app):
+    uid, oid = seed(app)
+    with app.app_context():
+        # Cũ nhất trước: old-o, old-b rồi old-a
+        assert archive_sessions(days=30, batch=1, limit=2) == {'sessions': 2, 'rows': 4}
+        assert archive_sessions(days=30) == {'sessions': 1, 'rows': 3}
+        assert archive_sessions(days=30) == {'sessions': 0, 'rows': 0}  # chạy lại không làm gì
+        # Phiên hiện tại vẫn ở tầng nóng; phiên lưu trữ không còn dòng trong bảng
+        assert {m.session_id for m in Message.query} == {'hot'} and VariableLog.query.count() == 0
+        s = db.session.get(ChatSession, 'old-a')
+        assert (s.archive_file, s.message_count, s.log_count) == ('2026-01.jsonl.gz', 2, 1)
+        got = read_session(s)
+        assert [(m['sender'], m['content'], m['ts']) for m in got['m']] == [('user', 'bí mật A', d(10, 10)), ('assistant', 'a2', d(12, 10))]
+        assert [(l['name'], l['value']) for l in got['l']] == [('score', '5')]
+        stats = archive_stats()
+        assert stats['archived_sessions'] == 3 and list(stats['files']) == ['2026-01.jsonl.gz']
+        assert file_text(app).count('\n') == 7
+
+def test_archive_compacts_logs_first(make_app):
+    app = make_app(ROLLUP_MODE='compaction')
+    uid, _ = seed(app)
+    with app.app_context():
+        archive_sessions(days=30)
+        assert db.session.query(db.func.sum(VariableRollup.n)).scalar() == 3  # log đã vào rollup trước khi rời bảng
+
+def test_archived_rows_and_logs(app):
+    uid, oid = seed(app)
+    with app.app_context():
+        archive_sessions(days=30)
+        assert [r[4] for r in archived_rows('m', {})] == ['a2', 'b1', 'bí mật O', 'bí mật A']
+        assert [r[4] for r in archived_rows('m', {'user': 'student', 'start': d(11, 0), 'end': d(12, 0)})] == ['b1']
+        assert [r[1:] for r in archived_rows('l', {'session': 'old-b'})] == [('old-b', 'student', 'score', '3')]
+        assert sorted((u, s, v) for u, s, _, v, _ in iter_archived_logs()) == [(uid, 'old-a', '5'), (uid, 'old-b', '3'), (oid, 'old-o', '1')]
+
+def test_merge_archived_keeps_newest(app):
+    uid, _ = seed(app)
+    with app.app_context():
+        archive_sessions(days=30)
+        hot = [(d(11, 12), 999, {'content': 'h1'})]
+        rows = merge_archived(list(hot), uid, 'm', None, 3)
+        assert [(ts, r['content']) for ts, _, r in rows] == [(d(12, 10), 'a2'), (d(11, 12), 'h1'), (d(11, 9), 'b1')]
+        assert rows[0][2]['session_id'] == 'old-a'
+        # Sau con trỏ (thời gian, id) của b1: chỉ còn tin cũ hơn
+        rows = merge_archived([], uid, 'm', (rows[2][0], rows[2][1]), 3)
+        assert [r['content'] for _, _, r in rows] == ['bí mật A']
+        assert [r['value'] for _, _, r in merge_archived([], uid, 'l', None, 5, session_prefix='old-b')] == ['3']
+
+def test_delete_archived_session_keeps_logs(app):
+    uid, _ = seed(app)
+    with app.app_context():
+        archive_sessions(days=30)
+        assert purge_session(uid, 'old-a') == 2
+        s = db.session.get(ChatSession, 'old-a')
+        assert s is not None and s.message_count == 0
+        assert read_session(s)['m'] == [] and [l['value'] for l in read_session(s)['l']] == ['5']
+        assert 'bí mật A' not in file_text(app) and 'bí mật O' in file_text(app)
+        assert [r[4] for r in archived_rows('m', {'user': 'student'})] == ['b1']
+        # Log của phiên đã xóa vẫn dùng được cho thống kê
+        assert rebuild() == 3
+        assert next(v for v in student_summary(uid) if v['variable'] == 'score')['count'] == 2
+
+def test_delete_user_scrubs_archive(app):
+    uid, oid = seed(app)
+    with app.app_context():
+        archive_sessions(days=30)
+        assert purge_user_chunk([oid], 100) > 0
+        text = file_text(app)
+        assert 'bí mật O' not in text and 'bí mật A' in text
+        assert [u for u, *_ in iter_archived_logs()] == [uid, uid]
+        assert [r[4] for r in archived_rows('m', {})] == ['a2', 'b1', 'bí mật A']
+
+def test_scrub_member_keeps_other_offsets(app):
+    # Member lớn (> 64KB) được thay bằng nhiều gzip member rỗng, tổng độ dài không đổi
+    with app.app_context():
+        first = archive.append_member('x.jsonl.gz', [{'k': 'm', 'id': i, 'ts': None, 'sender': 'user', 'content': os.urandom(40).hex()}
+                                                     for i in range(2000)])
+        second = archive.append_member('x.jsonl.gz', [{'k': 'l', 'id': 1, 'ts': None, 'name': 'score', 'value': '7'}])
+        assert first[1] > 0xffff + 22
+        size = os.path.getsize(archive.archive_path('x.jsonl.gz'))
+        scrub_member('x.jsonl.gz', *first)
+        assert os.path.getsize(archive.archive_path('x.jsonl.gz')) == size
+        assert file_text(app, 'x.jsonl.gz').splitlines() == ['{"k": "l", "id": 1, "ts": null, "name": "score", "value": "7"}']
+        assert archive._read_member(archive.archive_path('x.jsonl.gz'), *first) == {'m': [], 'l': []}
+        assert archive._read_member(archive.archive_path('x.jsonl.gz'), *second)['l'][0]['value'] == '7'
@@ -0,0 +1,110 @@
+import time, uuid
+from app import db
+from app.models import User, Message, VariableLog, ChatJob
+from app import chat_jobs
+from .conftest import login
+
+def wait_done(client, job_id, timeout=5):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        r = client.get(f'/chatbot/job/{job_id}')
+        if r.status_code != 202: return r
+        time.sleep(0.02)
+    raise AssertionError('job chưa xong')
+
+def test_async_turn_is_queued_and_saved(make_app):
+    app = make_app(CHAT_ASYNC=True)
+    c = app.test_client(); login(c)
+    r = c.post('/chatbot/gofai', data={'user_input': 'Xin chào'})
+    assert r.status_code == 202
+    job_id = r.get_json()['job_id']
+    assert r.get_json()['status_url'].endswith(f'/chatbot/job/{job_id}')
+
+    r = wait_done(c, job_id)
+    assert r.status_code == 200
+    assert r.get_json() == {'status': 'done', 'response': 'Câu trả lời mẫu.'}
+    with app.app_context():
+        uid = User.query.filter_by(username='student').one().id
+        msgs = Message.query.filter_by(user_id=uid).order_by(Message.id).all()
+        assert [(m.sender, m.content) for m in msgs] == [('user', 'Xin chào'), ('assistant', 'Câu trả lời mẫu.')]
+        logs = {v.variable_name: v.variable_value for v in VariableLog.query.filter_by(user_id=uid)}
+        assert logs == {'score': '7', 'stage': 'practice'}
+        assert db.session.get(ChatJob, job_id).status == 'done'
+
+def test_long_poll_waits_for_job(make_app):
+    app = make_app(CHAT_ASYNC=True, CHAT_POLL_WAIT=5)
+    c = app.test_client(); login(c)
+    job_id = c.post('/chatbot/gofai', data={'user_input': 'Xin chào'}).get_json()['job_id']
+    r = c.get(f'/chatbot/job/{job_id}?wait=5')
+    assert r.get_json()['status'] == 'done'
+
+def test_job_error_is_reported(make_app, monkeypatch):
+    def fail(part): raise RuntimeError('db down')
+    monkeypatch.setattr(chat_jobs, 'write_turn', fail)
+    app = make_app(CHAT_ASYNC=True)
+    c = app.test_client(); login(c)
+    job_id = c.post('/chatbot/gofai', data={'user_input': 'Xin chào'}).get_json()['job_id']
+    r = wait_done(c, job_id)
+    assert r.get_json()['status'] == 'error' and r.get_json()['busy']
+    with app.app_context():
+        # Lỗi: không lưu gì của lượt chat, em gửi lại được
+        assert Message.query.count() == 0
+        assert db.session.get(ChatJob, job_id).status == 'error'
+
+def test_busy_run_is_reported_and_not_saved(make_app, monkeypatch):
+    def busy(*a): raise chat_jobs.AssistantBusy()
+    monkeypatch.setattr(chat_jobs, 'get_assistant_response', busy)
+    app = make_app(CHAT_ASYNC=True)
+    c = app.test_client(); login(c)
+    job_id = c.post('/chatbot/gofai', data={'user_input': 'Xin chào'}).get_json()['job_id']
+    r = wait_done(c, job_id)
+    assert r.status_code == 200
+    assert r.get_json() == {'status': 'busy', 'response': chat_jobs.BUSY_MESSAGE, 'busy': True}
+    with app.app_context():
+        assert Message.query.count() == 0 and VariableLog.query.count() == 0
+    # Gửi lại khi đã hết bận: lượt chat được lưu đúng 1 lần
+    monkeypatch.undo()
+    job_id = c.post('/chatbot/gofai', data={'user_input': 'Xin chào'}).get_json()['job_id']
+    assert wait_done(c, job_id).get_json()['status'] == 'done'
+    with app.app_context():
+        assert [m.sender for m in Message.query.order_by(Message.id)] == ['user', 'assistant']
+
+def test_unknown_or_foreign_job_is_404(make_app):
+    app = make_app()
+    with app.app_context():
+        other = User(username='other', bot_type='gofai'); other.set_password('pw1234'); db.session.add(other)
+        db.session.flush()
+        db.session.add(ChatJob(id='job-of-other', user_id=other.id, status='done', response='x'))
+        db.session.commit()
+    c = app.test_client(); login(c)
+    assert c.get('/chatbot/job/nope').status_code == 404
+    assert c.get('/chatbot/job/job-of-other').status_code == 404
+
+def test_job_from_other_worker_is_read_from_db(make_app):
+    # Job do worker khác chạy: không có Event trong process này, trạng thái đọc thẳng từ DB
+    app = make_app(CHAT_POLL_WAIT=5)
+    with app.app_context():
+        uid = User.query.filter_by(username='student').one().id
+        db.session.add_all([ChatJob(id='done-elsewhere', user_id=uid, status='done', response='Xong rồi'),
+                            ChatJob(id='pending-elsewhere', user_id=uid, status='pending')])
+        db.session.commit()
+    c = app.test_client(); login(c)
+    assert c.get('/chatbot/job/done-elsewhere?wait=5').get_json() == {'status': 'done', 'response': 'Xong rồi'}
+    t0 = time.monotonic()
+    r = c.get('/chatbot/job/pending-elsewhere?wait=5')
+    assert r.status_code == 202 and time.monotonic() - t0 < 1
+
+def test_short_poll_by_default(make_app):
+    # CHAT_POLL_WAIT=0: ?wait bị bỏ qua, request không giữ worker
+    app = make_app()
+    with app.app_context():
+        uid = User.query.filter_by(username='student').one().id
+        db.session.add(ChatJob(id=str(uuid.uuid4()), user_id=uid, status='pending')); db.session.commit()
+        job_id = ChatJob.query.one().id
+    c = app.test_client(); login(c)
+    chat_jobs._events[job_id] = chat_jobs.threading.Event()
+    try:
+        t0 = time.monotonic()
+        assert c.get(f'/chatbot/job/{job_id}?wait=20').status_code == 202
+        assert time.monotonic() - t0 < 1
+    finally: chat_jobs._events.pop(job_id, None)
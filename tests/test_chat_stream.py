@@ -0,0 +1,73 @@
+import json
+from app.models import User, Message, VariableLog
+from app.bench import StubAssistantClient
+from .conftest import login
+
+REPLY = 'Chào em! Bài này làm thế này.\n```json\nLOG_DATA = {"level": 2, "hint": "yes"}\n```'
+
+def events(body):
+    out = []
+    for chunk in body.strip().split('\n\n'):
+        lines = dict(line.split(': ', 1) for line in chunk.splitlines())
+        out.append((lines['event'], json.loads(lines['data'])))
+    return out
+
+def post_stream(c, text='Xin chào'):
+    r = c.post('/chatbot/gofai/stream', data={'user_input': text})
+    body = r.get_data(as_text=True)
+    r.close()  # như trình duyệt đóng kết nối: trả chỗ hàng đợi
+    return r, body
+
+def test_stream_sends_deltas_then_saves_turn(make_app):
+    app = make_app(CHAT_STREAM=True, OPENAI_CLIENT=StubAssistantClient(0, reply=REPLY))
+    c = app.test_client(); login(c)
+    r, body = post_stream(c)
+    assert r.status_code == 200 and r.mimetype == 'text/event-stream'
+    evs = events(body)
+    deltas = [d['text'] for e, d in evs if e == 'delta']
+    assert len(deltas) > 1
+    assert ''.join(deltas).strip() == 'Chào em! Bài này làm thế này.'
+    assert evs[-1] == ('done', {'response': 'Chào em! Bài này làm thế này.'})
+    # Khối LOG_DATA không bao giờ tới trình duyệt, kể cả khi "```json" bị cắt giữa 2 delta
+    assert '```' not in body and 'LOG_DATA' not in body and 'level' not in body
+
+    with app.app_context():
+        uid = User.query.filter_by(username='student').one().id
+        msgs = Message.query.filter_by(user_id=uid).order_by(Message.id).all()
+        assert [(m.sender, m.content) for m in msgs] == [('user', 'Xin chào'), ('assistant', 'Chào em! Bài này làm thế này.')]
+        logs = {v.variable_name: v.variable_value for v in VariableLog.query.filter_by(user_id=uid)}
+        assert logs == {'level': '2', 'hint': 'yes'}
+
+def test_stream_thread_is_remembered(make_app):
+    app = make_app(CHAT_STREAM=True)
+    c = app.test_client(); login(c)
+    post_stream(c, 'một'); post_stream(c, 'hai')
+    with app.app_context():
+        u = User.query.filter_by(username='student').one()
+        assert u.current_thread_id
+        assert Message.query.filter_by(user_id=u.id).count() == 4
+
+def test_busy_is_the_same_for_stream_and_sync(make_app):
+    # Hết chỗ run: cả 2 luồng trả 503 + lời nhắn bận, không lưu tin nhắn nào
+    app = make_app(CHAT_STREAM=True, MAX_INFLIGHT_RUNS=1)
+    slots = app.extensions['assistant_slots']
+    assert slots.acquire(blocking=False)
+    c = app.test_client(); login(c)
+    try:
+        r_stream, _ = post_stream(c)
+        r_sync = c.post('/chatbot/gofai', data={'user_input': 'Xin chào'})
+    finally: slots.release()
+    for r in (r_stream, r_sync):
+        assert r.status_code == 503 and r.get_json()['busy'] is True
+    with app.app_context():
+        assert Message.query.count() == 0
+    # Chỗ run được trả lại: lượt sau chạy bình thường
+    r, body = post_stream(c)
+    assert events(body)[-1][0] == 'done'
+
+def test_disconnect_releases_run_slot(make_app):
+    app = make_app(CHAT_STREAM=True, MAX_INFLIGHT_RUNS=1)
+    c = app.test_client(); login(c)
+    r = c.post('/chatbot/gofai/stream', data={'user_input': 'Xin chào'})
+    r.close()  # ngắt trước khi đọc hết stream
+    assert app.extensions['assistant_slots'].acquire(blocking=False)
@@ -0,0 +1,59 @@
+import csv, gzip, io
+from datetime import datetime
+from app import db, exports
+from app.models import User
+from app.archive import archive_sessions
+from .conftest import login, add_session
+
+def d(day, hour): return datetime(2026, 1, day, hour)
+
+def seed(app):
+    # 2 phiên đã lưu trữ chồng thời gian nhau + 1 phiên nóng (phiên hiện tại) nằm giữa
+    with app.app_context():
+        u = User.query.filter_by(username='student').one()
+        add_session(u.id, 'old-a', [(d(10, 10), 'user', 'a1'), (d(12, 10), 'assistant', 'a2')], [(d(12, 10), 'score', '5')])
+        add_session(u.id, 'old-b', [(d(11, 9), 'user', 'b1')], [(d(11, 9), 'score', '3')])
+        add_session(u.id, 'hot', [(d(11, 12), 'user', 'h1')], [(d(11, 12), 'score', '9')])
+        u.current_session_id = 'hot'
+        db.session.commit()
+        assert archive_sessions(days=30)['sessions'] == 2
+
+def export(c, path, **args):
+    r = c.get(path, query_string=args)
+    assert r.status_code == 200
+    body = gzip.decompress(r.data) if args.get('gzip') else r.data
+    return list(csv.reader(io.StringIO(body.decode('utf-8'))))[1:]
+
+def test_export_merges_archive_newest_first(app):
+    seed(app)
+    c = app.test_client(); login(c, 'admin', '123456')
+    rows = export(c, '/admin/export_history', gzip='1')
+    assert [r[4] for r in rows] == ['a2', 'h1', 'b1', 'a1']
+    assert rows[0] == ['2026-01-12 10:00:00', 'old-a', 'student', 'assistant', 'a2']
+    logs = export(c, '/admin/export_logs')
+    assert [(r[1], r[4]) for r in logs] == [('old-a', '5'), ('hot', '9'), ('old-b', '3')]
+
+def test_export_filters_apply_to_both_tiers(app):
+    seed(app)
+    with app.app_context():
+        other = User(username='other', bot_type='gofai'); other.set_password('pw1234'); db.session.add(other); db.session.flush()
+        add_session(other.id, 'other-s', [(d(11, 8), 'user', 'o1')])
+        db.session.commit()
+    c = app.test_client(); login(c, 'admin', '123456')
+    assert [r[4] for r in export(c, '/admin/export_history', start='2026-01-11', end='2026-01-11')] == ['h1', 'b1', 'o1']
+    assert [r[4] for r in export(c, '/admin/export_history', user='student', start='2026-01-11')] == ['a2', 'h1', 'b1']
+    assert [r[4] for r in export(c, '/admin/export_history', session='old-a', gzip='1')] == ['a2', 'a1']
+    assert export(c, '/admin/export_history', user='nobody') == []
+
+def test_export_streams_in_chunks(app, monkeypatch):
+    seed(app)
+    monkeypatch.setattr(exports, 'CHUNK_ROWS', 2)
+    c = app.test_client(); login(c, 'admin', '123456')
+    r = c.get('/admin/export_history', buffered=False)
+    chunks = list(r.response)
+    r.close()
+    assert len(chunks) == 2  # (header + 2 dòng), 2 dòng
+    assert b''.join(chunks).decode('utf-8').count('\n') == 5
+    r = c.get('/admin/export_history?gzip=1')
+    assert r.mimetype == 'application/gzip' and r.headers['Content-Disposition'].endswith('data.csv.gz')
+    assert gzip.decompress(r.data) == b''.join(chunks)
@@ -0,0 +1,48 @@
+import time
+from app import db
+from app.models import User, Message, ChatSession, PurgeJob
+from .conftest import login
+
+def add_user(username, is_admin=False):
+    u = User(username=username, bot_type='gofai', is_admin=is_admin); u.set_password('pw1234')
+    db.session.add(u); db.session.flush()
+    db.session.add(Message(user_id=u.id, session_id=f's-{u.id}', sender='user', content='hi'))
+    db.session.add(ChatSession(id=f's-{u.id}', user_id=u.id, bot_type='gofai'))
+    return u.id
+
+def wait_job(c, job_id):
+    for _ in range(200):
+        job = c.get(f'/admin/api/purge/{job_id}').get_json()
+        if job['status'] in ('done', 'error'): return job
+        time.sleep(0.02)
+    raise AssertionError('purge chưa xong')
+
+def test_bulk_delete_skips_admins_and_their_rows(app):
+    with app.app_context():
+        student, admin2 = add_user('s2'), add_user('admin2', is_admin=True)
+        db.session.commit()
+    c = app.test_client(); login(c, 'admin', '123456')
+    r = c.post('/admin/delete_selected?format=json', data={'user_ids': [str(student), str(admin2)]})
+    assert r.status_code == 202 and r.get_json()['users_total'] == 1
+    assert wait_job(c, r.get_json()['id'])['status'] == 'done'
+    with app.app_context():
+        assert db.session.get(User, student) is None and Message.query.filter_by(user_id=student).count() == 0
+        assert db.session.get(User, admin2) is not None
+        assert Message.query.filter_by(user_id=admin2).count() == 1
+        assert ChatSession.query.filter_by(user_id=admin2).count() == 1
+
+def test_bulk_delete_of_only_admins_creates_no_job(app):
+    with app.app_context():
+        admin2 = add_user('admin2', is_admin=True); db.session.commit()
+    c = app.test_client(); login(c, 'admin', '123456')
+    c.post('/admin/delete_selected', data={'user_ids': [str(admin2)]})
+    with app.app_context():
+        assert PurgeJob.query.count() == 0 and db.session.get(User, admin2) is not None
+
+def test_single_delete_removes_admin_with_rows(app):
+    with app.app_context():
+        admin2 = add_user('admin2', is_admin=True); db.session.commit()
+    c = app.test_client(); login(c, 'admin', '123456')
+    c.get(f'/admin/delete/{admin2}')
+    with app.app_context():
+        assert db.session.get(User, admin2) is None and Message.query.filter_by(user_id=admin2).count() == 0
@@ -0,0 +1,40 @@
+import threading
+from app.models import Message
+from app.bench import StubAssistantClient
+from .conftest import login
+
+class CountingClient(StubAssistantClient):
+    def __init__(self, *a, **kw):
+        super().__init__(*a, **kw)
+        self.runs = 0
+        self.beta.threads.runs.create = self._counting_create
+
+    def _counting_create(self, **kw):
+        with self._lock: self.runs += 1
+        return self._create_run(**kw)
+
+def test_concurrent_identical_stream_questions_share_one_run(make_app):
+    stub = CountingClient(0.5)
+    app = make_app(CHAT_STREAM=True, GOFAI_CACHE=True, OPENAI_CLIENT=stub, ADMISSION_ENABLED=False)
+    bodies, barrier = [], threading.Barrier(5)
+
+    def ask():
+        c = app.test_client(); login(c)
+        barrier.wait()
+        r = c.post('/chatbot/gofai/stream', data={'user_input': 'Bài 1 làm sao?'})
+        bodies.append(r.get_data(as_text=True)); r.close()
+
+    threads = [threading.Thread(target=ask) for _ in range(5)]
+    [t.start() for t in threads]; [t.join() for t in threads]
+    assert stub.runs == 1
+    assert all('"response": "Câu trả lời mẫu."' in b and 'LOG_DATA' not in b for b in bodies)
+    with app.app_context():
+        assert Message.query.filter_by(sender='assistant').count() == 5
+
+def test_stream_and_sync_share_the_cache(make_app):
+    stub = CountingClient(0)
+    app = make_app(CHAT_STREAM=True, GOFAI_CACHE=True, OPENAI_CLIENT=stub)
+    c = app.test_client(); login(c)
+    r = c.post('/chatbot/gofai/stream', data={'user_input': 'Bài 2?'}); r.get_data(); r.close()
+    assert c.post('/chatbot/gofai', data={'user_input': 'bài 2?'}).get_json()['response'] == 'Câu trả lời mẫu.'
+    assert stub.runs == 1
@@ -0,0 +1,19 @@
+import pytest
+from sqlalchemy import text
+from app import create_app, db
+from app.models import User
+
+@pytest.mark.parametrize('uri', ['sqlite://', 'sqlite:///:memory:'])
+def test_in_memory_database_is_not_tuned(tmp_path, uri):
+    app = create_app({'SQLALCHEMY_DATABASE_URI': uri, 'TESTING': True, 'UPLOAD_FOLDER': str(tmp_path)})
+    assert 'pool_size' not in app.config.get('SQLALCHEMY_ENGINE_OPTIONS', {})
+    with app.app_context():
+        assert User.query.filter_by(username='admin').one().is_admin
+
+def test_file_database_uses_wal_and_pool(tmp_path):
+    app = create_app({'SQLALCHEMY_DATABASE_URI': f"sqlite:///{tmp_path / 'site.db'}", 'TESTING': True,
+                      'UPLOAD_FOLDER': str(tmp_path)})
+    assert app.config['SQLALCHEMY_ENGINE_OPTIONS']['pool_size'] == app.config['SQLITE_POOL_SIZE']
+    with app.app_context():
+        assert db.session.execute(text('PRAGMA journal_mode')).scalar() == 'wal'
+        db.session.remove(); db.engine.dispose()
@@ -0,0 +1,46 @@
+import threading
+from app import db, transcript
+from app.models import User, Message, VariableLog, ChatSession
+from .conftest import login
+
+def test_sync_turn_is_one_transaction(app, client):
+    commits = []
+    from sqlalchemy import event
+    with app.app_context():
+        event.listen(db.engine, 'commit', lambda conn: commits.append(1))
+    assert client.post('/chatbot/gofai', data={'user_input': 'Xin chào'}).status_code == 200
+    assert len(commits) == 1
+    with app.app_context():
+        u = User.query.filter_by(username='student').one()
+        assert Message.query.count() == 2 and VariableLog.query.count() == 2
+        cs = db.session.get(ChatSession, u.current_session_id)
+        assert cs.message_count == 2 and cs.thread_id == u.current_thread_id
+
+def test_batched_turns_from_many_users(make_app):
+    app = make_app(TRANSCRIPT_BATCH=True)
+    with app.app_context():
+        for i in range(8):
+            u = User(username=f's{i}', bot_type='gofai'); u.set_password('pw1234'); db.session.add(u)
+        db.session.commit()
+    codes = []
+    def chat(i):
+        c = app.test_client(); login(c, f's{i}')
+        codes.append(c.post('/chatbot/gofai', data={'user_input': f'câu {i}'}).status_code)
+    threads = [threading.Thread(target=chat, args=(i,)) for i in range(8)]
+    [t.start() for t in threads]; [t.join() for t in threads]
+    assert codes == [200] * 8
+    with app.app_context():
+        assert Message.query.count() == 16 and VariableLog.query.count() == 16
+    assert app.extensions['write_queue'].stats['errors'] == 0
+
+def test_batched_write_failure_reaches_the_request(make_app, monkeypatch):
+    # Lỗi ghi ở luồng ghi: request trả 500, không báo 200 cho câu trả lời chưa được lưu
+    def broken(*args): raise RuntimeError('disk full')
+    monkeypatch.setattr(transcript, 'record_variables', broken)
+    app = make_app(TRANSCRIPT_BATCH=True)
+    app.testing = False  # để errorhandler 500 của Flask chạy thay vì ném exception ra test
+    c = app.test_client(); login(c)
+    assert c.post('/chatbot/gofai', data={'user_input': 'Xin chào'}).status_code == 500
+    with app.app_context():
+        assert Message.query.count() == 0
+    assert app.extensions['write_queue'].stats['errors'] == 1
@@ -0,0 +1,16 @@
+import io, os, time, pytest
+from app import uploads
+
+def test_thumbnail_is_made_on_first_image(app, client):
+    Image = pytest.importorskip('PIL.Image')
+    buf = io.BytesIO(); Image.new('RGB', (1200, 800), 'red').save(buf, 'PNG'); buf.seek(0)
+    r = client.post('/chatbot/gofai', data={'user_input': 'ảnh', 'file': (buf, 'bai.png')}, content_type='multipart/form-data')
+    assert r.status_code == 200
+    name = next(f for d in os.listdir(app.config['UPLOAD_FOLDER']) if not d.startswith('.')
+                for f in os.listdir(os.path.join(app.config['UPLOAD_FOLDER'], d)) if f.endswith('.png'))
+    thumb = uploads.stored_path(app.config['UPLOAD_FOLDER'], name, thumb=True)
+    for _ in range(100):
+        if os.path.exists(thumb): break
+        time.sleep(0.02)
+    with Image.open(thumb) as im: assert max(im.size) <= uploads.THUMB_SIZE[0]
+    assert client.get(f'/uploads/{name}?thumb=1').status_code == 200
@@ -0,0 +1,22 @@
+from sqlalchemy import delete
+from app import db
+from app.models import User, Message, VariableLog
+from app.user_cache import user_cache
+from .conftest import login
+
+def test_deleted_user_cannot_write_from_stale_cache(make_app):
+    app = make_app()
+    c = app.test_client(); login(c)
+    c.get('/chatbot/gofai')  # bản chụp user nằm trong cache
+    with app.app_context():
+        uid = User.query.filter_by(username='student').one().id
+        # Worker khác xóa user: cache của process này không được báo
+        db.session.execute(delete(User).where(User.id == uid)); db.session.commit()
+    assert uid in user_cache.data
+
+    r = c.post('/chatbot/gofai', data={'user_input': 'Xin chào'})
+    assert r.status_code == 401
+    with app.app_context():
+        assert Message.query.count() == 0 and VariableLog.query.count() == 0
+    assert uid not in user_cache.data
+    assert c.get('/chatbot/gofai').status_code == 302  # đã bị đăng xuất
@@ -0,0 +1,48 @@
+import io
+from sqlalchemy import event, insert
+from app import db, user_import
+from app.models import User
+from app.user_import import import_users, parse_roster, existing_usernames
+from .conftest import login
+
+def by_line(report): return {r['line']: (r['username'], r['status'], r['reason']) for r in report}
+
+def test_parse_roster_reports_invalid_rows():
+    text = "username,password,type\nan,,ai\nthieu,cot\n,pw,gofai\n" + 'x' * 65 + ",pw,ai\n\n,,\nlop,10A,binh,pw9,coach\n"
+    rows, invalid = parse_roster(text)
+    assert rows == [{'line': 2, 'username': 'an', 'password': user_import.DEFAULT_PASSWORD, 'bot_type': 'ai'},
+                    {'line': 8, 'username': 'binh', 'password': 'pw9', 'bot_type': 'ai'}]
+    assert by_line(invalid) == {3: ('thieu', 'invalid', 'Thiếu cột'), 4: ('', 'invalid', 'Thiếu username'),
+                                5: ('x' * 64, 'invalid', 'Username quá dài')}
+
+def test_import_skips_duplicates_in_file_and_db(app):
+    c = app.test_client(); login(c, 'admin', '123456')
+    text = "username;password;type\nstudent;pw;ai\nmoi;pw;ai\nmoi;khac;gofai\nhai;;basic\nthieu\n"
+    r = c.post('/admin/upload_csv?format=json', data={'csv_file': (io.BytesIO(text.encode('utf-8')), 'roster.csv')},
+               content_type='multipart/form-data')
+    assert by_line(r.get_json()['report']) == {
+        2: ('student', 'skipped', 'Đã tồn tại'), 3: ('moi', 'created', ''), 4: ('moi', 'skipped', 'Trùng trong file'),
+        5: ('hai', 'created', ''), 6: ('thieu', 'invalid', 'Thiếu cột')}
+    with app.app_context():
+        moi = User.query.filter_by(username='moi').one()
+        assert moi.bot_type == 'ai' and moi.check_password('pw') and not moi.is_admin
+        assert User.query.filter_by(username='hai').one().check_password(user_import.DEFAULT_PASSWORD)
+        assert User.query.filter_by(username='student').one().bot_type == 'gofai'  # không bị ghi đè
+
+def test_existing_lookup_is_chunked(app, monkeypatch):
+    # > IN_CHUNK username: tra theo từng khối <= 900 tham số (giới hạn biến của SQLite)
+    monkeypatch.setattr(user_import, 'generate_password_hash', lambda p: 'h:' + p)
+    with app.app_context():
+        db.session.execute(insert(User), [{'username': f'u{i:04d}', 'password_hash': 'x', 'bot_type': 'gofai'} for i in range(0, 1900, 2)])
+        db.session.commit()
+        selects = []
+        listen = lambda conn, cur, stmt, params, ctx, many: selects.append(len(params)) if stmt.startswith('SELECT user.username') else None
+        event.listen(db.engine, 'before_cursor_execute', listen)
+        try:
+            assert existing_usernames(f'u{i:04d}' for i in range(1900)) == {f'u{i:04d}' for i in range(0, 1900, 2)}
+            report = import_users("username,password,type\n" + ''.join(f'u{i:04d},pw,ai\n' for i in range(1900)), workers=1)
+        finally: event.remove(db.engine, 'before_cursor_execute', listen)
+        assert selects == [900, 900, 100] * 2
+        assert sum(r['status'] == 'created' for r in report) == 950 and sum(r['status'] == 'skipped' for r in report) == 950
+        assert User.query.filter(User.username.like('u%')).count() == 1900
+        assert User.query.filter_by(username='u0001').one().password_hash == 'h:pw'
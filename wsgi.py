@@ -0,0 +1,7 @@
+from app import create_app
+from app.prefork import warm_app
+
+# Entry point production: gunicorn -c gunicorn.conf.py
+# (preload_app: chạy 1 lần ở master trước khi fork; run.py vẫn dùng cho chạy local)
+app = create_app()
+warm_app(app)